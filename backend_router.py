@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Выбор бэкенда перевода по задержке и надежности.
+
+Для каждого бэкенда считается экспоненциальное скользящее среднее задержки,
+95-й перцентиль по последним запросам и доля ошибок. В режиме "Авто" пакет
+отправляется самому быстрому здоровому бэкенду; при включенном хеджировании,
+если он не ответил за свой p95, тот же пакет уходит второму, и берется тот
+ответ, что пришел раньше.
+
+Недоступные бэкенды отсекает автоматический выключатель (circuit breaker):
+после нескольких ошибок подряд бэкенд на время исключается из работы,
+время исключения растет экспоненциально, а по его истечении один пробный
+запрос решает, вернуть ли бэкенд в строй.
+
+Бэкенды с ограничением частоты получают RateLimiter: запрос сверх бюджета
+не отправляется, а возвращается как отложенный (переводы None).
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from rate_limiter import RateLimiter
+
+# Псевдо-переводчик, при выборе которого бэкенд определяет маршрутизатор
+AUTO_BACKEND = "Авто"
+
+
+def is_error(translated):
+    """Строки ошибок бэкендов начинаются с '[Ошибка'"""
+    return translated is not None and translated.startswith("[Ошибка")
+
+
+def is_usable(translations):
+    """Пакет не отложен и переведен хотя бы частично"""
+    return translations is not None and not all(is_error(t) for t in translations)
+
+
+class CircuitBreaker:
+    """Автоматический выключатель бэкенда с экспоненциальной задержкой"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold=3, base_backoff=2.0, max_backoff=60.0):
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.state = self.CLOSED
+        self.failures = 0
+        self.backoff = base_backoff
+        self.open_until = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Можно ли отправить запрос; после паузы пропускает один пробный"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.time() >= self.open_until:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def release(self):
+        """Возвращает неиспользованное разрешение allow(): проба не состоялась"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+    def is_available(self):
+        """То же, что allow(), но без изменения состояния"""
+        with self._lock:
+            return self.state == self.CLOSED or (
+                self.state == self.OPEN and time.time() >= self.open_until)
+
+    def retry_at(self):
+        """Когда будет разрешен пробный запрос (None, если выключатель замкнут)"""
+        with self._lock:
+            return self.open_until if self.state == self.OPEN else None
+
+    def record_success(self):
+        """Успешный запрос замыкает выключатель; возвращает True при восстановлении"""
+        with self._lock:
+            recovered = self.state != self.CLOSED
+            self.state = self.CLOSED
+            self.failures = 0
+            self.backoff = self.base_backoff
+            return recovered
+
+    def record_failure(self):
+        """Ошибка; при превышении порога или неудачной пробе размыкает выключатель
+
+        Возвращает паузу до пробного запроса, если выключатель разомкнулся, иначе None.
+        """
+        with self._lock:
+            self.failures += 1
+            if self.state != self.HALF_OPEN and self.failures < self.failure_threshold:
+                return None
+            pause = self.backoff
+            self.state = self.OPEN
+            self.open_until = time.time() + pause
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+            return pause
+
+
+class BackendStats:
+    """Статистика задержек и ошибок одного бэкенда"""
+
+    def __init__(self, alpha=0.2, window=100):
+        self.alpha = alpha
+        self.ewma_latency = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self._latencies = deque(maxlen=window)
+        self._inflight = {}  # номер запроса -> время начала
+        self._next_request = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Отмечает начало запроса; возвращает его номер для finish()"""
+        with self._lock:
+            self._next_request += 1
+            self._inflight[self._next_request] = time.time()
+            return self._next_request
+
+    def finish(self, request_id, ok):
+        """Учитывает завершение запроса, начатого через start()"""
+        with self._lock:
+            started = self._inflight.pop(request_id, None)
+        if started is not None:
+            self.record(time.time() - started, ok)
+
+    def effective_latency(self):
+        """Задержка для ранжирования: зависший запрос делает бэкенд медленнее"""
+        with self._lock:
+            latency = self.ewma_latency or 0.0
+            if self._inflight:
+                latency = max(latency, time.time() - min(self._inflight.values()))
+        return latency
+
+    def record(self, latency, ok):
+        """Учитывает завершившийся запрос"""
+        with self._lock:
+            self.requests += 1
+            self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+            if not ok:
+                # Время до ошибки (часто таймаут) не говорит о скорости перевода
+                return
+            self._latencies.append(latency)
+            if self.ewma_latency is None:
+                self.ewma_latency = latency
+            else:
+                self.ewma_latency += self.alpha * (latency - self.ewma_latency)
+
+    def p95(self):
+        """95-й перцентиль задержки по последним удачным запросам"""
+        with self._lock:
+            if not self._latencies:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def snapshot(self):
+        """Текущие значения для отладки и интерфейса"""
+        return {
+            'ewma_latency': self.ewma_latency,
+            'p95': self.p95(),
+            'error_rate': self.error_rate,
+            'requests': self.requests,
+        }
+
+
+class BackendRouter:
+    """Маршрутизация пакетов между бэкендами с хеджированием"""
+
+    def __init__(self, backends, hedging=True, default_hedge_delay=2.0,
+                 min_hedge_delay=0.2, max_error_rate=0.5, failover=True,
+                 latency_tolerance=0.25):
+        self.backends = backends
+        self.stats = {name: BackendStats() for name in backends}
+        self.breakers = {name: CircuitBreaker() for name in backends}
+        self.limiters = {name: RateLimiter.for_backend(backend)
+                         for name, backend in backends.items()}
+        # Сколько запрос с экрана может ждать бюджета, прежде чем его отложат
+        # (None - ждать без ограничения и никогда не откладывать)
+        self.max_admission_wait = 0.5
+        # Фоновые запросы (повторы, отложенные блоки) могут ждать дольше
+        self.max_background_wait = 5.0
+        # Переходить ли на другой бэкенд, если выбранный недоступен
+        self.failover = failover
+        self._state_listeners = []
+        # Отправлять ли пакет второму бэкенду, если первый задерживается
+        self.hedging = hedging
+        # Задержка хеджирования, пока у бэкенда мало статистики
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        # Бэкенды с большей долей ошибок считаются нездоровыми
+        self.max_error_rate = max_error_rate
+        # Бэкенды, чьи задержки отличаются меньше, считаются одинаково быстрыми:
+        # из них выбирается более дешевый (cost_per_1k_chars)
+        self.latency_tolerance = latency_tolerance
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+
+    def add_state_listener(self, listener):
+        """Регистрирует listener(name, state), вызываемый при отключении и восстановлении бэкенда"""
+        self._state_listeners.append(listener)
+
+    def _notify_state(self, name, state):
+        for listener in self._state_listeners:
+            listener(name, state)
+
+    def is_available(self, name):
+        """Не отключен ли бэкенд выключателем"""
+        return self.breakers[name].is_available()
+
+    def next_retry_at(self):
+        """Ближайшее время, когда отключенный бэкенд можно будет проверить"""
+        times = [t for t in (b.retry_at() for b in self.breakers.values()) if t is not None]
+        return min(times) if times else None
+
+    def call(self, name, call, size, chars=0, background=False):
+        """Выполняет пакет на заданном бэкенде, при его отказе - на другом
+
+        Возвращает (имя бэкенда, переводы); переводы None, если пакет отложен
+        из-за ограничения частоты.
+        """
+        result = self._timed_call(name, call, size, chars, background)
+        if not self.failover or is_usable(result[1]):
+            return result
+        for alternative in self.rank():
+            if alternative == name or not self.is_available(alternative):
+                continue
+            print(f"[DEBUG] {name} недоступен, переключаемся на {alternative}")
+            alternative_result = self._timed_call(alternative, call, size, chars, background)
+            if is_usable(alternative_result[1]):
+                return alternative_result
+        return result
+
+    def rank(self):
+        """Бэкенды от лучшего к худшему: сначала здоровые, затем по задержке и цене"""
+        def score(name):
+            stats = self.stats[name]
+            unhealthy = (stats.error_rate > self.max_error_rate
+                         or not self.breakers[name].is_available())
+            # Бэкенд без статистики пробуем раньше медленных, чтобы узнать его скорость
+            latency = stats.effective_latency()
+            speed = int(latency / self.latency_tolerance) if self.latency_tolerance else latency
+            return (unhealthy, speed, self.backends[name].cost_per_1k_chars, latency)
+        return sorted(self.backends, key=score)
+
+    def hedge_delay(self, name):
+        """Сколько ждать ответа бэкенда перед хеджированием"""
+        p95 = self.stats[name].p95()
+        if p95 is None or self.stats[name].requests < 5:
+            return self.default_hedge_delay
+        return max(self.min_hedge_delay, p95)
+
+    def _timed_call(self, name, call, size, chars=0, background=False):
+        """Выполняет call(backend) и записывает задержку и исход"""
+        breaker = self.breakers[name]
+        if not breaker.allow():
+            # Не ждем таймаута от бэкенда, который заведомо не отвечает
+            # и не тратим на него бюджет запросов
+            return name, [f"[Ошибка: {name} временно недоступен]"] * size
+
+        limiter = self.limiters[name]
+        if limiter is not None:
+            max_wait = self.max_background_wait if background else self.max_admission_wait
+            if not limiter.acquire(chars, max_wait, background):
+                print(f"[DEBUG] {name}: бюджет запросов исчерпан, пакет отложен")
+                breaker.release()
+                return name, None
+
+        request_id = self.stats[name].start()
+        ok = False
+        try:
+            translations = call(self.backends[name])
+            ok = not all(is_error(t) for t in translations)
+            return name, translations
+        finally:
+            self.stats[name].finish(request_id, ok)
+            if not ok:
+                pause = breaker.record_failure()
+                if pause is not None:
+                    print(f"[DEBUG] Бэкенд {name} отключен на {pause:.1f}с")
+                    self._notify_state(name, CircuitBreaker.OPEN)
+            elif breaker.record_success():
+                print(f"[DEBUG] Бэкенд {name} снова доступен")
+                self._notify_state(name, CircuitBreaker.CLOSED)
+
+    def run(self, call, size, primary_call=None, chars=0, background=False):
+        """Выполняет пакет на лучшем бэкенде, при задержке - и на втором
+
+        call(backend) возвращает список из size переводов; primary_call, если
+        задан, используется для основного бэкенда (например, с частичными
+        переводами). Возвращает (имя бэкенда, переводы), как call().
+        """
+        request = (size, chars, background)
+        ranked = self.rank()
+        primary = ranked[0]
+        secondary = ranked[1] if len(ranked) > 1 else None
+
+        first = self._executor.submit(self._timed_call, primary, primary_call or call, *request)
+        if not self.hedging or secondary is None:
+            return first.result()
+
+        done, _ = wait([first], timeout=self.hedge_delay(primary))
+        if done:
+            name, translations = first.result()
+            if is_usable(translations):
+                return name, translations
+            # Основной бэкенд ответил ошибкой или отложил пакет - сразу пробуем второй
+            return self._timed_call(secondary, call, *request)
+
+        print(f"[DEBUG] {primary} не ответил за {self.hedge_delay(primary):.1f}с, "
+              f"дублируем пакет в {secondary}")
+        second = self._executor.submit(self._timed_call, secondary, call, *request)
+        pending = {first, second}
+        result = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, translations = future.result()
+                if is_usable(translations):
+                    # Проигравший запрос доработает в фоне и обновит статистику
+                    return name, translations
+                result = (name, translations)
+        return result
+
+    def snapshot(self):
+        """Статистика всех бэкендов"""
+        snapshot = {name: stats.snapshot() for name, stats in self.stats.items()}
+        for name, breaker in self.breakers.items():
+            snapshot[name]['breaker'] = breaker.state
+        return snapshot
+
+    def shutdown(self):
+        """Останавливает пул хеджирования"""
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Пакетный перевод скриншотов без графического интерфейса.
+
+Распознает текст на изображениях из файлов, каталогов и шаблонов glob и
+переводит его теми же движками, что и приложение, с тем же кэшем
+переводов. Результат - JSON Lines: одна строка на изображение с блоками
+текста, их координатами и переводами. Так можно заранее перевести набор
+скриншотов и прогреть общий кэш.
+
+    python3 batch_translate.py screenshots/ "shots/*.png" -o result.jsonl
+
+OCR идет в пуле процессов, перевод - пакетами по несколько изображений.
+"""
+
+import argparse
+import contextlib
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image
+
+from backend_router import AUTO_BACKEND, is_error
+from ocr_engine import OCREngine
+from text_filter import TextFilter
+from translation_backends import available_backends
+from translation_engine import TranslationEngine
+
+DB_PATH = os.path.join(os.path.dirname(__file__), "cache", "overlay_translator_cache.sqlite")
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+
+# Движок OCR процесса пула
+_ocr_engine = None
+
+
+def find_images(inputs, recursive=False):
+    """Файлы изображений из путей, каталогов и шаблонов glob, без повторов"""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, '**', '*') if recursive else os.path.join(item, '*')
+            candidates = glob.glob(pattern, recursive=recursive)
+        elif glob.has_magic(item):
+            candidates = glob.glob(item, recursive=True)
+        else:
+            candidates = [item]
+        paths.extend(sorted(path for path in candidates
+                            if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS)))
+    return list(dict.fromkeys(paths))
+
+
+def _init_worker():
+    global _ocr_engine
+    _ocr_engine = OCREngine()
+
+
+def _recognize(path, lang):
+    """Распознает одно изображение в процессе пула: (путь, блоки, ошибка)"""
+    # Отладочный вывод OCR не должен попасть в JSON Lines на stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            with Image.open(path) as image:
+                image.load()
+                blocks = _ocr_engine.recognize_text_with_positions(lang=lang, image=image)
+        except Exception as e:
+            return path, [], str(e)
+    return path, blocks, None
+
+
+def translate_results(engine, text_filter, results, translator):
+    """Переводит блоки нескольких изображений одним вызовом движка"""
+    filtered = [(path, text_filter.filter_blocks(blocks), error) for path, blocks, error in results]
+    all_blocks = [block for _, blocks, _ in filtered for block in blocks]
+    translated = iter(engine.translate_text_blocks(all_blocks, translator) if all_blocks else [])
+    records = []
+    for path, blocks, error in filtered:
+        record = {'image': path, 'translator': translator,
+                  'blocks': [next(translated) for _ in blocks]}
+        failed = sum(not block.get('translated_text') or is_error(block['translated_text'])
+                     for block in record['blocks'])
+        if failed and not error:
+            error = f"не переведено блоков: {failed}"
+        if error:
+            record['error'] = error
+        records.append(record)
+    return records
+
+
+def run(paths, output, translator, lang, workers, batch_images, db_path):
+    """Распознает и переводит изображения, записывая результат в output"""
+    text_filter = TextFilter.from_user_config()
+    done = failed = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        # Процессы OCR создаются до движка перевода: они не должны унаследовать
+        # его потоки и открытое соединение с SQLite
+        futures = [pool.submit(_recognize, path, lang) for path in paths]
+        engine = TranslationEngine(db_path)
+        # Офлайн результат важнее скорости: ждем бюджет запросов, а не откладываем блоки
+        engine.router.max_admission_wait = None
+        try:
+            pending = []
+            for future in as_completed(futures):
+                pending.append(future.result())
+                if len(pending) < batch_images and done + len(pending) < len(paths):
+                    continue
+                for record in translate_results(engine, text_filter, pending, translator):
+                    output.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    failed += 'error' in record
+                output.flush()
+                done += len(pending)
+                pending = []
+                print(f"[DEBUG] Обработано изображений: {done}/{len(paths)}")
+        finally:
+            engine.close()
+    return done, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Распознает и переводит текст на скриншотах, результат - JSON Lines")
+    parser.add_argument('inputs', nargs='+', help="файлы, каталоги или шаблоны glob")
+    parser.add_argument('-o', '--output', help="файл результата (по умолчанию stdout)")
+    parser.add_argument('-t', '--translator', default="Google",
+                        choices=available_backends() + [AUTO_BACKEND])
+    parser.add_argument('--lang', default='rus+eng', help="языки tesseract")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(),
+                        help="процессов OCR")
+    parser.add_argument('--batch-images', type=int, default=8,
+                        help="сколько изображений переводить одним пакетом")
+    parser.add_argument('-r', '--recursive', action='store_true', help="обходить подкаталоги")
+    parser.add_argument('--db', default=DB_PATH, help="файл кэша переводов")
+    args = parser.parse_args(argv)
+
+    paths = find_images(args.inputs, args.recursive)
+    if not paths:
+        print("[Ошибка пакетного перевода]: изображения не найдены", file=sys.stderr)
+        return 1
+
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        # stdout занят результатом, отладочный вывод движков уходит в stderr
+        with contextlib.redirect_stdout(sys.stderr):
+            done, failed = run(paths, output, args.translator, args.lang,
+                               args.workers, args.batch_images, args.db)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(f"Готово: {done} изображений, с ошибками: {failed}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -17,21 +17,29 @@ Overlay Translator - Утилита для автоматического пер
 import gi
 import os
 import subprocess
-import threading
 import signal
 import sys
+import time
 
 # Указываем версию Gtk до импорта
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, GLib, Gdk
 
 # Импортируем наши модули
-from ocr_engine import OCREngine
+from ocr_engine import OCREngine, image_signature, signature_change
 from translation_engine import TranslationEngine
-from overlay_manager import OverlayManager
+from translation_backends import available_backends
+from backend_router import AUTO_BACKEND
+from pipeline import Frame, Pipeline
+from translation_session import TranslationSession
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "cache", "overlay_translator_cache.sqlite")
-TRANSLATOR_OPTIONS = ["Ollama", "Google"]
+# "Авто" выбирает самый быстрый здоровый бэкенд для каждого пакета
+TRANSLATOR_OPTIONS = available_backends() + [AUTO_BACKEND]
+DEFAULT_TRANSLATOR = "Google"
+# Новый кадр отменяет обработку старого, если изображение изменилось сильнее
+# (средняя разница яркости на уменьшенной копии, доля от 255)
+FRAME_CHANGE_THRESHOLD = 0.01
 
 class TranslatorApp(Gtk.Window):
     def __init__(self):
@@ -40,18 +48,33 @@ class TranslatorApp(Gtk.Window):
         self.set_border_width(10)
         self.set_resizable(True)  # Разрешаем изменение размера
 
-        self.window_id = None
-        self.window_title = None
+        # Переводимые окна: id окна -> сеанс перевода
+        self.sessions = {}
+        # Положение окна переводчика на экране (x, y, w, h) для фильтра надписей
+        self.control_rect = None
         self.translation_enabled = True
         self.compact_mode = False  # Флаг для компактного режима
         
         # Инициализируем модули
         self.ocr_engine = OCREngine()
         self.translation_engine = TranslationEngine(DB_PATH)
-        self.overlay_manager = OverlayManager()
-        
-        # Устанавливаем начальную прозрачность
-        self.overlay_manager.set_opacity(80)
+        # Настройки overlay, общие для всех окон
+        self.overlay_opacity = 80
+        # Изначально включаем режим невидимости для скриншотов
+        self.screenshot_invisible = True
+        # Захват, OCR и перевод идут в своих потоках, отрисовка - в главном.
+        # Новый кадр отменяет старые, только когда сам прошел OCR
+        self.pipeline = Pipeline(
+            [("capture", self._capture_stage),
+             ("ocr", self._ocr_stage),
+             ("translate", self._translate_stage)],
+            render=self._render_frame,
+            schedule=GLib.idle_add,
+            on_error=self._on_pipeline_error,
+            supersedes=self._frame_supersedes,
+            supersede_after=1,
+            on_discard=self._on_frame_discarded)
+        self.pipeline.start()
 
         # UI Elements
         grid = Gtk.Grid(column_spacing=10, row_spacing=10)
@@ -60,6 +83,10 @@ class TranslatorApp(Gtk.Window):
         self.select_window_btn.connect("clicked", self.on_select_window)
         self.select_window_btn.set_size_request(150, 35)
 
+        # Еще одно окно к уже переводимым
+        self.add_window_btn = Gtk.Button(label="Добавить окно")
+        self.add_window_btn.connect("clicked", self.on_add_window)
+
         self.update_btn = Gtk.Button(label="Обновить перевод")
         self.update_btn.connect("clicked", self.on_manual_update)
         self.update_btn.set_size_request(150, 35)
@@ -100,11 +127,23 @@ class TranslatorApp(Gtk.Window):
         adjustment = Gtk.Adjustment(value=2, lower=1, upper=60, step_increment=1, page_increment=5, page_size=0)
         self.interval_spin = Gtk.SpinButton(adjustment=adjustment)
         self.interval_spin.set_numeric(True)
+        self.interval_spin.connect("value-changed", self.on_interval_changed)
+
+        # Потолок адаптивного интервала: столько ждем, пока окно не меняется
+        max_adjustment = Gtk.Adjustment(value=30, lower=1, upper=300, step_increment=1, page_increment=10, page_size=0)
+        self.max_interval_spin = Gtk.SpinButton(adjustment=max_adjustment)
+        self.max_interval_spin.set_numeric(True)
+        self.max_interval_spin.connect("value-changed", self.on_interval_changed)
+
+        self.adaptive_checkbox = Gtk.CheckButton(label="Адаптивный интервал")
+        self.adaptive_checkbox.set_active(True)
+        self.adaptive_checkbox.connect("toggled", self.on_interval_changed)
 
         self.translator_combo = Gtk.ComboBoxText()
         for t in TRANSLATOR_OPTIONS:
             self.translator_combo.append_text(t)
-        self.translator_combo.set_active(1)  # Google Translate по умолчанию
+        self.translator_combo.set_active(TRANSLATOR_OPTIONS.index(DEFAULT_TRANSLATOR))
+        self.translator_combo.connect("changed", self.on_translator_changed)
 
         self.status_label = Gtk.Label(label="Ожидание...")
         self.window_label = Gtk.Label(label="Окно не выбрано")
@@ -136,7 +175,10 @@ class TranslatorApp(Gtk.Window):
         self.translation_scroll.add(translation_text_view)
 
         # Размещаем элементы в сетке
-        grid.attach(self.select_window_btn, 0, 0, 1, 1)
+        window_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        window_box.pack_start(self.select_window_btn, True, True, 0)
+        window_box.pack_start(self.add_window_btn, False, False, 0)
+        grid.attach(window_box, 0, 0, 1, 1)
         grid.attach(self.update_btn, 1, 0, 1, 1)
         grid.attach(self.start_btn, 0, 1, 1, 1)
         grid.attach(self.stop_btn, 1, 1, 1, 1)
@@ -144,7 +186,11 @@ class TranslatorApp(Gtk.Window):
         # Интервал
         interval_label = Gtk.Label(label="Интервал (сек):")
         grid.attach(interval_label, 0, 2, 1, 1)
-        grid.attach(self.interval_spin, 1, 2, 1, 1)
+        interval_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        interval_box.pack_start(self.interval_spin, True, True, 0)
+        interval_box.pack_start(Gtk.Label(label="до"), False, False, 0)
+        interval_box.pack_start(self.max_interval_spin, True, True, 0)
+        grid.attach(interval_box, 1, 2, 1, 1)
 
         # Переводчик
         translator_label = Gtk.Label(label="Переводчик:")
@@ -152,7 +198,8 @@ class TranslatorApp(Gtk.Window):
         grid.attach(self.translator_combo, 1, 3, 1, 1)
 
         # Компактный вид
-        grid.attach(self.compact_checkbox, 0, 4, 2, 1)
+        grid.attach(self.compact_checkbox, 0, 4, 1, 1)
+        grid.attach(self.adaptive_checkbox, 1, 4, 1, 1)
 
         # Прозрачность
         grid.attach(self.opacity_label, 0, 5, 1, 1)
@@ -196,13 +243,14 @@ class TranslatorApp(Gtk.Window):
         self.connect("delete-event", Gtk.main_quit)
         self.connect("key-press-event", self.on_key_press)
         self.connect("button-press-event", self.on_button_press)
+        self.connect("configure-event", self.on_configure)
 
         # Обработчики сигналов для корректного завершения
         signal.signal(signal.SIGINT, self.signal_handler)
         signal.signal(signal.SIGTERM, self.signal_handler)
 
-        # Запускаем периодическое обновление
-        self.periodic_update()
+        # Периодическое обновление запускается для каждого выбранного окна
+        self.on_interval_changed()
 
         # Показываем все элементы
         self.show_all()
@@ -210,8 +258,6 @@ class TranslatorApp(Gtk.Window):
         # Инициализируем состояние кнопок overlay
         self.show_overlay_btn.set_sensitive(False)  # Изначально overlay видны
         
-        # Изначально включаем режим невидимости для скриншотов
-        self.overlay_manager.set_screenshot_invisible(True)
         self.invisible_btn.set_label("Overlay невидимы для скриншотов: ВКЛ")
 
     def on_toggle_compact_mode(self, checkbox):
@@ -235,105 +281,275 @@ class TranslatorApp(Gtk.Window):
 
     def on_opacity_changed(self, scale):
         """Обработчик изменения прозрачности overlay"""
-        opacity = scale.get_value()
-        self.overlay_manager.set_opacity(int(opacity))
+        self.overlay_opacity = int(scale.get_value())
+        for session in self.sessions.values():
+            session.overlay_manager.set_opacity(self.overlay_opacity)
 
     def on_select_window(self, button):
+        """Выбирает окно для перевода вместо всех текущих"""
+        self._pick_window(replace=True)
+
+    def on_add_window(self, button):
+        """Добавляет окно к уже переводимым"""
+        self._pick_window(replace=False)
+
+    def _pick_window(self, replace):
         self.status_label.set_text("Выбор окна: кликните на окно...")
         try:
             # Используем subprocess вместо os.system для лучшего контроля
             result = subprocess.run(["xdotool", "selectwindow"], 
                                   capture_output=True, text=True, check=True)
-            self.window_id = result.stdout.strip()
+            window_id = result.stdout.strip()
             
-            if not self.window_id:
+            if not window_id:
                 self.status_label.set_text("Ошибка: не удалось получить ID окна")
                 return
 
-            try:
-                output = subprocess.check_output(["xprop", "-id", self.window_id, "WM_NAME"], text=True)
-                self.window_title = output.strip().split('=')[1].strip().strip('"')
-            except Exception as e:
-                self.window_title = f"Не удалось получить заголовок: {e}"
-
+            if replace:
+                for session in list(self.sessions.values()):
+                    self._remove_session(session)
+            if window_id not in self.sessions:
+                self._add_session(window_id)
             self.status_label.set_text("Окно выбрано")
-            self.window_label.set_text(f"Окно: {self.window_title}")
         except subprocess.CalledProcessError as e:
             self.status_label.set_text(f"Ошибка выбора окна: {e}")
         except Exception as e:
             self.status_label.set_text(f"Неожиданная ошибка: {e}")
 
+    def _add_session(self, window_id):
+        """Начинает переводить окно"""
+        session = TranslationSession(window_id, on_window_event=self._on_window_event)
+        session.overlay_manager.set_opacity(self.overlay_opacity)
+        session.overlay_manager.set_screenshot_invisible(self.screenshot_invisible)
+        session.scheduler.set_bounds(self.interval_spin.get_value(),
+                                     self.max_interval_spin.get_value())
+        self.sessions[window_id] = session.start()
+        self._update_window_label()
+        # Новое окно: начинаем с минимального интервала
+        self._schedule_update(session)
+        return session
+
+    def _remove_session(self, session):
+        """Прекращает переводить окно"""
+        if self.sessions.get(session.window_id) is not session:
+            return
+        del self.sessions[session.window_id]
+        if session.update_timer is not None:
+            GLib.source_remove(session.update_timer)
+            session.update_timer = None
+        self.pipeline.cancel_all(session.window_id)
+        self.ocr_engine.release_window(session.window_id)
+        self.translation_engine.forget_overlay(session.window_id)
+        session.close()
+        self._update_window_label()
+
+    def _update_window_label(self):
+        titles = [session.title for session in self.sessions.values()]
+        if not titles:
+            self.window_label.set_text("Окно не выбрано")
+        elif len(titles) == 1:
+            self.window_label.set_text(f"Окно: {titles[0]}")
+        else:
+            self.window_label.set_text(f"Окна ({len(titles)}): " + "; ".join(titles))
+
+    def _on_window_event(self, session, what):
+        """Событие окна (поток трекера): обрабатываем в главном потоке"""
+        if what == 'geometry':
+            # Overlay едут за окном сразу, без OCR и перевода
+            geometry = session.tracker.geometry
+            if geometry:
+                session.overlay_manager.queue_window_move(geometry[0], geometry[1])
+            return
+        GLib.idle_add(self._handle_window_event, session, what)
+
+    def _handle_window_event(self, session, what):
+        if self.sessions.get(session.window_id) is not session:
+            return False
+        if what == 'destroyed':
+            self._on_window_closed(session)
+        elif what == 'visibility':
+            if session.tracker.is_visible():
+                self._resume_translation(session)
+            else:
+                self._pause_translation(session)
+        elif what == 'title':
+            session.title = session.tracker.title
+            self._update_window_label()
+        return False
+
+    def _pause_translation(self, session):
+        """Окно свернуто или скрыто: обработка его кадров останавливается"""
+        self.pipeline.cancel_all(session.window_id)
+        session.overlay_manager.suspend()
+        self.status_label.set_text("Окно скрыто, перевод приостановлен")
+
+    def _resume_translation(self, session):
+        """Окно снова видно: сразу захватываем его, не дожидаясь тика"""
+        session.overlay_manager.resume()
+        self.status_label.set_text("Окно снова видно")
+        if self.translation_enabled:
+            session.scheduler.reset()
+            self.request_translation(session)
+            self._schedule_update(session)
+
+    def _on_window_closed(self, session):
+        """Переводимое окно больше не существует"""
+        self._remove_session(session)
+        self.status_label.set_text("Выбранное окно закрыто")
+
+    def _window_geometry(self, frame):
+        """Геометрия окна из трекера (без запуска xdotool)"""
+        return frame.session.tracker.geometry or self.ocr_engine.get_window_geometry(frame.window_id)
+
     def on_manual_update(self, button):
         # Принудительно очищаем кэш при ручном обновлении
         self.ocr_engine.clear_cache()
-        thread = threading.Thread(target=self.perform_translation, daemon=True)
-        thread.start()
-
-    def perform_translation(self):
-        if not self.window_id:
-            GLib.idle_add(self.status_label.set_text, "Окно не выбрано")
-            return
-
-        print(f"[DEBUG] Начинаем перевод для окна: {self.window_id}")
+        for session in self.sessions.values():
+            session.clear_cache()
+            session.scheduler.reset()
+        self.request_translation()
+
+    def _chrome_rects(self, frame):
+        """Окно переводчика в координатах захвата окна frame
+
+        Только в этой области его надписи ("Старт", "Интервал"...) считаются
+        своими; такие же надписи переводимой программы переводятся.
+        """
+        geometry = self._window_geometry(frame)
+        if self.control_rect is None or not geometry:
+            return ()
+        x, y, w, h = self.control_rect
+        return ((x - geometry[0], y - geometry[1], w, h),)
+
+    def _capture_stage(self, frame):
+        """Этап конвейера: захват окна"""
         GLib.idle_add(self.status_label.set_text, "Захват изображения и OCR...")
-        
-        try:
-            # Захватываем изображение окна
-            if not self.ocr_engine.capture_window(self.window_id):
-                GLib.idle_add(self.status_label.set_text, "Ошибка захвата окна")
-                return
-            
-            # Проверяем, изменилось ли изображение (порог 5% изменений)
-            cached_translated_blocks = self.ocr_engine.get_cached_translated_blocks()
-            
-            if cached_translated_blocks:
-                # Используем кэшированные переводы
-                print("[DEBUG] Используем кэшированные переводы")
-                translated_blocks = cached_translated_blocks
-                text_blocks = self.ocr_engine.last_ocr_result
-                GLib.idle_add(self.status_label.set_text, f"Используем кэш: {len(translated_blocks)} блоков")
-            else:
-                # Распознаем текст с координатами
-                text_blocks = self.ocr_engine.recognize_text_with_positions()
-                if not text_blocks:
-                    GLib.idle_add(self.status_label.set_text, "Текст не распознан")
-                    return
-                    
-                GLib.idle_add(self.status_label.set_text, f"Распознано {len(text_blocks)} блоков, перевод...")
-                
-                # Переводим каждый текстовый блок
-                translator = self.translator_combo.get_active_text()
-                translated_blocks = self.translation_engine.translate_text_blocks(text_blocks, translator)
-                
-                if not translated_blocks:
-                    GLib.idle_add(self.status_label.set_text, "Ошибка перевода")
-                    return
-                
-                # Кэшируем результат
-                self.ocr_engine.cache_translated_blocks(translated_blocks)
-                
-                # Обновляем статус
-                short_text = f"Переведено {len(translated_blocks)} блоков"
-                GLib.idle_add(self.status_label.set_text, short_text)
-                
-                # Обновляем буферы только в расширенном режиме
-                if not self.compact_mode:
-                    # Показываем оригинальный текст
-                    original_text = '\n'.join([block['text'] for block in text_blocks])
-                    translated_text = '\n'.join([block.get('translated_text', '') for block in translated_blocks])
-                    GLib.idle_add(self.ocr_buffer.set_text, original_text)
-                    GLib.idle_add(self.translation_buffer.set_text, translated_text)
-            
-            # Показываем множественные overlay (в любом случае)
-            x, y, w, h = self.ocr_engine.get_window_geometry(self.window_id)
-            GLib.idle_add(self.overlay_manager.show_multiple_overlays, translated_blocks, x, y, self.compact_mode)
-            
-            # Очищаем временные файлы
-            self.ocr_engine.cleanup()
-            
-        except Exception as e:
-            print("[Ошибка OCR]:", e)
-            GLib.idle_add(self.status_label.set_text, f"Ошибка OCR: {e}")
+        frame.image = self.ocr_engine.capture_image(frame.window_id)
+        if frame.image is None:
+            GLib.idle_add(self.status_label.set_text, "Ошибка захвата окна")
+            return None
+        frame.signature = image_signature(frame.image)
+        self._record_change(frame)
+
+        # Проверяем, изменилось ли изображение
+        cached_translated_blocks = frame.session.cached_blocks(frame.signature, FRAME_CHANGE_THRESHOLD)
+        if cached_translated_blocks:
+            print("[DEBUG] Используем кэшированные переводы")
+            frame.translated_blocks = cached_translated_blocks
+        return frame
+
+    def _ocr_stage(self, frame):
+        """Этап конвейера: распознавание текста с координатами"""
+        if frame.translated_blocks is not None:
+            return frame
+
+        text_blocks = self.ocr_engine.recognize_text_with_positions(
+            image=frame.image, cancelled=frame.is_cancelled)
+        if frame.is_cancelled():
+            return None
+        # Надписи окна переводчика и наш overlay отбрасываем до перевода
+        text_blocks = self.translation_engine.filter_text_blocks(
+            text_blocks, frame.window_id, self._chrome_rects(frame))
+        if not text_blocks:
+            frame.session.scheduler.record_latency(time.time() - frame.created)
+            GLib.idle_add(self.status_label.set_text, "Текст не распознан")
+            return None
+        frame.text_blocks = text_blocks
+        return frame
+
+    def _translate_stage(self, frame):
+        """Этап конвейера: перевод блоков"""
+        frame.geometry = self._window_geometry(frame)
+        overlay_manager = frame.session.overlay_manager
+        if frame.translated_blocks is not None:
+            GLib.idle_add(self.status_label.set_text,
+                          f"Используем кэш: {len(frame.translated_blocks)} блоков")
+            return frame
+
+        text_blocks = frame.text_blocks
+        GLib.idle_add(self.status_label.set_text, f"Распознано {len(text_blocks)} блоков, перевод...")
+
+        # Частичные переводы показываем сразу по мере генерации
+        x, y, w, h = frame.geometry
+        frame.progressive = overlay_manager.begin_progressive_update(
+            text_blocks, x, y, self.compact_mode)
+
+        def on_partial(index, text):
+            # Частичные переводы отмененного кадра уже не показываем
+            if not frame.is_cancelled():
+                overlay_manager.queue_partial_translation(index, text, frame.progressive)
+
+        # Переводим каждый текстовый блок
+        translator = self.translator_combo.get_active_text()
+        translated_blocks = self.translation_engine.translate_text_blocks(
+            text_blocks, translator, on_partial, cancelled=frame.is_cancelled)
+
+        if frame.is_cancelled():
+            # Полученные переводы уже в кэше и пригодятся новому кадру
+            GLib.idle_add(overlay_manager.end_progressive_update, frame.progressive)
+            return None
+
+        if not translated_blocks:
+            GLib.idle_add(overlay_manager.end_progressive_update, frame.progressive)
+            GLib.idle_add(self.status_label.set_text, "Ошибка перевода")
+            return None
+
+        # Кэшируем результат (кадр с непереведенными блоками переведется заново)
+        frame.session.cache_blocks(translated_blocks, frame.signature)
+        # Наш overlay может попасть в следующий захват окна - его не переводим
+        self.translation_engine.set_overlay_blocks(translated_blocks, frame.window_id)
+        frame.translated_blocks = translated_blocks
+
+        # Обновляем статус
+        hit_rate = self.translation_engine.get_cache_stats()['hit_rate']
+        short_text = f"Переведено {len(translated_blocks)} блоков (кэш: {hit_rate:.0%})"
+        GLib.idle_add(self.status_label.set_text, short_text)
+
+        # Обновляем буферы только в расширенном режиме
+        if not self.compact_mode:
+            # Показываем оригинальный текст
+            original_text = '\n'.join([block['text'] for block in text_blocks])
+            translated_text = '\n'.join([block.get('translated_text', '') for block in translated_blocks])
+            GLib.idle_add(self.ocr_buffer.set_text, original_text)
+            GLib.idle_add(self.translation_buffer.set_text, translated_text)
+        return frame
+
+    def _frame_supersedes(self, new, old):
+        """Отменяет ли новый кадр обработку старого: только если то же окно изменилось"""
+        return (new.window_id == old.window_id
+                and signature_change(new.signature, old.signature) > FRAME_CHANGE_THRESHOLD)
+
+    def _render_frame(self, frame):
+        """Единственный потребитель конвейера: показывает overlay (главный поток)"""
+        session = frame.session
+        if self.sessions.get(frame.window_id) is not session:
+            return  # окно уже не переводится
+        session.scheduler.record_latency(time.time() - frame.created)
+        # Окно могло сдвинуться, пока шел перевод: берем текущее положение
+        x, y, w, h = session.tracker.geometry or frame.geometry
+        session.overlay_manager.show_multiple_overlays(frame.translated_blocks, x, y, self.compact_mode,
+                                                       progressive=frame.progressive)
+
+    def _on_frame_discarded(self, frame):
+        """Учитывает задержку кадра, отмененного или вытесненного до отрисовки"""
+        # Иначе окно, которое меняется быстрее, чем переводится, захватывалось бы так же часто
+        frame.session.scheduler.record_latency(time.time() - frame.created)
+
+    def _on_pipeline_error(self, frame, stage, error):
+        """Ошибка на этапе конвейера"""
+        if frame.progressive is not None:
+            GLib.idle_add(frame.session.overlay_manager.end_progressive_update, frame.progressive)
+        GLib.idle_add(self.status_label.set_text, f"Ошибка {stage}: {error}")
+
+    def request_translation(self, session=None):
+        """Ставит в конвейер новый кадр окна (или всех переводимых окон)"""
+        if not self.sessions:
+            self.status_label.set_text("Окно не выбрано")
+            return
+        sessions = [session] if session else list(self.sessions.values())
+        for session in sessions:
+            print(f"[DEBUG] Начинаем перевод для окна: {session.window_id}")
+            self.pipeline.submit(Frame(session.window_id, session))
 
     def on_clear_cache(self, button):
         self.translation_engine.clear_cache()
@@ -341,14 +557,16 @@ class TranslatorApp(Gtk.Window):
 
     def on_hide_overlay(self, button):
         """Скрывает overlay окна для создания скриншота"""
-        self.overlay_manager.hide_for_screenshot()
+        for session in self.sessions.values():
+            session.overlay_manager.hide_for_screenshot()
         self.status_label.set_text("Overlay скрыты для скриншота")
         self.hide_overlay_btn.set_sensitive(False)
         self.show_overlay_btn.set_sensitive(True)
 
     def on_show_overlay(self, button):
         """Восстанавливает overlay окна после создания скриншота"""
-        self.overlay_manager.restore_after_screenshot()
+        for session in self.sessions.values():
+            session.overlay_manager.restore_after_screenshot()
         self.status_label.set_text("Overlay восстановлены")
         self.hide_overlay_btn.set_sensitive(True)
         self.show_overlay_btn.set_sensitive(False)
@@ -358,7 +576,8 @@ class TranslatorApp(Gtk.Window):
         self.status_label.set_text("Создание скриншота без overlay...")
         
         # Скрываем overlay с автоматическим восстановлением через 5 секунд
-        self.overlay_manager.hide_for_screenshot_with_delay(5)
+        for session in self.sessions.values():
+            session.overlay_manager.hide_for_screenshot_with_delay(5)
         
         # Временно блокируем кнопку
         self.screenshot_btn.set_sensitive(False)
@@ -376,9 +595,11 @@ class TranslatorApp(Gtk.Window):
 
     def on_toggle_invisibility(self, button):
         """Переключает режим невидимости overlay для скриншотов"""
-        is_invisible = self.overlay_manager.toggle_screenshot_invisibility()
+        self.screenshot_invisible = not self.screenshot_invisible
+        for session in self.sessions.values():
+            session.overlay_manager.set_screenshot_invisible(self.screenshot_invisible)
         
-        if is_invisible:
+        if self.screenshot_invisible:
             self.invisible_btn.set_label("Overlay невидимы для скриншотов: ВКЛ")
             self.status_label.set_text("Overlay теперь невидимы для программ захвата экрана")
             print("Режим невидимости для скриншотов ВКЛЮЧЕН")
@@ -387,37 +608,75 @@ class TranslatorApp(Gtk.Window):
             self.status_label.set_text("Overlay теперь видны для программ захвата экрана")
             print("Режим невидимости для скриншотов ВЫКЛЮЧЕН")
 
+    def on_translator_changed(self, combo):
+        """Заранее готовит бэкенд, чтобы первый перевод не ждал загрузки модели"""
+        self.translation_engine.warm_up_backend(combo.get_active_text(), force=True)
+
     def on_start(self, button):
         self.translation_enabled = True
+        # Пока идет автоперевод, бэкенды держат модели в памяти
+        self.translation_engine.set_auto_translation_active(True)
+        self.translation_engine.warm_up_backend(self.translator_combo.get_active_text(), force=True)
         self.status_label.set_text("Автоперевод включен")
 
     def on_stop(self, button):
         self.translation_enabled = False
+        self.translation_engine.set_auto_translation_active(False)
         self.status_label.set_text("Автоперевод остановлен")
 
-    def periodic_update(self):
-        if self.window_id and self.translation_enabled:
-            # Проверяем, что окно все еще существует
-            try:
-                subprocess.run(["xprop", "-id", self.window_id, "WM_NAME"], 
-                             capture_output=True, check=True, timeout=2)
-                # Используем GLib.idle_add для безопасного запуска в главном потоке
-                GLib.idle_add(self.safe_perform_translation)
-            except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
-                # Окно больше не существует или недоступно
-                self.window_id = None
-                self.window_title = None
-                GLib.idle_add(self.window_label.set_text, "Окно не выбрано")
-                GLib.idle_add(self.status_label.set_text, "Выбранное окно закрыто")
-        
-        interval = self.interval_spin.get_value_as_int()
-        GLib.timeout_add_seconds(interval, self.periodic_update)
+    def on_interval_changed(self, widget=None):
+        """Границы адаптивного интервала берутся из полей интерфейса"""
+        for session in self.sessions.values():
+            session.scheduler.set_bounds(self.interval_spin.get_value(),
+                                         self.max_interval_spin.get_value())
+        self.max_interval_spin.set_sensitive(self.adaptive_checkbox.get_active())
+
+    def _next_interval(self, session):
+        """Интервал до следующего захвата окна в секундах"""
+        if self.adaptive_checkbox.get_active():
+            return session.scheduler.next_interval()
+        return self.interval_spin.get_value_as_int()
+
+    def _schedule_update(self, session):
+        """Планирует periodic_update окна, заменяя уже запланированный вызов"""
+        if self.sessions.get(session.window_id) is not session:
+            return False
+        if session.update_timer is not None:
+            GLib.source_remove(session.update_timer)
+        interval = self._next_interval(session)
+        session.update_timer = GLib.timeout_add(int(interval * 1000), self.periodic_update, session)
         return False
 
-    def safe_perform_translation(self):
-        """Безопасный запуск перевода в отдельном потоке"""
-        thread = threading.Thread(target=self.perform_translation, daemon=True)
-        thread.start()
+    def _record_change(self, frame):
+        """Учитывает изменение кадра; при изменении окна захватываем снова раньше"""
+        session = frame.session
+        change = session.record_capture(frame.signature)
+        if not self.adaptive_checkbox.get_active():
+            return
+        previous = session.scheduler.next_interval()
+        session.scheduler.record_change(change)
+        if session.scheduler.next_interval() < previous:
+            # Следующий захват был запланирован с прежним, длинным интервалом
+            GLib.idle_add(self._schedule_update, session)
+
+    def periodic_update(self, session):
+        session.update_timer = None
+        if self.sessions.get(session.window_id) is not session:
+            return False
+        if self.translation_enabled:
+            # Без python-xlib трекер опрашивает окно здесь, иначе знает о нем из событий
+            session.tracker.refresh()
+            if not session.tracker.alive:
+                self._on_window_closed(session)
+                return False
+            if session.tracker.is_visible():
+                # Свернутое или скрытое окно не захватываем до его появления
+                # Продлеваем загрузку модели, если давно не было запросов
+                self.translation_engine.warm_up_backend(self.translator_combo.get_active_text())
+                # Если конвейер занят, устаревший кадр окна будет вытеснен этим
+                self.request_translation(session)
+
+        self._schedule_update(session)
         return False
 
     def on_key_press(self, widget, event):
@@ -437,10 +696,18 @@ class TranslatorApp(Gtk.Window):
         # Обрабатываем клики для лучшей отзывчивости
         return False
 
+    def on_configure(self, widget, event):
+        """Запоминает положение окна переводчика"""
+        self.control_rect = (event.x, event.y, event.width, event.height)
+        return False
+
     def signal_handler(self, signum, frame):
         """Обработчик сигналов для корректного завершения"""
         print(f"\nПолучен сигнал {signum}, завершаем работу...")
-        self.overlay_manager.destroy()
+        self.pipeline.stop()
+        for session in list(self.sessions.values()):
+            self._remove_session(session)
+        self.ocr_engine.close()
         self.translation_engine.close()
         Gtk.main_quit()
 
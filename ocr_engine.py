@@ -4,12 +4,28 @@
 import os
 import time
 import subprocess
+import threading
+import tempfile
 import pytesseract
 from PIL import Image
+from window_capture import CompositeCapture
 import numpy as np
-import gi
-gi.require_version('Gtk', '3.0')
-from gi.repository import GLib
+
+# Размер уменьшенной копии кадра для сравнения кадров между собой
+SIGNATURE_SIZE = (64, 64)
+
+
+def image_signature(image):
+    """Уменьшенная серая копия кадра для быстрого сравнения"""
+    return np.asarray(image.convert('L').resize(SIGNATURE_SIZE), dtype=np.int16)
+
+
+def signature_change(first, second):
+    """Доля изменения между кадрами (0 - одинаковые, 1 - противоположные)"""
+    if first is None or second is None or first.shape != second.shape:
+        return 1.0
+    return float(np.abs(first - second).mean()) / 255
+
 
 class OCREngine:
     """Движок для оптического распознавания текста"""
@@ -18,15 +34,51 @@ class OCREngine:
         self.image_path = "/tmp/window_capture.png"
         self.last_image_hash = None
         self.last_ocr_result = None
+        # Внеэкранный захват окон (XComposite): id окна -> CompositeCapture
+        self._composites = {}
+        self._composites_lock = threading.Lock()
     
+    def capture_image(self, window_id):
+        """Захватывает окно и возвращает изображение в памяти или None
+
+        Сначала содержимое окна читается через XComposite: в кадр не попадают
+        перекрывающие окна и наши overlay. Если это невозможно, окно
+        захватывается через файл методами capture_window.
+        """
+        with self._composites_lock:
+            composite = self._composites.get(window_id)
+            if composite is None:
+                composite = self._composites[window_id] = CompositeCapture(window_id)
+        image = composite.capture()
+        if image is None:
+            if not self.capture_window(window_id):
+                return None
+            # Изображение нужно в памяти: следующий захват перезапишет файл
+            image = self.load_image()
+            self.cleanup()
+        self.last_capture_time = time.time()
+        return image
+
+    def release_window(self, window_id):
+        """Освобождает захват окна, которое больше не переводится"""
+        with self._composites_lock:
+            composite = self._composites.pop(window_id, None)
+        if composite is not None:
+            composite.close()
+
+    def close(self):
+        """Освобождает захват всех окон"""
+        for window_id in list(self._composites):
+            self.release_window(window_id)
+
     def capture_window(self, window_id):
-        """Захватывает изображение окна"""
+        """Захватывает изображение окна в файл image_path"""
         try:
             # Пробуем несколько методов захвата
             methods = [
+                ["import", "-window", window_id, self.image_path],  # ImageMagick: именно это окно
                 ["scrot", "-u", "-o", self.image_path],  # Захват активного окна
                 ["scrot", "-o", self.image_path],        # Захват всего экрана
-                ["import", "-window", window_id, self.image_path]  # ImageMagick (если установлен)
             ]
             
             success = False
@@ -46,7 +98,7 @@ class OCREngine:
                     else:
                         print(f"[DEBUG] Метод {' '.join(method)} не создал файл")
                         
-                except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+                except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError) as e:
                     print(f"[DEBUG] Метод {' '.join(method)} не сработал: {e}")
                     continue
             
@@ -82,26 +134,70 @@ class OCREngine:
             print(f"[Ошибка OCR]: {e}")
             return ""
 
-    def recognize_text_with_positions(self, lang='rus+eng'):
-        """Распознает текст с координатами каждого блока"""
+    def load_image(self):
+        """Загружает захваченное изображение в память, чтобы освободить файл захвата"""
         try:
-            if not os.path.exists(self.image_path):
-                print(f"[DEBUG] Файл изображения не найден: {self.image_path}")
-                return []
-            
-            # Проверяем размер файла
-            file_size = os.path.getsize(self.image_path)
-            print(f"[DEBUG] Размер файла изображения: {file_size} байт")
-            
-            if file_size < 1000:
-                print(f"[DEBUG] Файл слишком маленький, возможно поврежден")
-                return []
-            
-            image = Image.open(self.image_path)
+            with Image.open(self.image_path) as image:
+                return image.copy()
+        except Exception as e:
+            print(f"[Ошибка загрузки изображения]: {e}")
+            return None
+
+    def _image_to_data(self, image, lang, cancelled=None):
+        """Запускает tesseract и возвращает данные в виде pytesseract.Output.DICT
+
+        Пока tesseract работает, проверяется cancelled(): если кадр устарел,
+        процесс завершается и возвращается None.
+        """
+        if cancelled is None:
+            return pytesseract.image_to_data(image, lang=lang, output_type=pytesseract.Output.DICT)
+
+        with tempfile.NamedTemporaryFile(suffix='.png') as input_file:
+            image.save(input_file.name)
+            process = subprocess.Popen(
+                [pytesseract.pytesseract.tesseract_cmd, input_file.name, 'stdout', '-l', lang, 'tsv'],
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            while True:
+                try:
+                    output, _ = process.communicate(timeout=0.1)
+                    break
+                except subprocess.TimeoutExpired:
+                    if cancelled():
+                        process.kill()
+                        process.communicate()
+                        print("[DEBUG] OCR прерван: кадр устарел")
+                        return None
+        if process.returncode != 0:
+            raise RuntimeError(f"tesseract завершился с кодом {process.returncode}")
+        return pytesseract.pytesseract.file_to_dict(output.decode('utf-8', errors='replace'), '\t', -1)
+
+    def recognize_text_with_positions(self, lang='rus+eng', image=None, cancelled=None):
+        """Распознает текст с координатами каждого блока
+
+        image - уже загруженное изображение кадра; по умолчанию читается файл захвата.
+        cancelled() - проверка, что результат больше не нужен.
+        """
+        try:
+            if image is None:
+                if not os.path.exists(self.image_path):
+                    print(f"[DEBUG] Файл изображения не найден: {self.image_path}")
+                    return []
+
+                # Проверяем размер файла
+                file_size = os.path.getsize(self.image_path)
+                print(f"[DEBUG] Размер файла изображения: {file_size} байт")
+
+                if file_size < 1000:
+                    print(f"[DEBUG] Файл слишком маленький, возможно поврежден")
+                    return []
+
+                image = Image.open(self.image_path)
             print(f"[DEBUG] Размер изображения: {image.size}")
             
             # Получаем данные с координатами
-            data = pytesseract.image_to_data(image, lang=lang, output_type=pytesseract.Output.DICT)
+            data = self._image_to_data(image, lang, cancelled)
+            if not data:
+                return []
             
             text_blocks = []
             n_boxes = len(data['text'])
@@ -6,6 +6,7 @@ gi.require_version('Gtk', '3.0')
 gi.require_version('Gdk', '3.0')
 from gi.repository import Gtk, Gdk, GLib
 import html
+import threading
 
 class OverlayManager:
     """Менеджер для управления overlay окнами"""
@@ -17,6 +18,25 @@ class OverlayManager:
         self._is_hidden = False  # Флаг состояния скрытия
         self._screenshot_invisible = False  # Флаг невидимости для скриншотов
         
+        # Частичные переводы, пришедшие потоком, перерисовываются не чаще интервала
+        self.partial_redraw_interval_ms = 100
+        self._partial_lock = threading.Lock()
+        self._partial_context = None  # (поколение, блоки, x окна, y окна, компактный режим)
+        # Каждый кадр с частичными переводами получает свое поколение: запоздавшее
+        # завершение старого кадра не трогает частичные переводы нового
+        self._partial_generation = 0
+        self._progressive_generation = None  # поколение показанных частичных overlay
+        self._pending_partials = {}  # индекс блока -> последний частичный текст
+        self._partial_flush_scheduled = False
+        self._progressive_overlays = {}  # индекс блока -> overlay
+
+        # Положение окна, относительно которого стоят overlay блоков
+        self._window_origin = None
+        self._pending_origin = None  # новое положение, еще не примененное
+        self._move_scheduled = False
+        # Окно скрыто: overlay спрятаны, но не уничтожены
+        self._suspended = False
+        
         # Проверяем, работаем ли мы в X11
         try:
             import os
@@ -114,8 +134,13 @@ class OverlayManager:
             self.overlay_window.show_all()
             print(f"[DEBUG] Overlay показан: x={x}, y={y}, w={w}, h={h}")
 
-    def show_multiple_overlays(self, text_blocks, window_x, window_y, compact_mode=True):
-        """Показывает множество overlay окон для каждого текстового блока"""
+    def show_multiple_overlays(self, text_blocks, window_x, window_y, compact_mode=True,
+                               progressive=None):
+        """Показывает множество overlay окон для каждого текстового блока
+
+        progressive - поколение частичных переводов этого кадра (из
+        begin_progressive_update); они заменяются окончательным результатом.
+        """
         # Создаем новые overlay без скрытия старых
         new_overlays = []
         print(f"[DEBUG] Создаем overlay для {len(text_blocks)} блоков")
@@ -141,12 +166,18 @@ class OverlayManager:
                     compact_mode
                 )
                 if overlay:
+                    overlay.block = block
                     new_overlays.append(overlay)
                     overlay.show_all()
                     print(f"[DEBUG] Overlay {i+1} создан и показан")
                 else:
                     print(f"[DEBUG] Не удалось создать overlay {i+1}")
         
+        # Окончательный результат заменяет частичные переводы своего кадра
+        if progressive is not None:
+            self.end_progressive_update(progressive)
+        self._window_origin = (window_x, window_y)
+
         # Плавно заменяем старые overlay новыми
         if new_overlays:
             # Скрываем старые overlay
@@ -157,6 +188,136 @@ class OverlayManager:
         else:
             print("[DEBUG] Нет новых overlay для показа")
 
+    def begin_progressive_update(self, text_blocks, window_x, window_y, compact_mode=True):
+        """Готовит показ частичных переводов для блоков (можно вызывать из любого потока)
+
+        Возвращает поколение, которое передается в queue_partial_translation
+        и end_progressive_update этого кадра.
+        """
+        with self._partial_lock:
+            self._partial_generation += 1
+            self._partial_context = (self._partial_generation, text_blocks,
+                                     window_x, window_y, compact_mode)
+            self._pending_partials.clear()
+            self._window_origin = (window_x, window_y)
+            return self._partial_generation
+
+    def queue_partial_translation(self, index, text, generation=None):
+        """Ставит частичный перевод блока в очередь на отрисовку (из любого потока)"""
+        with self._partial_lock:
+            if self._partial_context is None:
+                return
+            if generation is not None and generation != self._partial_generation:
+                return  # перевод кадра, который уже сменился новым
+            self._pending_partials[index] = text
+            if self._partial_flush_scheduled:
+                return
+            self._partial_flush_scheduled = True
+        # Все токены, пришедшие за интервал, отрисуются одним проходом
+        GLib.timeout_add(self.partial_redraw_interval_ms, self._flush_partial_translations)
+
+    def _flush_partial_translations(self):
+        """Отрисовывает накопленные частичные переводы (в главном потоке GTK)"""
+        with self._partial_lock:
+            self._partial_flush_scheduled = False
+            context = self._partial_context
+            pending, self._pending_partials = self._pending_partials, {}
+        if context is None or self._is_hidden or self._suspended:
+            return False
+
+        generation, text_blocks, window_x, window_y, compact_mode = context
+        if self._progressive_generation != generation:
+            # Частичные overlay прежнего кадра стоят над его блоками
+            self._destroy_progressive_overlays()
+            self._progressive_generation = generation
+        for index, text in pending.items():
+            overlay = self._progressive_overlays.get(index)
+            if overlay is not None:
+                overlay.text_label.set_markup(self._positioned_markup(text))
+                continue
+            block = text_blocks[index]
+            overlay = self._create_positioned_overlay(
+                text,
+                window_x + block['x'],
+                window_y + block['y'],
+                block['width'],
+                block['height'],
+                compact_mode
+            )
+            if overlay:
+                overlay.block = block
+                overlay.show_all()
+                self._progressive_overlays[index] = overlay
+        return False  # Не повторяем таймер
+
+    def queue_window_move(self, window_x, window_y):
+        """Окно переместилось: overlay переедут следом (из любого потока)
+
+        Все перемещения, пришедшие до следующей итерации главного цикла,
+        применяются одним проходом, без OCR и перевода.
+        """
+        with self._partial_lock:
+            self._pending_origin = (window_x, window_y)
+            if self._move_scheduled:
+                return
+            self._move_scheduled = True
+        GLib.idle_add(self._apply_window_move)
+
+    def _apply_window_move(self):
+        """Переставляет overlay к новому положению окна (в главном потоке GTK)"""
+        with self._partial_lock:
+            self._move_scheduled = False
+            origin, self._pending_origin = self._pending_origin, None
+            if origin is None or origin == self._window_origin:
+                return False
+            self._window_origin = origin
+            if self._partial_context is not None:
+                generation, text_blocks, _, _, compact_mode = self._partial_context
+                self._partial_context = (generation, text_blocks, origin[0], origin[1], compact_mode)
+
+        window_x, window_y = origin
+        overlays = (self.overlay_windows + self._hidden_overlays
+                    + list(self._progressive_overlays.values()))
+        for overlay in overlays:
+            block = getattr(overlay, 'block', None)
+            if block is None:
+                continue
+            try:
+                overlay.move(*self._overlay_position(
+                    window_x + block['x'], window_y + block['y'],
+                    block['width'], block['height']))
+            except Exception:
+                pass  # overlay уже уничтожен
+        print(f"[DEBUG] {len(overlays)} overlay перемещены за окном: x={window_x}, y={window_y}")
+        return False
+
+    def end_progressive_update(self, generation=None):
+        """Убирает overlay с частичными переводами
+
+        generation - поколение кадра, который закончился; если после него уже
+        начался новый кадр, ничего не делает. None убирает в любом случае.
+        """
+        with self._partial_lock:
+            if generation is not None and generation != self._partial_generation:
+                return
+            self._partial_context = None
+            self._pending_partials.clear()
+        self._destroy_progressive_overlays()
+
+    def _destroy_progressive_overlays(self):
+        for overlay in self._progressive_overlays.values():
+            try:
+                overlay.destroy()
+            except:
+                pass
+        self._progressive_overlays.clear()
+        self._progressive_generation = None
+
+    def _positioned_markup(self, text):
+        """Разметка текста для overlay над блоком"""
+        safe_text = html.escape(text)
+        return f'<span foreground="white" font_desc="12" background="black">{safe_text}</span>'
+
     def _set_x11_attributes(self, overlay, invisible=True):
         """Устанавливает дополнительные X11 атрибуты для невидимости на скриншотах"""
         if not self._is_x11:
@@ -229,9 +390,10 @@ class OverlayManager:
 
             # Создаем лейбл с текстом
             label = Gtk.Label()
-            safe_text = html.escape(text)
-            label.set_markup(f'<span foreground="white" font_desc="12" background="black">{safe_text}</span>')
+            label.set_markup(self._positioned_markup(text))
             overlay_container.add_overlay(label)
+            # Ссылка на лейбл для обновления частичных переводов
+            overlay.text_label = label
 
             # Клики проходят сквозь overlay
             overlay_container.set_overlay_pass_through(label, True)
@@ -248,22 +410,7 @@ class OverlayManager:
 
             # Устанавливаем размер и позицию
             overlay.set_default_size(w + 20, h + 10)  # Немного больше для читаемости
-            
-            # Позиционирование overlay по левому верхнему углу текста
-            overlay_x = x  # Левый край overlay = левый край текста
-            
-            # Вертикальное позиционирование: overlay над текстом
-            overlay_y = y - h - 8  # 8 пикселей отступ над текстом для лучшей читаемости
-            
-            # Защита от выхода за границы экрана
-            if overlay_y < 0:
-                overlay_y = y + h + 8  # Если не помещается сверху, размещаем снизу
-            
-            # Дополнительная защита от выхода за правый край экрана
-            screen_width = Gdk.Screen.get_default().get_width()
-            if overlay_x + w + 20 > screen_width:
-                overlay_x = screen_width - w - 20 - 10  # 10px отступ от правого края
-            
+            overlay_x, overlay_y = self._overlay_position(x, y, w, h)
             overlay.move(overlay_x, overlay_y)
             
             # Принудительно показываем окно поверх всех
@@ -293,6 +440,24 @@ class OverlayManager:
             print(f"[Ошибка создания positioned overlay]: {e}")
             return None
     
+    def _overlay_position(self, x, y, w, h):
+        """Позиция overlay для блока с абсолютными координатами x, y"""
+        # Позиционирование overlay по левому верхнему углу текста
+        overlay_x = x  # Левый край overlay = левый край текста
+
+        # Вертикальное позиционирование: overlay над текстом
+        overlay_y = y - h - 8  # 8 пикселей отступ над текстом для лучшей читаемости
+
+        # Защита от выхода за границы экрана
+        if overlay_y < 0:
+            overlay_y = y + h + 8  # Если не помещается сверху, размещаем снизу
+
+        # Дополнительная защита от выхода за правый край экрана
+        screen_width = Gdk.Screen.get_default().get_width()
+        if overlay_x + w + 20 > screen_width:
+            overlay_x = screen_width - w - 20 - 10  # 10px отступ от правого края
+        return overlay_x, overlay_y
+
     def _create_compact_overlay(self, text, x, y, w, h):
         """Создает компактный overlay"""
         self.overlay_window = Gtk.Window(type=Gtk.WindowType.POPUP)
@@ -503,6 +668,32 @@ class OverlayManager:
         self._is_hidden = False
         print(f"[DEBUG] Восстановлено {len(self.overlay_windows)} overlay окон")
     
+    def suspend(self):
+        """Прячет overlay, пока целевое окно свернуто или скрыто"""
+        if self._suspended:
+            return
+        self._suspended = True
+        for overlay in self.overlay_windows + list(self._progressive_overlays.values()):
+            try:
+                overlay.hide()
+            except:
+                pass
+        print("[DEBUG] Overlay спрятаны: окно скрыто")
+
+    def resume(self):
+        """Снова показывает overlay, спрятанные suspend()"""
+        if not self._suspended:
+            return
+        self._suspended = False
+        if self._is_hidden:
+            return  # Overlay скрыты для скриншота, их вернет restore_after_screenshot
+        for overlay in self.overlay_windows + list(self._progressive_overlays.values()):
+            try:
+                overlay.show_all()
+            except:
+                pass
+        print("[DEBUG] Overlay снова показаны")
+
     def is_hidden_for_screenshot(self):
         """Проверяет, скрыты ли overlay для скриншота"""
         return self._is_hidden
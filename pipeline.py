@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Конвейер обработки кадров: захват -> OCR -> перевод -> отрисовка.
+
+У каждого этапа свой поток и своя очередь ограниченного размера. Если этап
+не успевает, в его очереди остается только самый свежий кадр, а старые
+выбрасываются: производительность ограничена самым медленным этапом, и
+потоки не накапливаются. Отрисовку выполняет единственный потребитель
+в главном потоке GTK, которого конвейер вызывает через переданную
+функцию schedule (например, GLib.idle_add).
+
+Когда новый кадр прошел захват (или другой этап, заданный supersede_after)
+и отличается от кадров, которые еще обрабатываются, старые кадры
+отменяются: этапы проверяют frame.is_cancelled() и прекращают работу, а
+отрисовка их пропускает. Чтобы непрерывно меняющееся окно не осталось
+совсем без перевода, кадр на последнем этапе отменяется, только если
+после предыдущей такой отмены окно успело отрисоваться.
+
+Кадры нескольких окон идут через те же этапы: очереди хранят свежий кадр
+каждого окна отдельно и выдают их по кругу, поэтому окно, которое часто
+меняется, не вытесняет и не задерживает кадры остальных.
+"""
+
+import itertools
+import threading
+import time
+import traceback
+from collections import OrderedDict, deque
+
+
+class Frame:
+    """Один кадр и результаты его обработки"""
+
+    def __init__(self, window_id, session=None):
+        self.window_id = window_id
+        # Сеанс перевода окна, которому принадлежит кадр
+        self.session = session
+        self.seq = None
+        # Номер этапа, который обрабатывает кадр
+        self.stage = None
+        self.created = time.time()
+        self.image = None
+        # Уменьшенная копия изображения для сравнения кадров
+        self.signature = None
+        self.geometry = None
+        self.text_blocks = None
+        self.translated_blocks = None
+        # Поколение частичных переводов кадра в overlay (None - их не было)
+        self.progressive = None
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """Отмечает кадр устаревшим; этапы прекращают его обработку"""
+        self._cancelled.set()
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+
+class StageQueue:
+    """Очередь ограниченного размера, вытесняющая самые старые элементы
+
+    Элементы с разными ключами key(item) хранятся раздельно: maxsize
+    действует для каждого ключа, а get() обходит ключи по кругу.
+    """
+
+    def __init__(self, maxsize=1, key=None):
+        self.maxsize = maxsize
+        self.key = key or (lambda item: None)
+        # Ключ -> элементы; порядок ключей - очередь обхода
+        self._items = OrderedDict()
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def put(self, item):
+        """Кладет элемент; возвращает вытесненный старый элемент с тем же ключом или None"""
+        with self._condition:
+            items = self._items.setdefault(self.key(item), deque())
+            dropped = items.popleft() if len(items) >= self.maxsize else None
+            items.append(item)
+            self._condition.notify()
+            return dropped
+
+    def get(self, block=True):
+        """Берет самый старый элемент очередного ключа; None, если очередь закрыта или пуста"""
+        with self._condition:
+            while block and not self._items and not self._closed:
+                self._condition.wait()
+            if not self._items:
+                return None
+            key, items = self._items.popitem(last=False)
+            item = items.popleft()
+            if items:
+                # Ключ уходит в конец круга
+                self._items[key] = items
+            return item
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def __len__(self):
+        with self._condition:
+            return sum(len(items) for items in self._items.values())
+
+
+class Pipeline:
+    """Этапы обработки в отдельных потоках с вытеснением устаревших кадров
+
+    stages - список (имя, функция): функция получает кадр и возвращает его
+    для следующего этапа или None, если обработка кадра закончена.
+    render(frame) вызывается через schedule для кадров, прошедших все этапы.
+    on_error(frame, stage, error) сообщает об исключении на этапе.
+    supersedes(new, old) решает, отменяет ли новый кадр более старый
+    (по умолчанию отменяет всегда); проверка идет, когда новый кадр прошел
+    этап supersede_after (по умолчанию первый).
+    key(frame) разделяет кадры разных окон в очередях (по умолчанию window_id).
+    on_discard(frame) сообщает о кадре, отмененном или вытесненном до отрисовки.
+    """
+
+    def __init__(self, stages, render, schedule=None, on_error=None, queue_size=1,
+                 supersedes=None, key=None, supersede_after=0, on_discard=None):
+        self.stages = stages
+        self.render = render
+        self.schedule = schedule or (lambda callback: callback())
+        self.on_error = on_error
+        self.on_discard = on_discard
+        self.supersedes = supersedes or (lambda new, old: True)
+        self.supersede_after = supersede_after
+        # Кадры, которые еще обрабатываются: номер -> кадр
+        self._active = {}
+        self._active_lock = threading.Lock()
+        # Окна, чей кадр отменен на последнем этапе и которые с тех пор не отрисовывались
+        self._starved = set()
+        self.key = key or (lambda frame: frame.window_id)
+        self.queues = [StageQueue(queue_size, self.key) for _ in stages]
+        self.output = StageQueue(queue_size, self.key)
+        self._sequence = itertools.count(1)
+        self._render_lock = threading.Lock()
+        self._render_scheduled = False
+        self._workers = []
+
+    def start(self):
+        """Запускает по потоку на этап"""
+        for index, (name, _) in enumerate(self.stages):
+            worker = threading.Thread(target=self._work, args=(index,),
+                                      name=f"pipeline-{name}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, frame):
+        """Ставит новый кадр в начало конвейера"""
+        frame.seq = next(self._sequence)
+        with self._active_lock:
+            self._active[frame.seq] = frame
+        self._put(0, frame)
+        return frame
+
+    def _finish(self, frame, dropped=False):
+        """Кадр больше не обрабатывается"""
+        with self._active_lock:
+            active = self._active.pop(frame.seq, None)
+        if active is not None and self.on_discard and (dropped or frame.is_cancelled()):
+            self.on_discard(frame)
+
+    def _supersede(self, frame):
+        """Отменяет обработку более старых кадров, которые устарели из-за frame"""
+        last = len(self.stages) - 1
+        with self._active_lock:
+            older = [other for seq, other in self._active.items() if seq < frame.seq]
+        for other in older:
+            if other.is_cancelled() or not self.supersedes(frame, other):
+                continue
+            if other.stage == last:
+                key = self.key(other)
+                with self._active_lock:
+                    if key in self._starved:
+                        # Окно меняется быстрее, чем переводится: этот кадр доводим до конца
+                        continue
+                    self._starved.add(key)
+            print(f"[DEBUG] Кадр {other.seq} отменен: готов более новый кадр {frame.seq}")
+            other.cancel()
+
+    def cancel_all(self, window_id=None):
+        """Отменяет кадры окна window_id (или все), которые еще обрабатываются"""
+        with self._active_lock:
+            active = [frame for frame in self._active.values()
+                      if window_id is None or frame.window_id == window_id]
+        for frame in active:
+            frame.cancel()
+        if active:
+            print(f"[DEBUG] Отменено кадров: {len(active)}")
+
+    def _put(self, index, frame):
+        """Передает кадр этапу index (или отрисовке после последнего этапа)"""
+        queue = self.queues[index] if index < len(self.queues) else self.output
+        dropped = queue.put(frame)
+        if dropped is not None:
+            stage = self.stages[index][0] if index < len(self.stages) else "render"
+            print(f"[DEBUG] Кадр {dropped.seq} устарел и пропущен перед этапом {stage}")
+            self._finish(dropped, dropped=True)
+        if queue is self.output:
+            self._schedule_render()
+
+    def _work(self, index):
+        """Цикл потока этапа"""
+        name, process = self.stages[index]
+        queue = self.queues[index]
+        while True:
+            frame = queue.get()
+            if frame is None:
+                return
+            if frame.is_cancelled():
+                self._finish(frame)
+                continue
+            frame.stage = index
+            try:
+                result = process(frame)
+            except Exception as e:
+                print(f"[Ошибка этапа {name}]: {e}")
+                traceback.print_exc()
+                if self.on_error:
+                    self.on_error(frame, name, e)
+                self._finish(frame)
+                continue
+            if result is None or result.is_cancelled():
+                self._finish(frame)
+                continue
+            if index == self.supersede_after:
+                self._supersede(result)
+            self._put(index + 1, result)
+
+    def _schedule_render(self):
+        """Планирует отрисовку, если она еще не запланирована"""
+        with self._render_lock:
+            if self._render_scheduled:
+                return
+            self._render_scheduled = True
+        self.schedule(self._consume)
+
+    def _consume(self):
+        """Отрисовывает самые свежие готовые кадры всех окон (в главном потоке)"""
+        with self._render_lock:
+            self._render_scheduled = False
+        while True:
+            frame = self.output.get(block=False)
+            if frame is None:
+                return False
+            self._finish(frame)
+            if not frame.is_cancelled():
+                with self._active_lock:
+                    self._starved.discard(self.key(frame))
+                self.render(frame)
+
+    def stop(self):
+        """Останавливает потоки этапов"""
+        for queue in self.queues:
+            queue.close()
+        self.output.close()
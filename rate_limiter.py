@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Ограничение частоты запросов к бэкендам перевода.
+
+Два "ведра с токенами" - на запросы и на символы - пополняются с заданной
+скоростью и вмещают запас на несколько секунд. Запрос, для которого токенов
+не хватает, не отправляется, а откладывается: так клиент держится на
+предельной устойчивой скорости и не получает HTTP 429 и блокировок.
+Фоновые запросы оставляют часть запаса блокам, которые видны на экране.
+"""
+
+import threading
+import time
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        """Добавляет токены, накопившиеся с прошлого обращения"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost, reserve=0.0):
+        """Через сколько секунд наберется cost токенов сверх reserve"""
+        needed = min(cost, self.capacity) + reserve * self.capacity - self.tokens
+        return max(0.0, needed / self.rate)
+
+    def consume(self, cost):
+        self.tokens -= min(cost, self.capacity)
+
+
+class RateLimiter:
+    """Ограничение запросов и символов в секунду с приоритетом видимых блоков"""
+
+    def __init__(self, requests_per_second=None, chars_per_second=None,
+                 burst_seconds=5.0, background_reserve=0.3):
+        self.buckets = []
+        if requests_per_second:
+            self.requests = TokenBucket(requests_per_second, requests_per_second * burst_seconds)
+            self.buckets.append(self.requests)
+        else:
+            self.requests = None
+        if chars_per_second:
+            self.chars = TokenBucket(chars_per_second, chars_per_second * burst_seconds)
+            self.buckets.append(self.chars)
+        else:
+            self.chars = None
+        # Доля запаса, которую фоновые запросы не трогают
+        self.background_reserve = background_reserve
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_backend(cls, backend):
+        """Ограничитель по метаданным бэкенда; None, если ограничений нет"""
+        if not backend.requests_per_second and not backend.chars_per_second:
+            return None
+        return cls(backend.requests_per_second, backend.chars_per_second)
+
+    def _costs(self, chars):
+        costs = []
+        if self.requests:
+            costs.append((self.requests, 1))
+        if self.chars:
+            costs.append((self.chars, chars))
+        return costs
+
+    def acquire(self, chars, max_wait=0.0, background=False):
+        """Списывает один запрос и chars символов, ожидая не дольше max_wait
+
+        Возвращает False, если бюджета не хватило - запрос нужно отложить.
+        max_wait=None - ждать, сколько понадобится.
+        """
+        reserve = self.background_reserve if background else 0.0
+        deadline = None if max_wait is None else time.monotonic() + max_wait
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                for bucket in self.buckets:
+                    bucket.refill(now)
+                delay = max(bucket.wait_time(cost, reserve) for bucket, cost in self._costs(chars))
+                if delay == 0.0:
+                    for bucket, cost in self._costs(chars):
+                        bucket.consume(cost)
+                    return True
+            if deadline is not None and now + delay > deadline:
+                return False
+            time.sleep(delay)
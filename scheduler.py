@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Адаптивный интервал между захватами окна.
+
+Пока окно меняется, захват идет как можно чаще, но не чаще, чем конвейер
+успевает обработать кадр (иначе кадры только вытесняют друг друга). Если
+кадры подряд одинаковые, интервал удваивается до потолка: неизменное
+окно почти ничего не стоит. Нижняя и верхняя границы задаются в
+интерфейсе.
+"""
+
+import threading
+
+
+class AdaptiveScheduler:
+    """Интервал следующего захвата по частоте изменений и задержке конвейера"""
+
+    def __init__(self, min_interval=1.0, max_interval=30.0, backoff=2.0,
+                 change_threshold=0.01, latency_alpha=0.3):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        # Во сколько раз растет интервал после кадра без изменений
+        self.backoff = backoff
+        # Изменение кадра (доля от 255), которое считается изменением окна
+        self.change_threshold = change_threshold
+        self.latency_alpha = latency_alpha
+        self.interval = min_interval
+        # Сглаженная задержка конвейера от захвата до отрисовки
+        self.latency = None
+        self._lock = threading.Lock()
+
+    def set_bounds(self, min_interval, max_interval):
+        """Новые границы интервала (из интерфейса)"""
+        with self._lock:
+            self.min_interval = min_interval
+            self.max_interval = max(min_interval, max_interval)
+            self.interval = min(max(self.interval, self.min_interval), self.max_interval)
+
+    def reset(self):
+        """Следующий захват - как можно скорее (новое окно, ручное обновление)"""
+        with self._lock:
+            self.interval = self.min_interval
+
+    def record_change(self, change):
+        """Учитывает, насколько захваченный кадр отличается от предыдущего"""
+        with self._lock:
+            if change > self.change_threshold:
+                self.interval = self.min_interval
+            else:
+                self.interval = min(self.interval * self.backoff, self.max_interval)
+
+    def record_latency(self, seconds):
+        """Учитывает время обработки кадра от захвата до отрисовки или отмены"""
+        with self._lock:
+            if self.latency is None:
+                self.latency = seconds
+            else:
+                self.latency += self.latency_alpha * (seconds - self.latency)
+
+    def next_interval(self):
+        """Через сколько секунд делать следующий захват"""
+        with self._lock:
+            interval = min(max(self.interval, self.min_interval), self.max_interval)
+            # Захватывать чаще, чем конвейер обрабатывает кадры, бесполезно
+            if self.latency is not None:
+                interval = min(max(interval, self.latency), self.max_interval)
+            return interval
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Тест маршрутизатора бэкендов: выключатель, переключение и хеджирование
+"""
+
+import threading
+
+import backend_router
+from backend_router import BackendRouter, CircuitBreaker
+
+
+class FakeClock:
+    """Подменяет модуль time в backend_router: время двигает тест"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class FakeBackend:
+    requests_per_second = None
+    chars_per_second = None
+    cost_per_1k_chars = 0.0
+
+    def __init__(self, name, fail=False, gate=None):
+        self.name = name
+        self.fail = fail
+        self.gate = gate
+        self.calls = 0
+
+    def translate(self, text):
+        self.calls += 1
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.fail:
+            return f"[Ошибка: {self.name}]"
+        return f"{self.name}: {text}"
+
+
+def call(backend):
+    return [backend.translate("hello")]
+
+
+def with_clock(test):
+    clock = FakeClock()
+    real_time = backend_router.time
+    backend_router.time = clock
+    try:
+        test(clock)
+    finally:
+        backend_router.time = real_time
+
+
+def test_breaker_opens_and_recovers_after_probe():
+    def check(clock):
+        backend = FakeBackend("A", fail=True)
+        router = BackendRouter({"A": backend}, hedging=False, failover=False)
+        states = []
+        router.add_state_listener(lambda name, state: states.append(state))
+        breaker = router.breakers["A"]
+        try:
+            for _ in range(breaker.failure_threshold):
+                router.call("A", call, 1)
+            assert breaker.state == CircuitBreaker.OPEN, breaker.state
+            assert states == [CircuitBreaker.OPEN], states
+
+            # Пока выключатель разомкнут, бэкенд не вызывается
+            _, translations = router.call("A", call, 1)
+            assert backend.calls == breaker.failure_threshold, backend.calls
+            assert "недоступен" in translations[0], translations
+
+            # Неудачная проба размыкает снова с удвоенной паузой
+            clock.now = breaker.open_until
+            router.call("A", call, 1)
+            assert backend.calls == breaker.failure_threshold + 1, backend.calls
+            assert breaker.state == CircuitBreaker.OPEN, breaker.state
+            assert breaker.open_until == clock.now + 2 * breaker.base_backoff, breaker.open_until
+
+            # Удачная проба замыкает выключатель
+            backend.fail = False
+            clock.now = breaker.open_until
+            _, translations = router.call("A", call, 1)
+            assert translations == ["A: hello"], translations
+            assert breaker.state == CircuitBreaker.CLOSED, breaker.state
+            assert breaker.backoff == breaker.base_backoff, breaker.backoff
+            assert states[-1] == CircuitBreaker.CLOSED, states
+        finally:
+            router.shutdown()
+
+    with_clock(check)
+
+
+def test_open_breaker_does_not_spend_rate_budget():
+    def check(clock):
+        backend = FakeBackend("A", fail=True)
+        backend.requests_per_second = 1.0
+        router = BackendRouter({"A": backend}, hedging=False, failover=False)
+        breaker = router.breakers["A"]
+        bucket = router.limiters["A"].requests
+        try:
+            for _ in range(breaker.failure_threshold):
+                router.call("A", call, 1)
+            tokens = bucket.tokens
+            for _ in range(3):
+                router.call("A", call, 1)
+            assert bucket.tokens <= tokens + 0.1, (bucket.tokens, tokens)
+            assert bucket.tokens > tokens - 1, (bucket.tokens, tokens)
+        finally:
+            router.shutdown()
+
+    with_clock(check)
+
+
+def test_deferred_probe_is_released():
+    def check(clock):
+        backend = FakeBackend("A", fail=True)
+        backend.requests_per_second = 1.0
+        router = BackendRouter({"A": backend}, hedging=False, failover=False)
+        breaker = router.breakers["A"]
+        try:
+            for _ in range(breaker.failure_threshold):
+                router.call("A", call, 1)
+            clock.now = breaker.open_until
+            router.limiters["A"].requests.tokens = -100.0
+            _, translations = router.call("A", call, 1)
+            assert translations is None, translations
+            # Проба не состоялась: выключатель снова ждет пробы, а не висит полуоткрытым
+            assert breaker.state == CircuitBreaker.OPEN, breaker.state
+            assert router.is_available("A")
+        finally:
+            router.shutdown()
+
+    with_clock(check)
+
+
+def test_failover_to_healthy_backend():
+    failing = FakeBackend("A", fail=True)
+    healthy = FakeBackend("B")
+    healthy.cost_per_1k_chars = 1.0
+    router = BackendRouter({"A": failing, "B": healthy}, hedging=False)
+    try:
+        # Пользователь выбрал A, но тот отвечает ошибкой - пакет уходит B
+        name, translations = router.call("A", call, 1)
+        assert (name, translations) == ("B", ["B: hello"]), (name, translations)
+        assert failing.calls == 1 and healthy.calls == 1, (failing.calls, healthy.calls)
+    finally:
+        router.shutdown()
+
+
+def test_hedging_returns_first_usable_answer():
+    gate = threading.Event()
+    slow = FakeBackend("A", gate=gate)
+    fast = FakeBackend("B")
+    fast.cost_per_1k_chars = 1.0
+    router = BackendRouter({"A": slow, "B": fast}, default_hedge_delay=0.05)
+    try:
+        name, translations = router.run(call, 1)
+        assert (name, translations) == ("B", ["B: hello"]), (name, translations)
+        assert slow.calls == 1, slow.calls
+    finally:
+        gate.set()
+        router.shutdown()
+
+
+if __name__ == "__main__":
+    try:
+        test_breaker_opens_and_recovers_after_probe()
+        test_open_breaker_does_not_spend_rate_budget()
+        test_deferred_probe_is_released()
+        test_failover_to_healthy_backend()
+        test_hedging_returns_first_usable_answer()
+        print("✅ Тест завершен успешно!")
+    except AssertionError as e:
+        print(f"❌ Тест не пройден: {e}")
+        import traceback
+        traceback.print_exc()
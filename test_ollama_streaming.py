@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Тест потокового клиента Ollama на локальном фейковом сервере
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from translation_engine import TranslationEngine
+
+# Токены, которые фейковый сервер отдает по одному
+FAKE_TOKENS = ["Привет", ",", " ", "мир", "!"]
+TOKEN_DELAY = 0.2
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Отвечает на /api/generate потоком NDJSON, как настоящий Ollama"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def write_chunk(self, data):
+        """Пишет один фрагмент chunked ответа"""
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        self.server.requests.append(request)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for token in self.reply_tokens(request):
+            chunk = {"model": request.get("model"), "response": token, "done": False}
+            self.write_chunk(json.dumps(chunk).encode() + b'\n')
+            time.sleep(TOKEN_DELAY)
+        self.write_chunk(json.dumps({"response": "", "done": True}).encode() + b'\n')
+        self.write_chunk(b'')
+
+    def reply_tokens(self, request):
+        """Токены ответа: на пакетный промпт отвечает нумерованными строками"""
+        if not request.get("prompt"):
+            return []
+        if "numbered" not in request.get("system", ""):
+            return FAKE_TOKENS
+        tokens = []
+        for line in request["prompt"].splitlines():
+            number, text = line.split(". ", 1)
+            # Строки с "skip" модель "теряет", чтобы проверить откат на одиночный запрос
+            if "skip" in text:
+                continue
+            tokens.append(f"{number}. ")
+            tokens.extend(FAKE_TOKENS)
+            tokens.append("\n")
+        return tokens
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_ollama():
+    """Запускает фейковый сервер Ollama на свободном порту"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeOllamaHandler)
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_ollama_streaming():
+    """Частичные переводы приходят до окончания генерации"""
+    print("=== Тест потокового перевода Ollama ===")
+
+    server = start_fake_ollama()
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = TranslationEngine(os.path.join(tmp, "cache.sqlite"))
+        engine.backends["Ollama"].url = f"http://127.0.0.1:{server.server_address[1]}"
+
+        partials = []
+        started = time.time()
+
+        def on_partial(index, text):
+            partials.append((time.time() - started, index, text))
+
+        blocks = [{'text': 'Hello, world!', 'x': 0, 'y': 0, 'width': 100, 'height': 20}]
+        engine.backends["Ollama"].max_batch_size = 1
+        result = engine.translate_text_blocks(blocks, "Ollama", on_partial)
+        total = time.time() - started
+        engine.close()
+
+    server.shutdown()
+
+    assert server.requests[0].get("stream") is True
+    assert result[0]['translated_text'] == "Привет, мир!"
+    assert [p[2] for p in partials] == ["Привет", "Привет,", "Привет, ", "Привет, мир", "Привет, мир!"]
+    assert all(p[1] == 0 for p in partials)
+
+    first_text = partials[0][0]
+    print(f"Первый текст через {first_text * 1000:.0f} мс, полный перевод через {total * 1000:.0f} мс")
+    assert first_text < TOKEN_DELAY * 2
+    assert first_text < total / 2
+
+
+def test_ollama_warm_up():
+    """Прогрев загружает модель и передает keep_alive с постоянным системным промптом"""
+    print("=== Тест прогрева Ollama ===")
+
+    server = start_fake_ollama()
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = TranslationEngine(os.path.join(tmp, "cache.sqlite"))
+        engine.backends["Ollama"].url = f"http://127.0.0.1:{server.server_address[1]}"
+
+        assert engine.backends["Ollama"].warm_up()
+        engine.translate_text("Hello, world!", "Ollama")
+        engine.close()
+
+    server.shutdown()
+
+    warm_up, translate = server.requests
+    assert warm_up["prompt"] == ""
+    assert warm_up["keep_alive"] == translate["keep_alive"] == "30m"
+    assert warm_up["system"] == translate["system"]
+    assert translate["prompt"] == "Hello, world!"
+
+
+def test_ollama_batching():
+    """Несколько блоков переводятся одной генерацией, неразобранные - по одному"""
+    print("=== Тест пакетного перевода Ollama ===")
+
+    server = start_fake_ollama()
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = TranslationEngine(os.path.join(tmp, "cache.sqlite"))
+        engine.backends["Ollama"].url = f"http://127.0.0.1:{server.server_address[1]}"
+
+        partials = []
+        texts = ['Open file', 'Save file', 'Open  file', 'Please skip me']
+        blocks = [{'text': t, 'x': 0, 'y': 0, 'width': 100, 'height': 20} for t in texts]
+        result = engine.translate_text_blocks(
+            blocks, "Ollama", lambda index, text: partials.append((index, text)))
+        engine.close()
+
+    server.shutdown()
+
+    # Одна пакетная генерация на три уникальных текста и одна повторная для потерянной строки
+    assert len(server.requests) == 2
+    assert server.requests[0]["prompt"] == "1. Open file\n2. Save file\n3. Please skip me"
+    assert server.requests[1]["prompt"] == "Please skip me"
+    assert [b['translated_text'] for b in result] == ["Привет, мир!"] * 4
+    # Частичные переводы дублирующегося блока тоже доходят до overlay
+    assert {index for index, _ in partials} == {0, 1, 2, 3}
+
+
+if __name__ == "__main__":
+    try:
+        test_ollama_streaming()
+        test_ollama_warm_up()
+        test_ollama_batching()
+        print("✅ Тест завершен успешно!")
+    except AssertionError as e:
+        print(f"❌ Тест не пройден: {e}")
+        import traceback
+        traceback.print_exc()
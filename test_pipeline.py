@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Тест конвейера: вытеснение старых кадров, обход окон по кругу и отмена;
+непрерывно меняющееся окно все равно отрисовывается
+"""
+
+import threading
+import time
+
+from pipeline import Frame, Pipeline, StageQueue
+
+TIMEOUT = 5
+
+
+def wait_until(predicate):
+    deadline = time.time() + TIMEOUT
+    while not predicate():
+        assert time.time() < deadline, "условие не выполнено"
+        time.sleep(0.001)
+
+
+def by_window(item):
+    return item[0]
+
+
+def test_queue_drops_oldest_per_key():
+    queue = StageQueue(1, by_window)
+    assert queue.put(('a', 1)) is None
+    assert queue.put(('b', 1)) is None
+    assert queue.put(('a', 2)) == ('a', 1)
+    assert [queue.get(block=False) for _ in range(3)] == [('a', 2), ('b', 1), None]
+
+
+def test_queue_round_robin_across_windows():
+    queue = StageQueue(2, by_window)
+    for item in [('a', 1), ('a', 2), ('a', 3), ('b', 1)]:
+        queue.put(item)
+    assert len(queue) == 3
+    # Часто меняющееся окно a не задерживает кадр окна b
+    items = [queue.get(block=False) for _ in range(4)]
+    assert items == [('a', 2), ('b', 1), ('a', 3), None], items
+
+
+class GatedStage:
+    """Этап, который пропускает кадры окон из gated только по разрешению теста"""
+
+    def __init__(self, gated=()):
+        self.gated = set(gated)
+        self.entered = []
+        self._permits = threading.Semaphore(0)
+
+    def __call__(self, frame):
+        self.entered.append(frame)
+        if frame.window_id in self.gated:
+            assert self._permits.acquire(timeout=TIMEOUT)
+        return frame
+
+    def allow(self, count=1):
+        """Пропускает count кадров"""
+        for _ in range(count):
+            self._permits.release()
+
+    def wait_entered(self, frame):
+        wait_until(lambda: frame in self.entered)
+
+
+def run_pipeline(stages, check, **kwargs):
+    rendered = []
+    done = threading.Condition()
+
+    def render(frame):
+        with done:
+            rendered.append(frame)
+            done.notify_all()
+
+    def wait_rendered(count):
+        with done:
+            assert done.wait_for(lambda: len(rendered) >= count, TIMEOUT), rendered
+
+    pipeline = Pipeline(stages, render, **kwargs)
+    pipeline.start()
+    try:
+        check(pipeline, rendered, wait_rendered)
+    finally:
+        pipeline.stop()
+
+
+def test_new_frame_cancels_frame_in_flight():
+    translate = GatedStage(gated=['a'])
+
+    def check(pipeline, rendered, wait_rendered):
+        old = pipeline.submit(Frame('a'))
+        translate.wait_entered(old)
+        new = pipeline.submit(Frame('a'))
+        # Новый кадр прошел захват и отменил тот, что еще переводится
+        wait_until(old.is_cancelled)
+        translate.allow(2)
+        wait_rendered(1)
+        assert rendered == [new], rendered
+
+    run_pipeline([("capture", lambda frame: frame), ("translate", translate)], check)
+
+
+def test_cancel_all_only_cancels_one_window():
+    translate = GatedStage(gated=['a'])
+
+    def check(pipeline, rendered, wait_rendered):
+        frame_a = pipeline.submit(Frame('a'))
+        translate.wait_entered(frame_a)
+        frame_b = pipeline.submit(Frame('b'))
+        pipeline.cancel_all('a')
+        translate.allow()
+        wait_rendered(1)
+        assert frame_a.is_cancelled() and not frame_b.is_cancelled()
+        assert rendered == [frame_b], rendered
+
+    # Кадры разных окон друг друга не отменяют
+    run_pipeline([("capture", lambda frame: frame), ("translate", translate)], check,
+                 supersedes=lambda new, old: new.window_id == old.window_id)
+
+
+def test_changing_window_still_renders():
+    translate = GatedStage(gated=['a'])
+    discarded = []
+    stages = [("capture", lambda frame: frame), ("ocr", lambda frame: frame),
+              ("translate", translate)]
+
+    def check(pipeline, rendered, wait_rendered):
+        first = pipeline.submit(Frame('a'))
+        translate.wait_entered(first)
+        # Окно изменилось: новый кадр после OCR отменяет первый
+        second = pipeline.submit(Frame('a'))
+        wait_until(first.is_cancelled)
+        translate.allow()
+        translate.wait_entered(second)
+        # Окно снова изменилось, но прошлый перевод уже отменен - этот доводим до конца
+        third = pipeline.submit(Frame('a'))
+        wait_until(lambda: len(pipeline.queues[2]) == 1)
+        assert not second.is_cancelled()
+        translate.allow(2)
+        wait_rendered(2)
+        assert rendered == [second, third], rendered
+        # Отмененный кадр сообщает о себе, чтобы планировщик учел задержку
+        wait_until(lambda: discarded == [first])
+
+    run_pipeline(stages, check, supersede_after=1, on_discard=discarded.append)
+
+
+if __name__ == "__main__":
+    try:
+        test_queue_drops_oldest_per_key()
+        test_queue_round_robin_across_windows()
+        test_new_frame_cancels_frame_in_flight()
+        test_cancel_all_only_cancels_one_window()
+        test_changing_window_still_renders()
+        print("✅ Тест завершен успешно!")
+    except AssertionError as e:
+        print(f"❌ Тест не пройден: {e}")
+        import traceback
+        traceback.print_exc()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Тест ограничителя частоты: ожидание бюджета, откладывание и запас для экрана
+"""
+
+import rate_limiter
+from rate_limiter import RateLimiter
+
+
+class FakeClock:
+    """Подменяет модуль time в rate_limiter: sleep сдвигает время мгновенно"""
+
+    def __init__(self):
+        self.now = 100.0
+        self.slept = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept += seconds
+        self.now += seconds
+
+
+def with_clock(test):
+    clock = FakeClock()
+    real_time = rate_limiter.time
+    rate_limiter.time = clock
+    try:
+        test(clock)
+    finally:
+        rate_limiter.time = real_time
+
+
+def drain(limiter, requests):
+    for _ in range(requests):
+        assert limiter.acquire(0)
+
+
+def test_request_over_budget_is_deferred():
+    def check(clock):
+        # 2 запроса в секунду, запас на 5 секунд - 10 запросов
+        limiter = RateLimiter(requests_per_second=2.0)
+        drain(limiter, 10)
+        assert not limiter.acquire(0, max_wait=0.0)
+        assert not limiter.acquire(0, max_wait=0.4)
+        assert clock.slept == 0.0, clock.slept
+        # Отложенный запрос не списал токены
+        assert limiter.requests.tokens == 0.0, limiter.requests.tokens
+
+    with_clock(check)
+
+
+def test_request_waits_within_max_wait():
+    def check(clock):
+        limiter = RateLimiter(requests_per_second=2.0)
+        drain(limiter, 10)
+        assert limiter.acquire(0, max_wait=0.5)
+        assert abs(clock.slept - 0.5) < 1e-9, clock.slept
+
+    with_clock(check)
+
+
+def test_no_deadline_waits_as_long_as_needed():
+    def check(clock):
+        limiter = RateLimiter(chars_per_second=100)
+        assert limiter.acquire(500)
+        # Следующие 300 символов накопятся только через 3 секунды
+        assert limiter.acquire(300, max_wait=None)
+        assert abs(clock.slept - 3.0) < 1e-9, clock.slept
+
+    with_clock(check)
+
+
+def test_background_keeps_reserve_for_visible_blocks():
+    def check(clock):
+        limiter = RateLimiter(requests_per_second=2.0, background_reserve=0.3)
+        # Осталось 3 из 10 запросов - ровно запас видимых блоков
+        drain(limiter, 7)
+        assert not limiter.acquire(0, max_wait=0.0, background=True)
+        assert limiter.acquire(0, max_wait=0.0)
+        # Фоновый запрос дождется, пока запас восстановится сверх резерва
+        assert limiter.acquire(0, max_wait=5.0, background=True)
+        assert abs(clock.slept - 1.0) < 1e-9, clock.slept
+
+    with_clock(check)
+
+
+if __name__ == "__main__":
+    try:
+        test_request_over_budget_is_deferred()
+        test_request_waits_within_max_wait()
+        test_no_deadline_waits_as_long_as_needed()
+        test_background_keeps_reserve_for_visible_blocks()
+        print("✅ Тест завершен успешно!")
+    except AssertionError as e:
+        print(f"❌ Тест не пройден: {e}")
+        import traceback
+        traceback.print_exc()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Тест разбиения текста: из фрагментов и разделителей собирается исходный текст
+"""
+
+import random
+
+from text_chunker import split_into_chunks
+
+WORDS = ["alpha", "beta", "gamma", "epsilon!", "eta\n", "theta.", "kappa", "lambda",
+         "nu", "sigma?", "tau\n\n", "  ", "omega"]
+
+
+def assemble(chunks):
+    return ''.join(chunk + separator for chunk, separator in chunks)
+
+
+def test_separator_before_chunk_is_kept():
+    text = 'nu lambda nu kappa epsilon! epsilon! gamma sigma tau eta\ntheta'
+    chunks = split_into_chunks(text, 56)
+    assert assemble(chunks) == text, chunks
+    assert all(chunk == chunk.strip() for chunk, _ in chunks), chunks
+
+
+def test_chunks_round_trip():
+    rng = random.Random(0)
+    for _ in range(500):
+        text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 60)))
+        if rng.random() < 0.2:
+            text = '\n ' + text
+        limit = rng.randint(10, 80)
+        chunks = split_into_chunks(text, limit)
+        assert assemble(chunks) == text, (text, limit, chunks)
+        for chunk, separator in chunks:
+            assert chunk == chunk.strip() and not separator.strip(), (text, limit, chunks)
+            assert len(chunk) <= limit, (text, limit, chunks)
+
+
+if __name__ == "__main__":
+    try:
+        test_separator_before_chunk_is_kept()
+        test_chunks_round_trip()
+        print("✅ Тест завершен успешно!")
+    except AssertionError as e:
+        print(f"❌ Тест не пройден: {e}")
+        import traceback
+        traceback.print_exc()
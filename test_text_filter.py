@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Тест фильтра: наш overlay и окно переводчика отсеиваются, а текст
+переводимой программы, совпавший с переводом или нашими надписями, - нет
+"""
+
+from text_filter import TextFilter
+
+
+def blocks(*texts):
+    return [{'text': text, 'x': 0, 'y': 20 * i, 'width': 100, 'height': 15}
+            for i, text in enumerate(texts)]
+
+
+def test_overlay_text_is_filtered():
+    text_filter = TextFilter()
+    text_filter.set_overlay_blocks([{'text': 'Hello world', 'translated_text': 'Привет мир'}], 'a')
+    kept = text_filter.filter_blocks(blocks('Привет мир', 'Hello world'), 'a')
+    assert [block['text'] for block in kept] == ['Hello world']
+
+
+def test_untranslated_text_is_kept():
+    text_filter = TextFilter()
+    # Пути, код и русский текст переводятся сами в себя и остаются в окне
+    text_filter.set_overlay_blocks([
+        {'text': 'settings.json', 'translated_text': 'settings.json'},
+        {'text': 'Привет всем', 'translated_text': 'Привет всем'},
+    ], 'a')
+    for _ in range(3):
+        kept = text_filter.filter_blocks(blocks('settings.json', 'Привет всем'), 'a')
+        assert len(kept) == 2, kept
+
+
+def test_overlay_keys_are_per_window():
+    text_filter = TextFilter()
+    text_filter.set_overlay_blocks([{'text': 'Hello world', 'translated_text': 'Привет мир'}], 'a')
+    text_filter.set_overlay_blocks([{'text': 'Good morning', 'translated_text': 'Доброе утро'}], 'b')
+    # Окно b показывает свой overlay, но "Привет мир" в окне b - его собственный текст
+    assert len(text_filter.filter_blocks(blocks('Привет мир'), 'b')) == 1
+    assert len(text_filter.filter_blocks(blocks('Привет мир'), 'a')) == 0
+    text_filter.forget_overlay('a')
+    assert len(text_filter.filter_blocks(blocks('Привет мир'), 'a')) == 1
+
+
+def test_app_labels_are_kept_outside_control_window():
+    text_filter = TextFilter()
+    labels = blocks('Start', 'Stop', 'Interval', 'Translator settings')
+    assert len(text_filter.filter_blocks(labels)) == 4
+    # Окно переводчика перекрывает первые два блока
+    kept = text_filter.filter_blocks(labels, chrome_rects=[(-50, -10, 200, 40)])
+    assert [block['text'] for block in kept] == ['Interval', 'Translator settings'], kept
+
+
+def test_user_patterns_apply_everywhere():
+    text_filter = TextFilter(['Advertisement', 're:v\\d+\\.\\d+'])
+    kept = text_filter.filter_blocks(blocks('Advertisement', 'v1.2', 'Start download'))
+    assert [block['text'] for block in kept] == ['Start download'], kept
+
+
+if __name__ == "__main__":
+    try:
+        test_overlay_text_is_filtered()
+        test_untranslated_text_is_kept()
+        test_overlay_keys_are_per_window()
+        test_app_labels_are_kept_outside_control_window()
+        test_user_patterns_apply_everywhere()
+        print("✅ Тест завершен успешно!")
+    except AssertionError as e:
+        print(f"❌ Тест не пройден: {e}")
+        import traceback
+        traceback.print_exc()
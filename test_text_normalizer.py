@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Тест ключей кэша: шум OCR сворачивается, разные тексты не совпадают
+"""
+
+from text_normalizer import normalize_key
+
+# Варианты одного текста, которые должны давать один ключ
+SAME_KEY = [
+    ("Save  changes.", "save changes"),
+    ("Hello, world!", "hello world"),
+    ("lnstall", "Install"),
+    ("Fi1e", "File"),
+    ("c0de", "code"),
+    ("Версия 1.5.", "версия 1.5"),
+    ("Cохранить", "Сохранить"),
+    ("(45%)", "45%"),
+]
+
+# Разные тексты, которые раньше получали один ключ
+DIFFERENT_KEY = [
+    ("Fail", "Fall"),
+    ("Mail", "Mall"),
+    ("FAIL", "FALL"),
+    ("1.5 GB", "15 GB"),
+    ("-5", "5"),
+    ("3:00", "300"),
+    ("no table", "notable"),
+]
+
+
+def test_ocr_noise_is_folded():
+    for first, second in SAME_KEY:
+        assert normalize_key(first) == normalize_key(second), (first, second)
+
+
+def test_different_texts_keep_different_keys():
+    for first, second in DIFFERENT_KEY:
+        assert normalize_key(first) != normalize_key(second), (first, second)
+
+
+if __name__ == "__main__":
+    try:
+        test_ocr_noise_is_folded()
+        test_different_texts_keep_different_keys()
+        print("✅ Тест завершен успешно!")
+    except AssertionError as e:
+        print(f"❌ Тест не пройден: {e}")
+        import traceback
+        traceback.print_exc()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Тест классификатора: скобки и точки с запятой в обычном тексте - не код,
+а строки кода не делятся на участки
+"""
+
+from token_classifier import classify_token, split_language_spans
+
+PROSE = [
+    "Save changes (optional)",
+    "Click [OK] to continue",
+    "Hello world; goodbye",
+    "Press \"Start\" (or Enter) to begin.",
+    "Note: see the manual (page 5).",
+    "Don't press \"Stop until done\" yet",
+]
+
+CODE_LINES = [
+    "def foo(): return 1",
+    "print('hello world')",
+    "for i in range(10):",
+    "if x > 0: print(x)",
+    "class Foo(Base):",
+    "else:",
+    "console.log(\"Hello there\");",
+]
+
+CODE_TOKENS = ["foo();", "a[i]", "f(x)", "==", ";", "&&", "->", "i++)", "obj->field", "<div>"]
+
+
+def test_bracketed_prose_is_language():
+    for token in ["(optional)", "[OK]", "world;", "(see", "manual)."]:
+        assert classify_token(token) == 'language', token
+
+
+def test_prose_is_one_span():
+    for text in PROSE:
+        assert split_language_spans(text) == [(text, True)], text
+
+
+def test_code_is_still_code():
+    for token in CODE_TOKENS:
+        assert classify_token(token) == 'code', token
+    assert split_language_spans("for (i = 0; i < n; i++) {") == [("for (i = 0; i < n; i++) {", False)]
+
+
+def test_code_lines_are_not_split():
+    for text in CODE_LINES:
+        assert split_language_spans(text) == [(text, False)], text
+
+
+def test_no_split_inside_quotes_or_brackets():
+    spans = split_language_spans('Run command("Hello world") now')
+    assert spans == [("Run", True), (' command("Hello world") now', False)], spans
+    spans = split_language_spans("Call foo() to start")
+    assert spans == [("Call", True), (" foo() ", False), ("to start", True)], spans
+
+
+if __name__ == "__main__":
+    try:
+        test_bracketed_prose_is_language()
+        test_prose_is_one_span()
+        test_code_is_still_code()
+        test_code_lines_are_not_split()
+        test_no_split_inside_quotes_or_brackets()
+        print("✅ Тест завершен успешно!")
+    except AssertionError as e:
+        print(f"❌ Тест не пройден: {e}")
+        import traceback
+        traceback.print_exc()
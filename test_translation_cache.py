@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Тест миграций кэша: базы старых версий открываются, записи сохраняются
+"""
+
+import os
+import sqlite3
+import tempfile
+
+from text_normalizer import normalize_key
+from translation_cache import LEGACY_BACKEND, SCHEMA_VERSION, TranslationCache
+
+# Таблица переводов v2 и v3 (v3 отличается только нормализацией ключей)
+V2_TABLE = """
+    CREATE TABLE translations (
+        source_key TEXT NOT NULL,
+        source_lang TEXT NOT NULL,
+        target_lang TEXT NOT NULL,
+        backend TEXT NOT NULL,
+        model TEXT NOT NULL DEFAULT '',
+        source_text TEXT NOT NULL,
+        translated_text TEXT NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (source_key, source_lang, target_lang, backend, model)
+    ) WITHOUT ROWID
+"""
+
+V2_INDEX = """
+    CREATE INDEX idx_translations_any_backend
+    ON translations (source_key, source_lang, target_lang, timestamp, translated_text)
+"""
+
+V4_TABLE = V2_TABLE.replace(
+    "timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,",
+    "timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,\n"
+    "        last_hit DATETIME DEFAULT CURRENT_TIMESTAMP,\n"
+    "        hit_count INTEGER NOT NULL DEFAULT 0,")
+
+ROWS = [
+    ("Hello world", "Привет мир"),
+    ("Download 1.5 GB", "Загрузка 1.5 ГБ"),
+    ("Download 15 GB", "Загрузка 15 ГБ"),
+]
+
+
+def create_v1(conn):
+    conn.execute("""
+        CREATE TABLE translations (
+            source_text TEXT PRIMARY KEY,
+            translated_text TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.executemany("INSERT INTO translations (source_text, translated_text) VALUES (?, ?)", ROWS)
+
+
+def create_v2(conn, version=2):
+    conn.execute(V2_TABLE)
+    conn.execute(V2_INDEX)
+    # Ключи до нормализации v3: пунктуация и пробелы убраны целиком
+    conn.executemany("""
+        INSERT INTO translations
+            (source_key, source_lang, target_lang, backend, source_text, translated_text)
+        VALUES (?, 'en', 'ru', 'Google', ?, ?)
+    """, [(text.lower().replace(' ', '').replace('.', ''), text, translated)
+          for text, translated in ROWS[:2]])
+    conn.execute(f"PRAGMA user_version = {version}")
+
+
+def create_v4(conn):
+    conn.execute(V4_TABLE)
+    conn.execute(V2_INDEX)
+    conn.execute("CREATE INDEX idx_translations_last_hit ON translations (last_hit)")
+    # Старая нормализация сливала "1.5 GB" и "15 GB" в один ключ
+    conn.executemany("""
+        INSERT INTO translations
+            (source_key, source_lang, target_lang, backend, source_text, translated_text,
+             hit_count)
+        VALUES (?, 'en', 'ru', 'Google', ?, ?, 3)
+    """, [(text.lower().replace(' ', '').replace('.', ''), text, translated)
+          for text, translated in ROWS[:2]])
+    conn.execute("PRAGMA user_version = 4")
+
+
+def open_migrated(tmp, create):
+    path = os.path.join(tmp, f"{create.__name__}.sqlite")
+    conn = sqlite3.connect(path)
+    create(conn)
+    conn.commit()
+    conn.close()
+    cache = TranslationCache(path)
+    cache.connect()
+    return cache
+
+
+def check_schema(cache):
+    cur = cache.conn.cursor()
+    assert cur.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    indexes = {row[0] for row in cur.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert 'idx_translations_any_backend' not in indexes, indexes
+    assert 'idx_translations_last_hit' in indexes, indexes
+    for text, _ in ROWS:
+        key = cur.execute("SELECT source_key FROM translations WHERE source_text = ?",
+                          (text,)).fetchone()
+        assert key is None or key[0] == normalize_key(text), (text, key)
+
+
+def test_migrate_v1():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = open_migrated(tmp, create_v1)
+        try:
+            check_schema(cache)
+            for text, translated in ROWS:
+                assert cache.lookup(text, 'auto', 'ru', LEGACY_BACKEND) == (translated, text)
+        finally:
+            cache.close()
+
+
+def test_migrate_v2_and_v3():
+    for version in (2, 3):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = open_migrated(tmp, lambda conn: create_v2(conn, version))
+            try:
+                check_schema(cache)
+                for text, translated in ROWS[:2]:
+                    assert cache.lookup(text, 'en', 'ru', 'Google') == (translated, text)
+            finally:
+                cache.close()
+
+
+def test_migrate_v4_rekeys():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = open_migrated(tmp, create_v4)
+        try:
+            check_schema(cache)
+            for text, translated in ROWS[:2]:
+                assert cache.lookup(text, 'en', 'ru', 'Google') == (translated, text)
+            # Новый ключ различает "1.5 GB" и "15 GB"
+            assert cache.lookup("Download 15 GB", 'en', 'ru', 'Google') is None
+            hits = cache.conn.execute("SELECT SUM(hit_count) FROM translations").fetchone()[0]
+            assert hits == 6, hits
+        finally:
+            cache.close()
+
+
+if __name__ == "__main__":
+    try:
+        test_migrate_v1()
+        test_migrate_v2_and_v3()
+        test_migrate_v4_rekeys()
+        print("✅ Тест завершен успешно!")
+    except AssertionError as e:
+        print(f"❌ Тест не пройден: {e}")
+        import traceback
+        traceback.print_exc()
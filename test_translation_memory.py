@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Тест памяти переводов: ошибки OCR находят перевод, другой смысл - нет
+"""
+
+import os
+import tempfile
+
+from translation_engine import TranslationEngine
+
+CACHED = {
+    "Download 45% complete, please wait a moment": "Загрузка 45% завершена, подождите",
+    "Connecting to server 192.168.1.10, please wait": "Подключение к серверу 192.168.1.10",
+    "The file was not saved because the disk is full": "Файл не сохранен: диск заполнен",
+    "Download finished, all files were transferred": "Загрузка завершена, все файлы переданы",
+    "Connection to the server was not established": "Соединение с сервером не установлено",
+    "The operation completed successfully": "Операция успешно завершена",
+    "Please make sure that the configuration file is readable before continuing the installation":
+        "Перед продолжением установки убедитесь, что файл настроек доступен для чтения",
+}
+
+# Похожи по триграммам (Дайс > 0.9), но переводятся иначе
+DIFFERENT_MEANING = [
+    "Download 46% complete, please wait a moment",
+    "Connecting to server 192.168.7.10, please wait",
+    "Connecting to server 192.168.1.18, please wait",
+    "The file was saved because the disk is full",
+    "Upload finished, all files were transferred",
+    "Connection to the server was established",
+    "The operation completed unsuccessfully",
+]
+
+
+def lookup(engine, text):
+    return engine._lookup_cached(text, "Google")
+
+
+def with_engine(test, **kwargs):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = TranslationEngine(os.path.join(tmp, "cache.sqlite"), **kwargs)
+        try:
+            for text, translated in CACHED.items():
+                engine._store_translation(text, translated, "Google")
+            test(engine)
+        finally:
+            engine.close()
+
+
+def test_fuzzy_match_rejects_different_meaning():
+    def check(engine):
+        for text in DIFFERENT_MEANING:
+            assert lookup(engine, text) is None, text
+
+    # Даже с мягким порогом слова и числа должны совпадать
+    with_engine(check, fuzzy_similarity=0.9)
+    with_engine(check)
+
+
+def test_fuzzy_match_accepts_ocr_errors():
+    source = "Please make sure that the configuration file is readable before continuing the installation"
+
+    def check(engine):
+        noisy = source.replace("configuration", "configuratiom")
+        assert lookup(engine, noisy) == CACHED[source]
+
+    with_engine(check)
+
+
+if __name__ == "__main__":
+    try:
+        test_fuzzy_match_rejects_different_meaning()
+        test_fuzzy_match_accepts_ocr_errors()
+        print("✅ Тест завершен успешно!")
+    except AssertionError as e:
+        print(f"❌ Тест не пройден: {e}")
+        import traceback
+        traceback.print_exc()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Разбиение длинного текста на части под ограничение бэкенда.
+
+Текст делится по строкам, длинные строки - по предложениям, слишком
+длинные предложения - по словам. Части собираются в фрагменты не длиннее
+лимита. Границы фрагментов зависят от содержимого (хэш предложения), а не
+только от длины накопленного текста: правка одной строки меняет один
+фрагмент, и остальные берутся из кэша.
+"""
+
+import re
+import zlib
+
+# Единица текста с разделителем, который шел после нее
+_LINE_RE = re.compile(r'[^\n]*(?:\n\s*|$)')
+# Предложение: до конечного знака и пробелов после него
+_SENTENCE_RE = re.compile(r'.*?(?:[.!?…。！？]+[\"\'»”)\]]*(?:\s+|$)|$)', re.S)
+# Пробелы в начале текста прилипают к первому слову
+_WORD_RE = re.compile(r'\s*\S+\s*|\s+')
+
+
+def _units(text, max_chars):
+    """Разбивает текст на части не длиннее max_chars, сохраняя разделители"""
+    for line in _LINE_RE.findall(text):
+        if not line:
+            continue
+        if len(line) <= max_chars:
+            yield line
+            continue
+        for sentence in _SENTENCE_RE.findall(line):
+            if not sentence:
+                continue
+            if len(sentence) <= max_chars:
+                yield sentence
+                continue
+            piece = ""
+            for word in _WORD_RE.findall(sentence):
+                # Слово длиннее лимита (например, base64) режем как есть
+                while len(word) > max_chars:
+                    if piece:
+                        yield piece
+                        piece = ""
+                    yield word[:max_chars]
+                    word = word[max_chars:]
+                if len(piece) + len(word) > max_chars:
+                    yield piece
+                    piece = ""
+                piece += word
+            if piece:
+                yield piece
+
+
+def split_into_chunks(text, max_chars, boundary_every=4):
+    """Делит текст на фрагменты для перевода
+
+    Возвращает список (фрагмент, разделитель): фрагмент без пробелов по краям
+    и пробельные символы, стоявшие после него, чтобы собрать перевод обратно.
+    Пробелы в начале текста попадают в первый элемент с пустым фрагментом.
+    После части, чей хэш делится на boundary_every, фрагмент закрывается,
+    если он уже занимает четверть лимита.
+    """
+    chunks = []
+    current = ""
+
+    def close():
+        body = current.strip()
+        # Пробелы перед фрагментом (например, перевод строки после закрытой
+        # границы) переходят в разделитель предыдущего фрагмента
+        lead = current[:len(current) - len(current.lstrip())] if body else current
+        if lead:
+            if chunks:
+                chunks[-1] = (chunks[-1][0], chunks[-1][1] + lead)
+            else:
+                chunks.append(("", lead))
+        if body:
+            chunks.append((body, current[len(current.rstrip()):]))
+
+    for unit in _units(text, max_chars):
+        # Пробелы между current и unit окажутся внутри фрагмента
+        if current and len(current) + len(unit.rstrip()) > max_chars:
+            close()
+            current = ""
+        current += unit
+        if (len(current) >= max_chars // 4
+                and zlib.crc32(unit.strip().encode('utf-8')) % boundary_every == 0):
+            close()
+            current = ""
+    if current:
+        close()
+    return chunks
+
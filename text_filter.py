@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Фильтр распознанного текста перед переводом.
+
+Надписи окна самого переводчика и текст наших overlay не нужно отправлять
+переводчику. Надписи переводчика ("Старт", "Интервал"...) отсеиваются только
+там, где его окно перекрывает захваченное: у переводимой программы могут
+быть свои кнопки "Start" и "Stop". Все шаблоны собираются в одно
+регулярное выражение, поэтому каждая строка проверяется за один проход,
+а текст overlay сравнивается по нормализованному ключу через множество.
+
+Свои шаблоны можно добавить в файл config/text_filter.txt: по одному на
+строку, без учета регистра; строки с префиксом "re:" - регулярные
+выражения, строки с "#" - комментарии. Они действуют во всем окне.
+"""
+
+import os
+import re
+
+from text_normalizer import normalize_key
+
+# Файл с пользовательскими шаблонами
+USER_PATTERNS_PATH = "config/text_filter.txt"
+
+# Надписи интерфейса Overlay Translator
+UI_PATTERNS = [
+    'выбрать окно', 'добавить окно', 'обновить перевод', 'старт', 'стоп',
+    'интервал', 'переводчик', 'компактный вид', 'прозрачность',
+    'сбросить кэш', 'окно:', 'перевод:', 'распознанный текст:',
+    'overlay translator', 'select window', 'add window', 'update translation',
+    'start', 'stop', 'interval', 'translator', 'compact view',
+    'transparency', 'clear cache', 'window:', 'translation:',
+    'recognized text:',
+]
+
+# Технические строки, которые пропускает split_into_sentences
+TECHNICAL_PATTERNS = ['debug', 'error', 'http', 'api', 'overlay', 'translator']
+
+_LETTER_RE = re.compile(r'[^\W\d_]')
+
+
+def load_user_patterns(path=USER_PATTERNS_PATH):
+    """Читает пользовательские шаблоны; нет файла - нет шаблонов"""
+    if not path or not os.path.exists(path):
+        return []
+    patterns = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                patterns.append(line)
+    print(f"[DEBUG] Загружено {len(patterns)} шаблонов фильтра из {path}")
+    return patterns
+
+
+def _compile(patterns):
+    """Собирает шаблоны в одно регулярное выражение (None, если шаблонов нет)"""
+    alternatives = []
+    # Длинные шаблоны раньше коротких, чтобы "clear cache" не съел "clear"
+    for pattern in sorted(set(patterns), key=len, reverse=True):
+        if pattern.startswith('re:'):
+            alternatives.append(f"(?:{pattern[3:]})")
+        else:
+            alternatives.append(re.escape(pattern))
+    if not alternatives:
+        return None
+    return re.compile('|'.join(alternatives), re.IGNORECASE)
+
+
+def _overlaps(block, rect):
+    """Пересекается ли блок OCR с прямоугольником (x, y, w, h)"""
+    x, y, w, h = rect
+    return (block['x'] < x + w and x < block['x'] + block['width']
+            and block['y'] < y + h and y < block['y'] + block['height'])
+
+
+class TextFilter:
+    """Отсеивает надписи интерфейса, наш overlay и строки без слов
+
+    patterns действуют на весь текст, chrome_patterns - только на блоки
+    внутри окон переводчика (chrome_rects в filter_blocks).
+    """
+
+    def __init__(self, patterns=(), min_length=3, chrome_patterns=UI_PATTERNS):
+        self.patterns = list(patterns)
+        self.chrome_patterns = list(chrome_patterns)
+        self.min_length = min_length
+        self._regex = _compile(self.patterns)
+        self._chrome_regex = _compile(self.patterns + self.chrome_patterns)
+        # Ключи текста, который сейчас показан в overlay, по окнам
+        self._overlay_keys = {}
+
+    @classmethod
+    def from_user_config(cls, path=USER_PATTERNS_PATH, **kwargs):
+        """Шаблоны пользователя плюс встроенные надписи переводчика"""
+        return cls(load_user_patterns(path), **kwargs)
+
+    def with_patterns(self, patterns):
+        """Новый фильтр с дополнительными общими шаблонами"""
+        return TextFilter(self.patterns + list(patterns), self.min_length,
+                          self.chrome_patterns)
+
+    def set_overlay_blocks(self, translated_blocks, owner=None):
+        """Запоминает текст overlay окна owner, чтобы не переводить его, попав в захват
+
+        Перевод, совпавший с исходным текстом (код, пути, уже русский текст),
+        остается и в самом окне, поэтому такой блок не запоминается.
+        """
+        keys = set()
+        for block in translated_blocks:
+            translated = block.get('translated_text')
+            if not translated:
+                continue
+            key = normalize_key(translated)
+            if key != normalize_key(block.get('text') or ''):
+                keys.add(key)
+        if keys:
+            self._overlay_keys[owner] = frozenset(keys)
+        else:
+            self._overlay_keys.pop(owner, None)
+
+    def forget_overlay(self, owner=None):
+        """Забывает текст overlay окна, которое больше не переводится"""
+        self._overlay_keys.pop(owner, None)
+
+    def _is_meaningful(self, text):
+        """Достаточно длинная строка хотя бы с одной буквой"""
+        return len(text) >= self.min_length and _LETTER_RE.search(text) is not None
+
+    def contains_pattern(self, text):
+        """Есть ли в строке хотя бы один шаблон"""
+        return self._regex is not None and self._regex.search(text) is not None
+
+    def is_chrome(self, text, in_chrome=False):
+        """Состоит ли текст только из надписей интерфейса и знаков
+
+        in_chrome - текст внутри окна переводчика: учитываются и его надписи.
+        """
+        regex = self._chrome_regex if in_chrome else self._regex
+        if regex is None:
+            return False
+        return _LETTER_RE.search(regex.sub(' ', text)) is None
+
+    def filter_lines(self, text):
+        """Строки текста без шаблонов, коротких и небуквенных строк"""
+        lines = []
+        for line in text.split('\n'):
+            line = line.strip()
+            if self._is_meaningful(line) and not self.contains_pattern(line):
+                lines.append(line)
+        return lines
+
+    def filter_blocks(self, text_blocks, owner=None, chrome_rects=()):
+        """Блоки OCR окна owner, которые стоит переводить
+
+        chrome_rects - прямоугольники (x, y, w, h) окон переводчика в
+        координатах блоков; надписи переводчика ищутся только в них.
+        """
+        overlay_keys = self._overlay_keys.get(owner, ())
+        kept = []
+        for block in text_blocks:
+            text = (block.get('text') or '').strip()
+            if not self._is_meaningful(text):
+                continue
+            in_chrome = any(_overlaps(block, rect) for rect in chrome_rects)
+            if self.is_chrome(text, in_chrome):
+                continue
+            if overlay_keys and normalize_key(text) in overlay_keys:
+                continue
+            kept.append(block)
+        dropped = len(text_blocks) - len(kept)
+        if dropped:
+            print(f"[DEBUG] Фильтр отбросил {dropped} из {len(text_blocks)} блоков")
+        return kept
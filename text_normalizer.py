@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Нормализация OCR текста для ключей кэша переводов.
+
+Один и тот же текст на экране от кадра к кадру распознается по-разному:
+лишняя пунктуация, l/I/1 внутри слов, двойные пробелы. Ключ кэша
+строится так, чтобы все такие варианты совпадали, но числа, время и
+версии сохраняют свою пунктуацию. Исходный текст при этом
+не меняется и используется для отображения и перевода.
+"""
+
+import re
+import unicodedata
+
+# Типографские символы, которые OCR выдает вперемешку с ASCII
+_PUNCT_TRANSLATION = str.maketrans({
+    '‘': "'", '’': "'", '‚': "'", '‛': "'",
+    '“': '"', '”': '"', '„': '"', '«': '"', '»': '"',
+    '‐': '-', '‑': '-', '‒': '-', '–': '-', '—': '-', '−': '-',
+    '…': '...',
+})
+
+# Символы, которые OCR путает внутри слов: заглавная I и | вместо l,
+# цифры 0 и 1 между буквами. Строчная i не трогается: "Fail" и "Fall" разные
+_CONFUSABLE_RE = re.compile(r'(?<=[^\W\d_])[01|](?=[^\W\d_])|I(?=[a-z])|(?<=[a-z])I')
+_CONFUSABLES = {'0': 'o', '1': 'l', '|': 'l', 'I': 'l'}
+
+# Кириллические и латинские двойники, которые путает OCR с lang='rus+eng'
+_CYRILLIC_TO_LATIN = str.maketrans('авекмнорстухі', 'abekmhopctyxi')
+_LATIN_TO_CYRILLIC = str.maketrans('abekmhopctyxi', 'авекмнорстухі')
+
+_WHITESPACE_RE = re.compile(r'\s+')
+# Обрамление токена с цифрами: кавычки, скобки и конечная пунктуация
+_NUMBER_EDGE_CHARS = '"\'()[]{}<>,;!?'
+_NUMBER_TRAILING_CHARS = _NUMBER_EDGE_CHARS + '.:'
+_CYRILLIC_RE = re.compile(r'[Ѐ-ӿ]')
+_LATIN_RE = re.compile(r'[a-z]')
+
+
+def clean_text(text):
+    """Безопасная очистка текста перед отправкой переводчику"""
+    text = unicodedata.normalize('NFKC', text).translate(_PUNCT_TRANSLATION)
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+def _fold_token(token):
+    """Сворачивает шум OCR внутри одного слова"""
+    # Путаемые символы сворачиваем до casefold, пока видна заглавная I
+    token = _CONFUSABLE_RE.sub(lambda m: _CONFUSABLES[m.group()], token).casefold()
+
+    if any(c.isdigit() for c in token):
+        # Числа, версии, время и адреса: "1.5" и "15", "-5" и "5" - разные значения,
+        # поэтому пунктуация внутри остается, снимается только обрамление
+        return token.lstrip(_NUMBER_EDGE_CHARS).rstrip(_NUMBER_TRAILING_CHARS)
+
+    # В словах пунктуация в ключ не попадает
+    token = ''.join(c for c in token if not unicodedata.category(c).startswith('P'))
+
+    cyrillic = len(_CYRILLIC_RE.findall(token))
+    latin = len(_LATIN_RE.findall(token))
+    if cyrillic and latin:
+        # Слово со смешанными алфавитами приводим к преобладающему
+        if cyrillic >= latin:
+            token = token.translate(_LATIN_TO_CYRILLIC)
+        else:
+            token = token.translate(_CYRILLIC_TO_LATIN)
+    return token
+
+
+def normalize_key(text):
+    """Строит ключ кэша, устойчивый к шуму OCR"""
+    # Пробелы схлопываются, но не удаляются: "no table" и "notable" - разные ключи
+    tokens = (_fold_token(token) for token in clean_text(text).split())
+    return ' '.join(token for token in tokens if token)
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Распознавание непереводимых токенов: чисел, времени, путей, адресов, кода.
+
+Многие блоки на экране - это время, идентификаторы, пути к файлам или
+строки кода. Переводчик вернет их без изменений или испортит, а запрос
+и место в кэше будут потрачены. Классификатор делит текст на участки
+естественного языка, которые нужно переводить, и участки, которые
+остаются как есть.
+"""
+
+import re
+from itertools import groupby
+
+# Токены, которые разрывают фразу: их нельзя отдавать переводчику
+_BREAKING_RE = re.compile(r"""
+    (?:https?|ftp)://\S+                              # URL
+  | www\.\S+\.\S+
+  | [\w.+-]+@[\w-]+(?:\.[\w-]+)+                      # e-mail
+  | (?:[A-Za-z]:\\|\\\\|~/|\.{1,2}/|/)\S*             # путь
+  | [^\s/]+/\S*\.\w{1,5}                               # dir/file.ext
+  | [0-9a-fA-F]{8}-(?:[0-9a-fA-F]{4}-){3}[0-9a-fA-F]{12}  # UUID
+  | 0[xX][0-9a-fA-F]+                                 # hex
+  | \#[0-9a-fA-F]{3,8}
+  | (?=[a-fA-F]*\d)[0-9a-fA-F]{8,}                    # хэш, идентификатор
+  | \w*[_$]\w+                                        # snake_case, $var
+  | [a-z]+[A-Z]\w*                                    # camelCase
+  | [A-Za-z_]\w+(?:\.[A-Za-z_]\w+)+(?:\(.*\))?        # module.attr, file.ext
+  | \S*(?:[(){}\[\];=<>|&^~`\\]|::|->|\+\+|--)\S*     # операторы и скобки
+""", re.VERBOSE)
+
+# Токены без букв: внутри фразы не мешают, отдельно - не переводятся
+_NEUTRAL_RE = re.compile(r"""
+    \d{4}-\d{2}-\d{2}(?:[T ]\d{1,2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?)?
+  | \d{1,2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:[AaPp][Mm])?   # время
+  | \d{1,2}[./]\d{1,2}[./]\d{2,4}                     # дата
+  | [vV]?\d+(?:\.\d+){1,3}                            # версия
+  | [-+±]?[\d.,]*\d(?:%|[kKMGT]i?B|ms|s|px|fps)?       # число
+  | [^\w\s]+                                          # знаки
+""", re.VERBOSE)
+
+# Отдельно стоящие операторы и скобки кода
+_OPERATOR_RE = re.compile(r'[=!<>+\-*/%]?=|[{};]+|&&|\|\||=>|->')
+
+# Знаки препинания и кавычки на краях слова, которые не меняют его тип
+_TRAILING_PUNCTUATION = '.,;:!?"\'»”'
+_LEADING_PUNCTUATION = '"\'«“'
+# Скобки, в которые берут слова в обычном тексте: "(optional)", "[OK]"
+_BRACKET_PAIRS = {'(': ')', '[': ']'}
+
+_TOKEN_RE = re.compile(r'\S+|\s+')
+_WORD_RE = re.compile(r'[^\W\d_]{2,}')
+
+# Если доля кода не меньше этой, блок считается кодом целиком
+CODE_TOKEN_SHARE = 0.4
+
+# Строка, начинающаяся с такого слова и содержащая код ("for i in range(10):"),
+# - код целиком
+_CODE_KEYWORDS = frozenset({
+    'def', 'class', 'return', 'import', 'from', 'for', 'while', 'if', 'elif',
+    'else', 'try', 'except', 'finally', 'with', 'lambda', 'yield', 'function',
+    'var', 'let', 'const', 'fn', 'func'})
+# Заголовки блоков, которые и без скобок кончаются двоеточием: "else:", "try:"
+_BLOCK_KEYWORDS = frozenset({'def', 'class', 'elif', 'else', 'try', 'except', 'finally'})
+# Строка - один вызов: print('hello world'), console.log("Hi");
+_CALL_LINE_RE = re.compile(r'[A-Za-z_][\w.]*\(.*\)[;:]?')
+
+# Скобки и кавычки, внутри которых текст не делится на участки
+_OPENERS = '([{«“'
+_CLOSERS = ')]}»”'
+_QUOTES = '"\''
+
+
+def _strip_edges(token):
+    """Токен без пунктуации и скобок текста вокруг него
+
+    Скобка снимается, только если у нее нет пары внутри токена: в "(optional)"
+    и "world;" остается слово, а в "foo();" - вызов "foo()".
+    """
+    core = token
+    while core:
+        stripped = core.rstrip(_TRAILING_PUNCTUATION).lstrip(_LEADING_PUNCTUATION)
+        opener, closer = stripped[:1], stripped[-1:]
+        if opener in _BRACKET_PAIRS and closer == _BRACKET_PAIRS[opener]:
+            stripped = stripped[1:-1]
+        elif opener in _BRACKET_PAIRS and _BRACKET_PAIRS[opener] not in stripped:
+            stripped = stripped[1:]
+        elif closer in _BRACKET_PAIRS.values() and not any(
+                o in stripped for o, c in _BRACKET_PAIRS.items() if c == closer):
+            stripped = stripped[:-1]
+        if stripped == core:
+            break
+        core = stripped
+    return core or token
+
+
+def classify_token(token):
+    """Тип токена: 'language', 'neutral' (числа, время) или 'code'"""
+    if _OPERATOR_RE.fullmatch(token):
+        return 'code'
+    core = _strip_edges(token)
+    if _NEUTRAL_RE.fullmatch(core):
+        return 'neutral'
+    if _BREAKING_RE.fullmatch(core):
+        return 'code'
+    return 'language'
+
+
+def _is_code_line(text, kinds):
+    """Строка кода: вызов целиком или ключевое слово со скобками, кодом или двоеточием"""
+    line = text.strip()
+    if _CALL_LINE_RE.fullmatch(line):
+        return True
+    first = line.split(None, 1)[0].rstrip(':') if line else ''
+    if first not in _CODE_KEYWORDS:
+        return False
+    return 'code' in kinds or (first in _BLOCK_KEYWORDS and line.endswith(':'))
+
+
+def _split_points(tokens):
+    """Можно ли разделить текст перед каждым токеном: не внутри скобок и кавычек
+
+    Апостроф внутри слова ("don't") кавычкой не считается.
+    """
+    allowed = []
+    depth = 0
+    quote = None
+    for token in tokens:
+        allowed.append(depth == 0 and quote is None)
+        for position, char in enumerate(token):
+            if quote is not None:
+                if char == quote:
+                    quote = None
+            elif char in _QUOTES:
+                inside_word = (0 < position < len(token) - 1 and token[position - 1].isalpha()
+                               and token[position + 1].isalpha())
+                if not inside_word:
+                    quote = char
+            elif char in _OPENERS:
+                depth += 1
+            elif char in _CLOSERS:
+                depth = max(0, depth - 1)
+    return allowed
+
+
+def fixed_tokens(text):
+    """Числа, время, версии, адреса и код текста, в порядке появления
+
+    Переводчик переносит их в перевод как есть, поэтому перевод похожей
+    фразы подходит, только если эти токены совпадают.
+    """
+    tokens = []
+    for token in text.split():
+        if not any(c.isalnum() for c in token):
+            continue  # отдельные знаки препинания
+        if any(c.isdigit() for c in token) or classify_token(token) != 'language':
+            tokens.append(_strip_edges(token))
+    return tokens
+
+
+def split_language_spans(text):
+    """Делит текст на участки (текст, переводить ли), покрывающие его целиком
+
+    Участок естественного языка тянется от первого до последнего слова,
+    включая числа и знаки между словами; пути, адреса и код его разрывают.
+    Внутри скобок и кавычек текст не делится: если там есть код, весь
+    фрагмент остается как есть. Если переводить нечего, все участки
+    помечены False.
+    """
+    tokens = _TOKEN_RE.findall(text)
+    kinds = [None if token.isspace() else classify_token(token) for token in tokens]
+    if _is_code_line(text, kinds):
+        return [(text, False)]
+    # Доля кода среди кода и настоящих слов; однобуквенные переменные не считаются
+    code = sum(kind == 'code' for kind in kinds)
+    words = sum(kind == 'language' and _WORD_RE.search(token) is not None
+                for token, kind in zip(tokens, kinds))
+    # Один оператор во фразе ("Score: 100 - 20 = 80") еще не делает ее кодом
+    if code and (code >= 2 or not words) and code / (code + words) >= CODE_TOKEN_SHARE:
+        return [(text, False)]
+
+    # Токен входит в участок языка, если между ним и словами нет кода
+    in_language = [False] * len(tokens)
+    previous_word = None
+    for index, kind in enumerate(kinds):
+        if kind == 'code':
+            previous_word = None
+        elif kind == 'language':
+            first = index if previous_word is None else previous_word
+            for position in range(first, index + 1):
+                in_language[position] = True
+            previous_word = index
+
+    # Граница внутри скобок или кавычек сливает соседние участки в один
+    allowed = _split_points(tokens)
+    groups = []  # [текст, есть ли слова участка, есть ли код]
+    position = 0
+    for is_language, group in groupby(in_language):
+        length = len(list(group))
+        segment = ''.join(tokens[position:position + length])
+        has_code = 'code' in kinds[position:position + length]
+        if groups and not allowed[position]:
+            groups[-1][0] += segment
+            groups[-1][1] = groups[-1][1] or is_language
+            groups[-1][2] = groups[-1][2] or has_code
+        else:
+            groups.append([segment, is_language, has_code])
+        position += length
+
+    segments = []
+    for segment, is_language, has_code in groups:
+        # Участок без настоящих слов ("x", "a") переводить незачем
+        is_language = is_language and not has_code and _WORD_RE.search(segment) is not None
+        if segments and segments[-1][1] == is_language:
+            segments[-1] = (segments[-1][0] + segment, is_language)
+        else:
+            segments.append((segment, is_language))
+    return segments
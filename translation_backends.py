@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Бэкенды перевода и их реестр.
+
+Каждый бэкенд описывает свои возможности (размер пакета, параллельность,
+ограничения частоты, потоковую выдачу, стоимость), а TranslationEngine
+планирует запросы по этим свойствам. Новый бэкенд достаточно объявить
+с декоратором @register_backend - движок и интерфейс подхватят его сами.
+"""
+
+import json
+import re
+import threading
+import time
+
+import requests
+
+# Названия языков для промптов LLM
+LANGUAGE_NAMES = {
+    'ru': 'Russian',
+    'en': 'English',
+    'de': 'German',
+    'fr': 'French',
+    'es': 'Spanish',
+    'uk': 'Ukrainian',
+    'zh-CN': 'Chinese',
+    'ja': 'Japanese',
+}
+
+# Постоянный системный промпт: одинаковый префикс позволяет Ollama
+# переиспользовать уже посчитанный KV-кэш между запросами
+OLLAMA_SYSTEM_PROMPT = ("You are a translation engine. Translate the user's text to {target}. "
+                        "Reply with the translation only, without comments or quotes.")
+
+# Промпт для пакетного перевода: по строке на блок, с сохранением нумерации
+OLLAMA_BATCH_SYSTEM_PROMPT = ("You are a translation engine. Translate each numbered line to {target}. "
+                              "Reply with exactly one line per input line, in the same order, "
+                              "formatted as '<number>. <translation>', without comments.")
+
+# Строка ответа вида "3. текст", "3) текст", "**3.** текст"
+_NUMBERED_LINE_RE = re.compile(r'^\s*[*#>\-]*\s*\(?(\d+)\s*[.):\]]\s*\**\s*(.*?)\s*$')
+
+# Зарегистрированные бэкенды в порядке объявления: имя -> класс
+_BACKENDS = {}
+
+
+def register_backend(cls):
+    """Декоратор: добавляет класс бэкенда в реестр под его именем"""
+    if not cls.name:
+        raise ValueError(f"У бэкенда {cls.__name__} не задано имя")
+    _BACKENDS[cls.name] = cls
+    return cls
+
+
+def available_backends():
+    """Имена зарегистрированных бэкендов"""
+    return list(_BACKENDS)
+
+
+def create_backends():
+    """Создает по экземпляру каждого зарегистрированного бэкенда"""
+    return {name: cls() for name, cls in _BACKENDS.items()}
+
+
+class TranslatorBackend:
+    """Базовый класс бэкенда перевода"""
+
+    # Имя, под которым бэкенд виден в интерфейсе и в ключе кэша
+    name = None
+    # Сколько блоков помещается в один запрос и сколько в нем символов
+    max_batch_size = 1
+    max_request_chars = 5000
+    # Сколько запросов можно выполнять одновременно
+    max_concurrency = 1
+    # Ограничения частоты: запросов и символов в секунду (None - без ограничения)
+    requests_per_second = None
+    chars_per_second = None
+    # Отдает ли бэкенд перевод по частям
+    supports_streaming = False
+    # Условная стоимость тысячи символов (0 - бесплатно)
+    cost_per_1k_chars = 0.0
+
+    @property
+    def model(self):
+        """Модель, которой переводит бэкенд (часть ключа кэша)"""
+        return ""
+
+    def translate(self, text, source_lang, target_lang, on_partial=None):
+        """Переводит одну строку; ошибки возвращаются строкой '[Ошибка ...]'"""
+        raise NotImplementedError
+
+    def translate_batch(self, texts, source_lang, target_lang, on_partial=None):
+        """Переводит несколько строк
+
+        Возвращает список той же длины; None на месте строки, которую нужно
+        перевести отдельно. on_partial(position, text) получает частичные
+        переводы. По умолчанию строки переводятся по одной.
+        """
+        results = []
+        for position, text in enumerate(texts):
+            text_partial = None
+            if on_partial:
+                text_partial = lambda partial, position=position: on_partial(position, partial)
+            results.append(self.translate(text, source_lang, target_lang, text_partial))
+        return results
+
+    def warm_up_async(self, force=False):
+        """Готовит бэкенд к работе в фоне"""
+
+    def set_keep_warm(self, active):
+        """Включает или выключает удержание бэкенда в готовности"""
+
+
+@register_backend
+class OllamaBackend(TranslatorBackend):
+    """Локальная LLM через Ollama"""
+
+    name = "Ollama"
+    max_batch_size = 40
+    max_request_chars = 4000
+    # Локальная модель генерирует по одному запросу за раз
+    max_concurrency = 1
+    supports_streaming = True
+
+    def __init__(self, url="http://localhost:11434", model="llama3"):
+        self.url = url
+        self.model_name = model
+        # Сколько Ollama держит модель в памяти после запроса (None - по умолчанию сервера)
+        self.keep_alive = "30m"
+        # Как часто продлевать загрузку модели, если запросов не было
+        self.refresh_interval = 600
+        self._last_used = 0.0
+        self._warmup_lock = threading.Lock()
+        self._warmup_running = False
+
+    @property
+    def model(self):
+        return self.model_name
+
+    def _payload(self, prompt, target_lang, system_prompt=OLLAMA_SYSTEM_PROMPT, **extra):
+        """Собирает тело запроса к /api/generate"""
+        target = LANGUAGE_NAMES.get(target_lang, target_lang)
+        payload = {
+            "model": self.model_name,
+            "system": system_prompt.format(target=target),
+            "prompt": prompt,
+        }
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        payload.update(extra)
+        return payload
+
+    def _stream(self, payload):
+        """Выполняет потоковый запрос и отдает токены ответа"""
+        # Таймаут чтения действует между токенами, а не на всю генерацию
+        r = requests.post(f"{self.url}/api/generate", json=payload,
+                          stream=True, timeout=(3, 30))
+        r.raise_for_status()
+        # chunk_size=None: строки отдаются сразу по приходу, без буферизации
+        for line in r.iter_lines(chunk_size=None):
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get("error"):
+                raise RuntimeError(chunk["error"])
+            token = chunk.get("response", "")
+            if token:
+                yield token
+            if chunk.get("done"):
+                break
+        self._last_used = time.time()
+
+    def warm_up(self, target_lang="ru"):
+        """Загружает модель Ollama в память до первого перевода"""
+        started = time.time()
+        try:
+            # Пустой промпт только загружает модель; загрузка бывает долгой
+            r = requests.post(f"{self.url}/api/generate",
+                              json=self._payload("", target_lang, stream=False),
+                              timeout=(3, 120))
+            r.raise_for_status()
+            self._last_used = time.time()
+            print(f"[DEBUG] Модель Ollama {self.model_name} загружена за {time.time() - started:.1f}с")
+            return True
+        except requests.exceptions.RequestException as e:
+            print(f"[DEBUG] Не удалось прогреть Ollama: {e}")
+            return False
+
+    def warm_up_async(self, force=False):
+        """Прогревает модель в фоне, если она могла быть выгружена"""
+        with self._warmup_lock:
+            if self._warmup_running:
+                return
+            if not force and time.time() - self._last_used < self.refresh_interval:
+                return
+            self._warmup_running = True
+
+        def run():
+            try:
+                self.warm_up()
+            finally:
+                with self._warmup_lock:
+                    self._warmup_running = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def set_keep_warm(self, active):
+        """Пока идет автоперевод, Ollama держит модель в памяти"""
+        self.keep_alive = "30m" if active else None
+
+    def translate(self, text, source_lang, target_lang, on_partial=None):
+        """Переводит текст, читая ответ потоком NDJSON"""
+        try:
+            parts = []
+            for token in self._stream(self._payload(text, target_lang, stream=True)):
+                parts.append(token)
+                if on_partial:
+                    on_partial(''.join(parts))
+
+            translated = ''.join(parts).strip()
+            print(f"[DEBUG] Ollama: '{text[:50]}...' -> '{translated[:50]}...'")
+            return translated
+
+        except requests.exceptions.ConnectionError:
+            return "[Ошибка: Ollama сервер недоступен. Запустите 'ollama serve' или выберите Google Translate]"
+        except Exception as e:
+            return f"[Ошибка Ollama: {e}]"
+
+    def translate_batch(self, texts, source_lang, target_lang, on_partial=None):
+        """Переводит несколько строк одной генерацией с нумерованным ответом"""
+        if len(texts) == 1:
+            return super().translate_batch(texts, source_lang, target_lang, on_partial)
+
+        prompt = '\n'.join(f"{i}. {text}" for i, text in enumerate(texts, 1))
+        payload = self._payload(prompt, target_lang, OLLAMA_BATCH_SYSTEM_PROMPT, stream=True)
+        try:
+            output = ""
+            for token in self._stream(payload):
+                output += token
+                if on_partial:
+                    # Показываем строку, которая сейчас генерируется
+                    match = _NUMBERED_LINE_RE.match(output.rsplit('\n', 1)[-1])
+                    if match and 1 <= int(match.group(1)) <= len(texts) and match.group(2):
+                        on_partial(int(match.group(1)) - 1, match.group(2))
+
+            translations = parse_numbered_lines(output, len(texts))
+            parsed = sum(1 for t in translations if t is not None)
+            print(f"[DEBUG] Ollama пакет: {parsed}/{len(texts)} строк разобрано")
+            return translations
+
+        except requests.exceptions.ConnectionError:
+            return ["[Ошибка: Ollama сервер недоступен. Запустите 'ollama serve' или выберите Google Translate]"] * len(texts)
+        except Exception as e:
+            return [f"[Ошибка Ollama: {e}]"] * len(texts)
+
+
+def parse_numbered_lines(output, count):
+    """Раскладывает нумерованный ответ модели обратно по строкам"""
+    lines = [line for line in output.strip().strip('`').splitlines() if line.strip()]
+    translations = [None] * count
+    for line in lines:
+        match = _NUMBERED_LINE_RE.match(line)
+        if not match:
+            continue
+        index = int(match.group(1)) - 1
+        if 0 <= index < count and translations[index] is None and match.group(2):
+            translations[index] = match.group(2)
+
+    # Модель потеряла нумерацию, но строк ровно столько же: берем по порядку
+    if all(t is None for t in translations) and len(lines) == count:
+        translations = [line.strip() for line in lines]
+    return translations
+
+
+@register_backend
+class GoogleBackend(TranslatorBackend):
+    """Бесплатный веб-API Google Translate"""
+
+    name = "Google"
+    max_request_chars = 5000
+    # Запросы независимы, их можно выполнять параллельно
+    max_concurrency = 4
+    # Бесплатный API отвечает HTTP 429 при частом опросе с нескольких машин
+    requests_per_second = 2.0
+    chars_per_second = 1500
+
+    def translate(self, text, source_lang, target_lang, on_partial=None):
+        """Переводит текст используя Google Translate API"""
+        try:
+            # Текст длиннее max_request_chars движок заранее делит на фрагменты
+            url = "https://translate.googleapis.com/translate_a/single"
+            params = {
+                'client': 'gtx',
+                'sl': source_lang,
+                'tl': target_lang,
+                'dt': 't',
+                'q': text
+            }
+            response = requests.get(url, params=params, timeout=15)
+
+            if response.status_code == 200:
+                data = response.json()
+                if data and len(data) > 0 and data[0]:
+                    translated = ''.join([part[0] for part in data[0] if part[0]])
+                    print(f"[DEBUG] Google Translate: '{text[:50]}...' -> '{translated[:50]}...'")
+                    return translated
+                else:
+                    return f"[Ошибка Google Translate: Неверный ответ API]"
+            else:
+                return f"[Ошибка Google Translate: HTTP {response.status_code}]"
+
+        except Exception as e:
+            return f"[Ошибка Google Translate: {e}]"
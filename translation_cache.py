@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sqlite3
+import threading
+import time
+
+from text_normalizer import normalize_key
+
+# Версия схемы хранится в PRAGMA user_version
+SCHEMA_VERSION = 6
+
+# Политики вытеснения: порядок, в котором записи удаляются первыми
+EVICTION_ORDER = {
+    'lru': "last_hit ASC",
+    'lfu': "hit_count ASC, last_hit ASC",
+}
+
+# Бэкенд, которым помечаются записи, перенесенные из старой схемы
+LEGACY_BACKEND = "legacy"
+
+
+class TranslationCache:
+    """SQLite кэш переводов с составным ключом"""
+
+    def __init__(self, db_path, max_rows=200000, max_bytes=256 * 1024 * 1024,
+                 eviction_policy='lru', ttl_by_backend=None):
+        self.db_path = db_path
+        self.conn = None
+        self.lock = threading.RLock()
+        # Ограничения размера; None снимает ограничение
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        if eviction_policy not in EVICTION_ORDER:
+            raise ValueError(f"Неизвестная политика вытеснения: {eviction_policy}")
+        self.eviction_policy = eviction_policy
+        # Время жизни записей в секундах по бэкендам, например {'Ollama': 7 * 86400}
+        self.ttl_by_backend = dict(ttl_by_backend or {})
+        # Попадания копятся в памяти и пишутся в базу фоновым обслуживанием
+        self._pending_hits = {}
+        self._eviction_listeners = []
+        self._maintenance_thread = None
+        self._maintenance_stop = threading.Event()
+
+    def connect(self):
+        """Открывает базу и приводит схему к актуальной версии"""
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        # Используем check_same_thread=False для работы из разных потоков
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.create_function("normalize_key", 1, normalize_key)
+        self._enable_incremental_vacuum()
+        self.migrate()
+
+    def _enable_incremental_vacuum(self):
+        """Включает auto_vacuum=INCREMENTAL, пока базой еще никто не пользуется
+
+        В новой базе режим задается до создания таблиц. Старую базу переводит
+        только полный VACUUM: он идет один раз при открытии, до запуска потоков
+        перевода, а не в фоновом обслуживании под блокировкой кэша.
+        """
+        cur = self.conn.cursor()
+        if cur.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return
+        cur.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        if cur.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone():
+            print("[DEBUG] Кэш переводится в режим incremental vacuum...")
+            try:
+                cur.execute("VACUUM")
+            except sqlite3.OperationalError as e:
+                # Базу держит другой процесс: попробуем при следующем запуске
+                print(f"[Ошибка уплотнения кэша]: {e}")
+
+    def migrate(self):
+        """Создает или обновляет схему кэша на месте"""
+        with self.lock:
+            cur = self.conn.cursor()
+            version = cur.execute("PRAGMA user_version").fetchone()[0]
+            if version == 0:
+                columns = [row[1] for row in cur.execute("PRAGMA table_info(translations)")]
+                # Старая схема без версии: таблица с ключом только по source_text
+                version = 1 if columns else SCHEMA_VERSION
+                if not columns:
+                    self._create_schema(cur)
+
+            while version < SCHEMA_VERSION:
+                print(f"[DEBUG] Миграция кэша: v{version} -> v{version + 1}")
+                _MIGRATIONS[version](self, cur)
+                version += 1
+
+            cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self.conn.commit()
+
+    def _create_schema(self, cur):
+        """Создает таблицы и индексы актуальной схемы"""
+        # WITHOUT ROWID: строка хранится прямо в B-дереве первичного ключа,
+        # поэтому точный поиск не требует обращения к отдельной таблице
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS translations (
+                source_key TEXT NOT NULL,
+                source_lang TEXT NOT NULL,
+                target_lang TEXT NOT NULL,
+                backend TEXT NOT NULL,
+                model TEXT NOT NULL DEFAULT '',
+                source_text TEXT NOT NULL,
+                translated_text TEXT NOT NULL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                last_hit DATETIME DEFAULT CURRENT_TIMESTAMP,
+                hit_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (source_key, source_lang, target_lang, backend, model)
+            ) WITHOUT ROWID
+        """)
+        # Поиск с откатом на другие бэкенды идет по префиксу первичного ключа
+        # (source_key, source_lang, target_lang): отдельный индекс не нужен
+        # Индекс для выбора кандидатов на вытеснение
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_translations_last_hit
+            ON translations (last_hit)
+        """)
+
+    def _drop_indexes(self, cur):
+        """Удаляет индексы перед пересборкой таблицы, иначе они уйдут вместе с ней"""
+        cur.execute("DROP INDEX IF EXISTS idx_translations_any_backend")
+        cur.execute("DROP INDEX IF EXISTS idx_translations_last_hit")
+
+    def _migrate_v1(self, cur):
+        """v1 -> v2: переносит записи, ключом которых был только source_text"""
+        cur.execute("ALTER TABLE translations RENAME TO translations_v1")
+        self._create_schema(cur)
+        cur.execute("""
+            INSERT OR IGNORE INTO translations
+                (source_key, source_lang, target_lang, backend, model,
+                 source_text, translated_text, timestamp)
+            SELECT normalize_key(source_text), 'auto', 'ru', ?, '',
+                   source_text, translated_text, COALESCE(timestamp, CURRENT_TIMESTAMP)
+            FROM translations_v1
+            WHERE source_text IS NOT NULL AND translated_text IS NOT NULL
+        """, (LEGACY_BACKEND,))
+        print(f"[DEBUG] Перенесено записей из старого кэша: {cur.rowcount}")
+        cur.execute("DROP TABLE translations_v1")
+
+    def _migrate_v2(self, cur):
+        """v2 -> v3: пересчитывает ключи с нормализацией, устойчивой к шуму OCR"""
+        self._drop_indexes(cur)
+        cur.execute("ALTER TABLE translations RENAME TO translations_v2")
+        self._create_schema(cur)
+        # Варианты одного текста схлопываются в один ключ, побеждает самый свежий
+        cur.execute("""
+            INSERT OR REPLACE INTO translations
+                (source_key, source_lang, target_lang, backend, model,
+                 source_text, translated_text, timestamp)
+            SELECT normalize_key(source_text), source_lang, target_lang, backend, model,
+                   source_text, translated_text, timestamp
+            FROM translations_v2
+            ORDER BY timestamp
+        """)
+        cur.execute("DROP TABLE translations_v2")
+
+    def _migrate_v3(self, cur):
+        """v3 -> v4: добавляет время последнего попадания и счетчик попаданий"""
+        self._drop_indexes(cur)
+        cur.execute("ALTER TABLE translations RENAME TO translations_v3")
+        self._create_schema(cur)
+        cur.execute("""
+            INSERT INTO translations
+                (source_key, source_lang, target_lang, backend, model,
+                 source_text, translated_text, timestamp, last_hit, hit_count)
+            SELECT source_key, source_lang, target_lang, backend, model,
+                   source_text, translated_text, timestamp, timestamp, 0
+            FROM translations_v3
+        """)
+        cur.execute("DROP TABLE translations_v3")
+
+    def _migrate_v4(self, cur):
+        """v4 -> v5: пересчитывает ключи - числа и границы слов больше не теряются"""
+        self._drop_indexes(cur)
+        cur.execute("ALTER TABLE translations RENAME TO translations_v4")
+        self._create_schema(cur)
+        # Ключи, слитые старой нормализацией, снова расходятся по своим текстам
+        cur.execute("""
+            INSERT OR REPLACE INTO translations
+                (source_key, source_lang, target_lang, backend, model,
+                 source_text, translated_text, timestamp, last_hit, hit_count)
+            SELECT normalize_key(source_text), source_lang, target_lang, backend, model,
+                   source_text, translated_text, timestamp, last_hit, hit_count
+            FROM translations_v4
+            ORDER BY timestamp
+        """)
+        cur.execute("DROP TABLE translations_v4")
+        # Триграммы построены по старым ключам; память переводов пересоберет индекс
+        cur.execute("DROP TABLE IF EXISTS translation_trigrams")
+
+    def _migrate_v5(self, cur):
+        """v5 -> v6: удаляет индекс по бэкендам, дублировавший первичный ключ"""
+        cur.execute("DROP INDEX IF EXISTS idx_translations_any_backend")
+
+    def lookup(self, text, source_lang, target_lang, backend, model="", fallback=False):
+        """Ищет перевод; при fallback=True подходит перевод любого бэкенда
+
+        Возвращает (translated_text, source_text) или None.
+        """
+        return self.lookup_key(normalize_key(text), source_lang, target_lang,
+                               backend, model, fallback)
+
+    def lookup_key(self, key, source_lang, target_lang, backend, model="", fallback=False):
+        """То же, что lookup, но по готовому ключу"""
+        with self.lock:
+            cur = self.conn.cursor()
+            for candidate in ((backend, model), (LEGACY_BACKEND, "")):
+                cur.execute("""
+                    SELECT translated_text, source_text, timestamp FROM translations
+                    WHERE source_key = ? AND source_lang = ? AND target_lang = ?
+                      AND backend = ? AND model = ?
+                """, (key, source_lang, target_lang) + candidate)
+                row = cur.fetchone()
+                if row and not self._is_expired(candidate[0], row[2]):
+                    self._record_hit((key, source_lang, target_lang) + candidate)
+                    return row[:2]
+
+            if fallback:
+                cur.execute("""
+                    SELECT translated_text, source_text, timestamp, backend, model
+                    FROM translations
+                    WHERE source_key = ? AND source_lang = ? AND target_lang = ?
+                    ORDER BY timestamp DESC
+                """, (key, source_lang, target_lang))
+                for row in cur.fetchall():
+                    if not self._is_expired(row[3], row[2]):
+                        self._record_hit((key, source_lang, target_lang) + row[3:5])
+                        return row[:2]
+        return None
+
+    def _is_expired(self, backend, timestamp):
+        """Проверяет, истек ли срок жизни записи бэкенда"""
+        ttl = self.ttl_by_backend.get(backend)
+        if not ttl or not timestamp:
+            return False
+        return timestamp < _sqlite_timestamp(time.time() - ttl)
+
+    def _record_hit(self, row_key):
+        """Запоминает попадание, запись в базу откладывается"""
+        self._pending_hits[row_key] = self._pending_hits.get(row_key, 0) + 1
+
+    def flush_hits(self):
+        """Записывает накопленные попадания в базу"""
+        with self.lock:
+            if not self._pending_hits or not self.conn:
+                return
+            hits, self._pending_hits = self._pending_hits, {}
+            self.conn.executemany("""
+                UPDATE translations
+                SET last_hit = CURRENT_TIMESTAMP, hit_count = hit_count + ?
+                WHERE source_key = ? AND source_lang = ? AND target_lang = ?
+                  AND backend = ? AND model = ?
+            """, [(count,) + row_key for row_key, count in hits.items()])
+            self.conn.commit()
+
+    def store(self, text, translated, source_lang, target_lang, backend, model=""):
+        """Сохраняет перевод в кэш"""
+        with self.lock:
+            self.conn.execute("""
+                INSERT OR REPLACE INTO translations
+                    (source_key, source_lang, target_lang, backend, model,
+                     source_text, translated_text)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (normalize_key(text), source_lang, target_lang, backend, model,
+                  text, translated))
+            self.conn.commit()
+
+    def add_eviction_listener(self, listener):
+        """Регистрирует функцию, получающую список вытесненных ключей"""
+        self._eviction_listeners.append(listener)
+
+    def _delete_rows(self, cur, rows):
+        """Удаляет записи по первичному ключу и оповещает слушателей"""
+        if not rows:
+            return 0
+        cur.executemany("""
+            DELETE FROM translations
+            WHERE source_key = ? AND source_lang = ? AND target_lang = ?
+              AND backend = ? AND model = ?
+        """, rows)
+        keys = sorted({row[0] for row in rows})
+        for listener in self._eviction_listeners:
+            listener(cur, keys)
+        return len(rows)
+
+    def _database_size(self, cur):
+        """Размер файла базы в байтах без учета свободных страниц"""
+        page_size = cur.execute("PRAGMA page_size").fetchone()[0]
+        page_count = cur.execute("PRAGMA page_count").fetchone()[0]
+        freelist = cur.execute("PRAGMA freelist_count").fetchone()[0]
+        return page_size * (page_count - freelist)
+
+    def evict(self):
+        """Удаляет просроченные записи и вытесняет лишние по выбранной политике"""
+        pk = "source_key, source_lang, target_lang, backend, model"
+        removed = 0
+        with self.lock:
+            cur = self.conn.cursor()
+            for backend, ttl in self.ttl_by_backend.items():
+                if ttl:
+                    expired = cur.execute(
+                        f"SELECT {pk} FROM translations WHERE backend = ? AND timestamp < ?",
+                        (backend, _sqlite_timestamp(time.time() - ttl))).fetchall()
+                    removed += self._delete_rows(cur, expired)
+
+            rows = cur.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+            target = rows
+            if self.max_rows is not None and rows > self.max_rows:
+                target = self.max_rows
+            if self.max_bytes is not None and rows:
+                size = self._database_size(cur)
+                if size > self.max_bytes:
+                    target = min(target, int(rows * self.max_bytes / size))
+            if target < rows:
+                # Удаляем с запасом 10%, чтобы не вытеснять на каждом проходе
+                excess = rows - int(target * 0.9)
+                order = EVICTION_ORDER[self.eviction_policy]
+                victims = cur.execute(
+                    f"SELECT {pk} FROM translations ORDER BY {order} LIMIT ?",
+                    (excess,)).fetchall()
+                removed += self._delete_rows(cur, victims)
+            self.conn.commit()
+
+        if removed:
+            print(f"[DEBUG] Из кэша вытеснено записей: {removed}")
+        return removed
+
+    def compact(self, max_pages=1000):
+        """Возвращает свободные страницы файлу порциями, не блокируя базу надолго"""
+        with self.lock:
+            cur = self.conn.cursor()
+            if cur.execute("PRAGMA freelist_count").fetchone()[0]:
+                cur.execute(f"PRAGMA incremental_vacuum({int(max_pages)})")
+                cur.fetchall()
+                self.conn.commit()
+
+    def maintain(self):
+        """Один проход обслуживания: попадания, вытеснение, уплотнение"""
+        try:
+            self.flush_hits()
+            self.evict()
+            self.compact()
+        except Exception as e:
+            print(f"[Ошибка обслуживания кэша]: {e}")
+
+    def start_maintenance(self, interval=300):
+        """Запускает фоновое обслуживание кэша в отдельном потоке"""
+        if self._maintenance_thread and self._maintenance_thread.is_alive():
+            return
+        self._maintenance_stop.clear()
+
+        def loop():
+            while not self._maintenance_stop.wait(interval):
+                self.maintain()
+
+        self._maintenance_thread = threading.Thread(target=loop, daemon=True)
+        self._maintenance_thread.start()
+
+    def stop_maintenance(self):
+        """Останавливает фоновое обслуживание"""
+        self._maintenance_stop.set()
+
+    def clear(self):
+        """Удаляет все записи кэша"""
+        with self.lock:
+            self._pending_hits.clear()
+            self.conn.execute("DELETE FROM translations")
+            self.conn.commit()
+
+    def close(self):
+        """Закрывает соединение с базой данных"""
+        self.stop_maintenance()
+        with self.lock:
+            if self.conn:
+                self.flush_hits()
+                self.conn.close()
+                self.conn = None
+
+
+def _sqlite_timestamp(epoch):
+    """Переводит время в формат CURRENT_TIMESTAMP (UTC)"""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(epoch))
+
+
+# Шаги миграции: версия -> функция перехода на следующую версию
+_MIGRATIONS = {
+    1: TranslationCache._migrate_v1,
+    2: TranslationCache._migrate_v2,
+    3: TranslationCache._migrate_v3,
+    4: TranslationCache._migrate_v4,
+    5: TranslationCache._migrate_v5,
+}
@@ -1,149 +1,386 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import sqlite3
-import requests
 import html
 import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+from backend_router import AUTO_BACKEND, BackendRouter, is_error
+from translation_backends import create_backends
+from translation_cache import TranslationCache
+from token_classifier import split_language_spans
+from translation_memory import TranslationMemory
+from text_chunker import split_into_chunks
+from text_filter import TECHNICAL_PATTERNS, TextFilter
+from text_normalizer import clean_text, normalize_key
+
+# Результат перевода, отмененного вместе с устаревшим кадром
+_CANCELLED = object()
+
 
 class TranslationEngine:
     """Движок для перевода текста"""
     
-    def __init__(self, db_path="cache/overlay_translator_cache.sqlite"):
+    def __init__(self, db_path="cache/overlay_translator_cache.sqlite",
+                 source_lang="auto", target_lang="ru", backend_fallback=False,
+                 fuzzy_similarity=0.95, cache_options=None):
         self.db_path = db_path
-        self.conn = None
+        self.source_lang = source_lang
+        self.target_lang = target_lang
+        # Бэкенды перевода из реестра: имя -> экземпляр
+        self.backends = create_backends()
+        # Статистика задержек бэкендов и выбор бэкенда в режиме "Авто"
+        self.router = BackendRouter(self.backends)
+        # Пулы потоков по бэкендам, размер берется из max_concurrency
+        self._executors = {}
+        self._executors_lock = threading.Lock()
+        # Разрешает брать из кэша перевод, сделанный другим бэкендом
+        self.backend_fallback = backend_fallback
+        # cache_options: max_rows, max_bytes, eviction_policy, ttl_by_backend
+        self.cache = TranslationCache(db_path, **(cache_options or {}))
+        # Приближенный поиск по похожим фразам; None отключает его
+        self.memory = TranslationMemory(self.cache, min_similarity=fuzzy_similarity)
+        # Фильтр надписей интерфейса (config/text_filter.txt дополняет шаблоны)
+        self.text_filter = TextFilter.from_user_config()
+        self._sentence_filter = self.text_filter.with_patterns(TECHNICAL_PATTERNS)
+        self._stats_lock = threading.Lock()
+        self.reset_cache_stats()
+        # Переводы в процессе: ключ -> Future, который ждут повторные запросы
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        # Недавние ошибки: ключ -> (срок, текст ошибки); повтор не идет в сеть
+        self.negative_ttl = 10.0
+        self._negative_cache = {}
+        # Блоки, оставшиеся без перевода: ключ -> (текст, переводчик, отложен ли)
+        self.max_retry_queue = 500
+        self.retry_interval = 30.0
+        # Отложенные из-за ограничения частоты блоки проверяются чаще
+        self.deferred_retry_interval = 1.0
+        self._retry_queue = {}
+        self._retry_lock = threading.Lock()
+        self._retry_wakeup = threading.Event()
+        # Останавливает поток повторов перед закрытием кэша
+        self._stop = threading.Event()
+        # Сколько close() ждет повтор, запрос которого уже ушел в сеть
+        self.close_timeout = 5.0
+        # Отключение бэкенда сдвигает время повтора, восстановление запускает его сразу
+        self.router.add_state_listener(lambda name, state: self._retry_wakeup.set())
         self.connect_db()
+        self._retry_thread = threading.Thread(target=self._retry_loop, daemon=True)
+        self._retry_thread.start()
     
     def connect_db(self):
         """Подключается к базе данных кэша"""
         try:
-            # Используем check_same_thread=False для работы из разных потоков
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            self.create_tables()
+            self.cache.connect()
+            self.memory.create_tables()
+            self.cache.add_eviction_listener(self.memory.prune)
+            self.cache.start_maintenance()
             print(f"[DEBUG] Подключение к БД: {self.db_path}")
         except Exception as e:
             print(f"[Ошибка БД]: {e}")
     
-    def create_tables(self):
-        """Создает таблицы в базе данных"""
-        try:
-            cur = self.conn.cursor()
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS translations (
-                    source_text TEXT PRIMARY KEY,
-                    translated_text TEXT,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            self.conn.commit()
-        except Exception as e:
-            print(f"[Ошибка создания таблиц]: {e}")
+    def _model_for(self, translator):
+        """Возвращает модель, которой пользуется переводчик"""
+        backend = self.backends.get(translator)
+        return backend.model if backend else ""
+
+    def _executor_for(self, backend):
+        """Пул потоков бэкенда для параллельных запросов"""
+        with self._executors_lock:
+            executor = self._executors.get(backend.name)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=backend.max_concurrency,
+                                              thread_name_prefix=f"translate-{backend.name}")
+                self._executors[backend.name] = executor
+            return executor
+
+    def warm_up_backend(self, translator, force=False):
+        """Заранее готовит бэкенд (например, загружает модель Ollama)"""
+        if translator == AUTO_BACKEND:
+            for backend in self.backends.values():
+                backend.warm_up_async(force)
+            return
+        backend = self.backends.get(translator)
+        if backend:
+            backend.warm_up_async(force)
+
+    def set_auto_translation_active(self, active):
+        """Сообщает бэкендам, идет ли автоперевод"""
+        for backend in self.backends.values():
+            backend.set_keep_warm(active)
     
-    def translate_text(self, text, translator="Google"):
-        """Переводит текст используя указанный переводчик"""
+    def translate_text(self, text, translator="Google", on_partial=None):
+        """Переводит текст используя указанный переводчик
+
+        on_partial(text) вызывается с накопленным частичным переводом,
+        если переводчик умеет отдавать результат потоком.
+        """
         if not text:
             return ""
-            
+
+        limit = self._request_limit(translator)
+        if limit is not None and self._plan_text(text, limit) is not None:
+            # Длинный текст или текст с кодом переводится по частям,
+            # каждая часть объединяется с одинаковыми запросами отдельно
+            text_partial = None
+            if on_partial:
+                text_partial = lambda index, partial: on_partial(partial)
+            return self._translate_texts_planned([text], translator, text_partial)[0]
+
+        # Одинаковые запросы из параллельных потоков ждут один перевод
+        flight_key = self._flight_key(text, translator)
+        while True:
+            future, is_leader = self._claim_flight(flight_key)
+            if is_leader:
+                break
+            self._count_lookup('coalesced')
+            print(f"[DEBUG] Ожидаем уже выполняющийся перевод: '{text[:50]}...'")
+            translated = future.result()
+            if translated is not _CANCELLED:
+                return translated
+            # Кадр, ради которого шел перевод, отменен - переводим сами
+
         try:
-            # Проверяем кэш
-            cur = self.conn.cursor()
-            cur.execute("SELECT translated_text FROM translations WHERE source_text = ?", (text,))
-            row = cur.fetchone()
-            if row:
-                print(f"[DEBUG] Перевод из кэша: '{text[:50]}...'")
-                return row[0]
-
-            # Выполняем перевод
-            translated = ""
-            if translator == "Ollama":
-                translated = self._translate_with_ollama(text)
-            elif translator == "Google":
-                translated = self._translate_with_google(text)
-            else:
-                translated = f"[Ошибка: Неизвестный переводчик '{translator}']"
-
-            # Сохраняем в кэш
-            if translated and not translated.startswith("[Ошибка"):
-                cur.execute("INSERT OR REPLACE INTO translations (source_text, translated_text) VALUES (?, ?)", 
-                          (text, translated))
-                self.conn.commit()
-                
+            translated = self._translate_uncoalesced(text, translator, on_partial)
+            future.set_result(translated)
+            return translated
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._release_flight(flight_key)
+
+    def _flight_key(self, text, translator):
+        """Ключ, по которому объединяются одинаковые запросы"""
+        return (normalize_key(text), self.source_lang, self.target_lang,
+                translator, self._model_for(translator))
+
+    def _claim_flight(self, flight_key):
+        """Возвращает (future, is_leader); лидер обязан выполнить перевод"""
+        with self._inflight_lock:
+            future = self._inflight.get(flight_key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._inflight[flight_key] = future
+            return future, True
+
+    def _release_flight(self, flight_key):
+        """Снимает отметку о выполняющемся переводе"""
+        with self._inflight_lock:
+            self._inflight.pop(flight_key, None)
+
+    def _translate_uncoalesced(self, text, translator, on_partial=None):
+        """Перевод с проверкой кэша без объединения запросов"""
+        try:
+            cached = self._lookup_cached(text, translator)
+            if cached is not None:
+                return cached
+
+            failed = self._recent_failure(self._flight_key(text, translator))
+            if failed is not None:
+                return failed
+
+            if translator not in self.backends and translator != AUTO_BACKEND:
+                return f"[Ошибка: Неизвестный переводчик '{translator}']"
+
+            text_partial = None
+            if on_partial:
+                text_partial = lambda position, partial: on_partial(partial)
+            backend_name, translations = self._run_batch_on_backend(
+                [clean_text(text)], translator, text_partial)
+            if translations is None:
+                # Бюджет запросов исчерпан: переведем в фоне, блок пока не показываем
+                self._defer(text, translator)
+                return ""
+            translated = translations[0]
+            if translated is None:
+                translated = self._translate_uncached(text, backend_name, on_partial)
+            self._store_translation(text, translated, backend_name)
+            self._remember_failure(text, translated, translator)
             return translated
             
         except Exception as e:
             print(f"[Ошибка перевода]: {e}")
             return f"[Ошибка перевода: {e}]"
-    
-    def _translate_with_ollama(self, text):
-        """Переводит текст используя Ollama"""
-        try:
-            r = requests.post("http://localhost:11434/api/generate", 
-                            json={"model": "llama3", "prompt": f"Translate to Russian: {text}"},
-                            timeout=5)
-            translated = r.json().get("response", "")
-            print(f"[DEBUG] Ollama: '{text[:50]}...' -> '{translated[:50]}...'")
+
+    def _lookup_cached(self, text, translator, fuzzy=True):
+        """Ищет перевод в кэше и памяти переводов, учитывая статистику"""
+        model = self._model_for(translator)
+        # В режиме "Авто" и пока бэкенд отключен подходит перевод любого бэкенда
+        fallback = (self.backend_fallback or translator == AUTO_BACKEND
+                    or not self._is_available(translator))
+        cached = self.cache.lookup(text, self.source_lang, self.target_lang,
+                                   translator, model, fallback=fallback)
+        if cached is not None:
+            translated, cached_source = cached
+            # Попадание только благодаря нормализации ключа
+            self._count_lookup('normalized_hits' if cached_source != text else 'exact_hits')
+            print(f"[DEBUG] Перевод из кэша: '{text[:50]}...'")
             return translated
-            
-        except requests.exceptions.ConnectionError:
-            return "[Ошибка: Ollama сервер недоступен. Запустите 'ollama serve' или выберите Google Translate]"
-        except Exception as e:
-            return f"[Ошибка Ollama: {e}]"
-    
-    def _translate_with_google(self, text):
-        """Переводит текст используя Google Translate API"""
-        try:
-            # Ограничиваем длину текста для Google Translate
-            if len(text) > 5000:
-                text = text[:5000]
-            
-            url = "https://translate.googleapis.com/translate_a/single"
-            params = {
-                'client': 'gtx',
-                'sl': 'auto',
-                'tl': 'ru',
-                'dt': 't',
-                'q': text
-            }
-            response = requests.get(url, params=params, timeout=15)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data and len(data) > 0 and data[0]:
-                    translated = ''.join([part[0] for part in data[0] if part[0]])
-                    print(f"[DEBUG] Google Translate: '{text[:50]}...' -> '{translated[:50]}...'")
-                    return translated
-                else:
-                    return f"[Ошибка Google Translate: Неверный ответ API]"
-            else:
-                return f"[Ошибка Google Translate: HTTP {response.status_code}]"
-                
-        except Exception as e:
-            return f"[Ошибка Google Translate: {e}]"
+
+        # Ищем почти совпадающую фразу в памяти переводов
+        similar = None
+        if fuzzy:
+            similar = self.memory.find(normalize_key(text), self.source_lang, self.target_lang,
+                                       translator, model, fallback=fallback)
+        if similar is not None:
+            translated, cached_source, similarity = similar
+            self._count_lookup('fuzzy_hits')
+            print(f"[DEBUG] Похожий перевод из кэша ({similarity:.0%}): "
+                  f"'{text[:50]}...' ~ '{cached_source[:50]}...'")
+            return translated
+
+        self._count_lookup('misses')
+        return None
+
+    def _translate_uncached(self, text, translator, on_partial=None):
+        """Переводит текст через сеть, минуя кэш"""
+        backend = self.backends.get(translator)
+        if backend is None:
+            return f"[Ошибка: Неизвестный переводчик '{translator}']"
+        # Переводим очищенный текст, исходный остается для отображения
+        if not backend.supports_streaming:
+            on_partial = None
+        return backend.translate(clean_text(text), self.source_lang, self.target_lang, on_partial)
+
+    def _run_batch_on_backend(self, batch_texts, translator, on_partial=None, background=False):
+        """Отправляет пакет бэкенду (или маршрутизатору в режиме "Авто")
+
+        Возвращает (имя ответившего бэкенда, переводы); переводы None, если
+        пакет отложен ограничителем частоты. background - пакет не с экрана.
+        """
+        def call(backend, partial=None):
+            if not backend.supports_streaming:
+                partial = None
+            return backend.translate_batch(batch_texts, self.source_lang, self.target_lang, partial)
+
+        chars = sum(len(text) for text in batch_texts)
+        if translator == AUTO_BACKEND:
+            # Частичные переводы показываем только от основного бэкенда
+            return self.router.run(call, len(batch_texts), lambda backend: call(backend, on_partial),
+                                   chars, background)
+
+        return self.router.call(translator, lambda backend: call(backend, on_partial),
+                                len(batch_texts), chars, background)
+
+    def _store_translation(self, text, translated, translator):
+        """Сохраняет удачный перевод в кэш и память переводов"""
+        if self._stop.is_set():
+            # Ответ пришел после close(): кэш уже закрыт
+            return
+        if translated and not translated.startswith("[Ошибка"):
+            self.cache.store(text, translated, self.source_lang, self.target_lang,
+                             translator, self._model_for(translator))
+            self.memory.add(normalize_key(text))
+
+    def _is_available(self, translator):
+        """Есть ли сейчас бэкенд, способный выполнить перевод"""
+        if translator == AUTO_BACKEND:
+            return any(self.router.is_available(name) for name in self.backends)
+        return translator not in self.backends or self.router.is_available(translator)
+
+    def _recent_failure(self, flight_key):
+        """Ошибка, недавно полученная для этого ключа, или None"""
+        with self._retry_lock:
+            entry = self._negative_cache.get(flight_key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._negative_cache[flight_key]
+                return None
+        self._count_lookup('negative_hits')
+        return entry[1]
+
+    def _remember_failure(self, text, translated, translator):
+        """Запоминает ошибку перевода и ставит текст в очередь повтора"""
+        if translated is not None and not translated.startswith("[Ошибка"):
+            return
+        flight_key = self._flight_key(text, translator)
+        with self._retry_lock:
+            self._negative_cache[flight_key] = (time.time() + self.negative_ttl, translated)
+            if flight_key in self._retry_queue or len(self._retry_queue) < self.max_retry_queue:
+                self._retry_queue[flight_key] = (text, translator, False)
+
+    def _defer(self, text, translator):
+        """Откладывает перевод, не уложившийся в бюджет запросов бэкенда"""
+        self._count_lookup('deferred')
+        flight_key = self._flight_key(text, translator)
+        with self._retry_lock:
+            if flight_key in self._retry_queue or len(self._retry_queue) < self.max_retry_queue:
+                self._retry_queue[flight_key] = (text, translator, True)
+
+    def _retry_loop(self):
+        """Фоновый поток: переводит отложенные блоки, когда бэкенд снова доступен"""
+        while not self._stop.is_set():
+            # Просыпаемся к концу паузы выключателя или по сигналу о восстановлении
+            with self._retry_lock:
+                has_deferred = any(entry[2] for entry in self._retry_queue.values())
+            timeout = self.deferred_retry_interval if has_deferred else self.retry_interval
+            retry_at = self.router.next_retry_at()
+            if retry_at is not None:
+                timeout = min(timeout, max(0.1, retry_at - time.time()))
+            self._retry_wakeup.wait(timeout)
+            self._retry_wakeup.clear()
+            if self._stop.is_set():
+                break
+
+            by_translator = {}
+            with self._retry_lock:
+                for flight_key, (text, translator, _) in list(self._retry_queue.items()):
+                    if not self._is_available(translator):
+                        continue
+                    del self._retry_queue[flight_key]
+                    self._negative_cache.pop(flight_key, None)
+                    by_translator.setdefault(translator, []).append(text)
+
+            for translator, texts in by_translator.items():
+                if self._stop.is_set():
+                    break
+                print(f"[DEBUG] Повторяем перевод {len(texts)} отложенных блоков ({translator})")
+                try:
+                    # Результат попадает в кэш и будет показан при следующем обновлении;
+                    # фоновые запросы не расходуют запас, оставленный блокам на экране
+                    self._translate_texts_batched(texts, translator, background=True,
+                                                  cancelled=self._stop.is_set)
+                except Exception as e:
+                    print(f"[Ошибка повтора перевода]: {e}")
     
+    def _count_lookup(self, outcome, count=1):
+        """Учитывает результат обращения к кэшу"""
+        with self._stats_lock:
+            self._cache_stats[outcome] += count
+
+    def reset_cache_stats(self):
+        """Сбрасывает статистику попаданий в кэш"""
+        with self._stats_lock:
+            self._cache_stats = {'exact_hits': 0, 'normalized_hits': 0,
+                                 'fuzzy_hits': 0, 'misses': 0,
+                                 'coalesced': 0, 'negative_hits': 0, 'deferred': 0,
+                                 'bypassed': 0}
+
+    def get_cache_stats(self):
+        """Возвращает статистику попаданий в кэш"""
+        with self._stats_lock:
+            stats = dict(self._cache_stats)
+        hits = stats['exact_hits'] + stats['normalized_hits'] + stats['fuzzy_hits']
+        lookups = hits + stats['misses']
+        stats['lookups'] = lookups
+        stats['hit_rate'] = hits / lookups if lookups else 0.0
+        # Доля запросов, сэкономленных именно нормализацией ключа
+        stats['normalized_gain'] = stats['normalized_hits'] / lookups if lookups else 0.0
+        return stats
+
     def split_into_sentences(self, text):
         """Разбивает текст на предложения для лучшего перевода"""
         if not text:
             return []
 
-        # Фильтруем текст - убираем элементы интерфейса
-        filtered_text = self._filter_ui_elements(text)
-
-        # Разбиваем по строкам (более эффективно для UI)
-        lines = [line.strip() for line in filtered_text.split('\n') if line.strip()]
-
-        # Фильтруем слишком короткие или технические строки
-        meaningful_lines = []
-        for line in lines:
-            # Пропускаем технические элементы
-            if any(skip in line.lower() for skip in ['debug', 'error', 'http', 'api', 'overlay', 'translator']):
-                continue
-            # Пропускаем слишком короткие строки
-            if len(line.strip()) < 3:
-                continue
-            # Пропускаем строки только с символами
-            if not any(c.isalpha() for c in line):
-                continue
-            meaningful_lines.append(line)
+        # Один проход: элементы интерфейса, технические, короткие и небуквенные строки
+        meaningful_lines = self._sentence_filter.filter_lines(text)
 
         # Если фильтр слишком агрессивный, возвращаем исходный текст
         if len(meaningful_lines) < 2:
@@ -152,81 +389,336 @@ class TranslationEngine:
 
         return meaningful_lines
 
-    def translate_text_blocks(self, text_blocks, translator="Google"):
-        """Переводит множество текстовых блоков"""
+    def filter_text_blocks(self, text_blocks, window_id=None, chrome_rects=()):
+        """Отбрасывает блоки OCR, которые не нужно переводить
+
+        Пользовательские шаблоны, надписи окна переводчика внутри chrome_rects
+        и наш собственный overlay, попавший в захват окна window_id, не тратят
+        запросы к переводчику.
+        """
+        return self.text_filter.filter_blocks(text_blocks, window_id, chrome_rects)
+
+    def set_overlay_blocks(self, translated_blocks, window_id=None):
+        """Запоминает переводы, показанные в overlay окна window_id"""
+        self.text_filter.set_overlay_blocks(translated_blocks, window_id)
+
+    def forget_overlay(self, window_id=None):
+        """Забывает overlay окна, которое больше не переводится"""
+        self.text_filter.forget_overlay(window_id)
+
+    def translate_text_blocks(self, text_blocks, translator="Google", on_partial=None,
+                              cancelled=None):
+        """Переводит множество текстовых блоков
+
+        on_partial(index, text) получает частичные переводы блоков по мере генерации.
+        cancelled() сообщает, что результат больше не нужен: еще не отправленные
+        пакеты пропускаются, а уже полученные переводы остаются в кэше.
+        """
         if not text_blocks:
             return []
 
+        texts = [block.get('text') for block in text_blocks]
+        if translator in self.backends or translator == AUTO_BACKEND:
+            translations = self._translate_texts_planned(texts, translator, on_partial, cancelled)
+        else:
+            translations = [self.translate_text(text, translator) for text in texts]
+
         translated_blocks = []
-        
-        for block in text_blocks:
+        for block, translated_text in zip(text_blocks, translations):
             if block.get('text'):
-                translated_text = self.translate_text(block['text'], translator)
                 # Создаем новый блок с переводом
                 translated_block = block.copy()
                 translated_block['translated_text'] = translated_text
                 translated_blocks.append(translated_block)
-        
-        print(f"[DEBUG] Переведено {len(translated_blocks)} текстовых блоков")
+
+        stats = self.get_cache_stats()
+        print(f"[DEBUG] Переведено {len(translated_blocks)} текстовых блоков, "
+              f"попаданий в кэш: {stats['hit_rate']:.0%} "
+              f"(за счет нормализации: {stats['normalized_gain']:.0%}), "
+              f"без запроса к переводчику: {stats['bypassed']}")
         return translated_blocks
     
-    def _filter_ui_elements(self, text):
-        """Фильтрует элементы интерфейса из текста"""
-        # Убираем элементы интерфейса Overlay Translator
-        ui_patterns = [
-            'выбрать окно', 'обновить перевод', 'старт', 'стоп',
-            'интервал', 'переводчик', 'компактный вид', 'прозрачность',
-            'сбросить кэш', 'окно:', 'перевод:', 'распознанный текст:',
-            'overlay translator', 'select window', 'update translation',
-            'start', 'stop', 'interval', 'translator', 'compact view',
-            'transparency', 'clear cache', 'window:', 'translation:',
-            'recognized text:'
-        ]
-        
-        # Разбиваем на строки
-        lines = text.split('\n')
-        filtered_lines = []
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
+    def supports_streaming(self, translator):
+        """Может ли переводчик отдавать частичные переводы"""
+        if translator == AUTO_BACKEND:
+            return any(backend.supports_streaming for backend in self.backends.values())
+        backend = self.backends.get(translator)
+        return backend is not None and backend.supports_streaming
+
+    def _request_limit(self, translator):
+        """Наибольшая длина текста для одного запроса (None - переводчик неизвестен)"""
+        if translator == AUTO_BACKEND:
+            return min(backend.max_request_chars for backend in self.backends.values())
+        backend = self.backends.get(translator)
+        return backend.max_request_chars if backend else None
+
+    def _plan_text(self, text, limit):
+        """Делит текст на части для перевода
+
+        Возвращает None, если текст переводится целиком, иначе список
+        (часть, вид): вид None - часть остается как есть (код, числа, пути,
+        пробелы между фрагментами), 'text' - фраза, 'chunk' - фрагмент
+        длинной фразы.
+        """
+        if not text:
+            return None
+        segments = split_language_spans(text)
+        if segments == [(text, True)] and len(text) <= limit:
+            return None
+
+        plan = []
+        for segment, is_language in segments:
+            if not is_language:
+                plan.append((segment, None))
+            elif len(segment) <= limit:
+                plan.append((segment, 'text'))
+            else:
+                for chunk, separator in split_into_chunks(segment, limit):
+                    if chunk:
+                        plan.append((chunk, 'chunk'))
+                    if separator:
+                        plan.append((separator, None))
+        return plan
+
+    def _translate_texts_planned(self, texts, translator, on_partial=None, cancelled=None):
+        """Переводит тексты по частям: без кода и чисел, длинные - фрагментами
+
+        Части переводятся и кэшируются как отдельные тексты, поэтому
+        выполняются параллельно и повторно не оплачиваются. Блоки без
+        естественного языка возвращаются как есть, без запросов.
+        """
+        if not self.supports_streaming(translator):
+            # Частичных переводов не будет: не собираем их по частям
+            on_partial = None
+        limit = self._request_limit(translator)
+        plans = [self._plan_text(text, limit) for text in texts]
+        if all(plan is None for plan in plans):
+            return self._translate_texts_batched(texts, translator, on_partial,
+                                                 cancelled=cancelled)
+
+        expanded = []  # тексты и части, которые уходят на перевод
+        exact_indices = set()
+        owners = {}  # индекс в expanded -> (индекс текста, номер части)
+        bypassed = 0
+        for index, (text, plan) in enumerate(zip(texts, plans)):
+            if plan is None:
+                owners[len(expanded)] = (index, None)
+                expanded.append(text)
                 continue
-                
-            # Проверяем, содержит ли строка элементы интерфейса
-            should_skip = False
-            for pattern in ui_patterns:
-                if pattern.lower() in line.lower():
-                    should_skip = True
-                    break
-            
-            # Пропускаем строки с элементами интерфейса
-            if should_skip:
+            if not any(kind for _, kind in plan):
+                bypassed += 1
+            for position, (part, kind) in enumerate(plan):
+                if kind is None:
+                    continue
+                if kind == 'chunk':
+                    # Похожий фрагмент - обычно тот же абзац с правкой, и его
+                    # перевод эту правку потеряет; фрагменты ищем только точно
+                    exact_indices.add(len(expanded))
+                owners[len(expanded)] = (index, position)
+                expanded.append(part)
+        if bypassed:
+            self._count_lookup('bypassed', bypassed)
+            print(f"[DEBUG] Без перевода (числа, код, пути): {bypassed} блоков")
+        if len(expanded) != len(texts) - bypassed:
+            print(f"[DEBUG] Тексты разбиты на части: {len(texts)} -> {len(expanded)}")
+
+        def assemble(plan, translated_parts):
+            return ''.join(translated_parts.get(position, part)
+                           for position, (part, kind) in enumerate(plan)).strip()
+
+        partial_parts = {}
+        partial_lock = threading.Lock()
+
+        def expanded_partial(expanded_index, partial):
+            index, position = owners[expanded_index]
+            if position is None:
+                on_partial(index, partial)
+                return
+            with partial_lock:
+                parts = partial_parts.setdefault(index, {
+                    position: "" for position, (_, kind) in enumerate(plans[index]) if kind})
+                parts[position] = partial
+                text = assemble(plans[index], parts)
+            on_partial(index, text)
+
+        translations = self._translate_texts_batched(expanded, translator,
+                                                     expanded_partial if on_partial else None,
+                                                     exact_indices=exact_indices,
+                                                     cancelled=cancelled)
+
+        results = [None] * len(texts)
+        translated_parts = {}  # индекс текста -> {номер части: перевод}
+        for expanded_index, translated in enumerate(translations):
+            index, position = owners[expanded_index]
+            if position is None:
+                results[index] = translated
+            else:
+                translated_parts.setdefault(index, {})[position] = translated
+        for index, plan in enumerate(plans):
+            if plan is None:
+                continue
+            parts = translated_parts.get(index, {})
+            # Неполный перевод не показываем: отложенная или ошибочная часть
+            # переведется позже, остальные уже лежат в кэше
+            failed = next((part for part in parts.values() if not part or is_error(part)), None)
+            results[index] = failed if failed is not None else assemble(plan, parts)
+        return results
+
+    def _translate_texts_batched(self, texts, translator, on_partial=None, background=False,
+                                 exact_indices=(), cancelled=None):
+        """Переводит промахи кэша пакетами по возможностям бэкенда
+
+        Пакеты сверх бюджета запросов откладываются: вместо перевода блок
+        получает пустую строку, а сам перевод выполняется в фоне. Для текстов
+        с индексами из exact_indices не используется приближенный поиск.
+        Если cancelled() истинно, еще не начатые пакеты не отправляются.
+        """
+        if translator == AUTO_BACKEND:
+            # Пакеты нарезаются под бэкенд, который сейчас лучший
+            backend = self.backends[self.router.rank()[0]]
+        else:
+            backend = self.backends[translator]
+        results = [None] * len(texts)
+        pending = {}  # ключ -> индексы блоков с этим текстом
+        leaders = {}  # ключ -> Future, который ждут другие потоки
+        followers = []  # (индекс, Future) переводов, выполняемых другими потоками
+
+        for index, text in enumerate(texts):
+            if not text:
+                results[index] = ""
+                continue
+            flight_key = self._flight_key(text, translator)
+            if flight_key in pending:
+                pending[flight_key].append(index)
                 continue
-                
-            # Пропускаем слишком короткие строки
-            if len(line) < 3:
+            future, is_leader = self._claim_flight(flight_key)
+            if not is_leader:
+                self._count_lookup('coalesced')
+                followers.append((index, future))
                 continue
-                
-            # Пропускаем строки только с символами
-            if not any(c.isalpha() for c in line):
+            cached = self._lookup_cached(text, translator, fuzzy=index not in exact_indices)
+            if cached is None:
+                cached = self._recent_failure(flight_key)
+            if cached is not None:
+                results[index] = cached
+                future.set_result(cached)
+                self._release_flight(flight_key)
                 continue
-                
-            filtered_lines.append(line)
-        
-        return '\n'.join(filtered_lines)
+            leaders[flight_key] = future
+            pending[flight_key] = [index]
+
+        def run_batch(batch):
+            if cancelled is not None and cancelled():
+                # Кадр устарел: пакет не отправляем, уже полученное осталось в кэше
+                print(f"[DEBUG] Пакет из {len(batch)} блоков отменен")
+                for key in batch:
+                    for index in pending[key]:
+                        results[index] = ""
+                    leaders.pop(key).set_result(_CANCELLED)
+                    self._release_flight(key)
+                return
+
+            batch_texts = [clean_text(texts[pending[key][0]]) for key in batch]
+
+            def batch_partial(position, partial):
+                for index in pending[batch[position]]:
+                    on_partial(index, partial)
+
+            backend_name, translations = self._run_batch_on_backend(
+                batch_texts, translator, batch_partial if on_partial else None, background)
+            if translations is None:
+                for key in batch:
+                    self._defer(texts[pending[key][0]], translator)
+                    for index in pending[key]:
+                        results[index] = ""
+                    leaders.pop(key).set_result("")
+                    self._release_flight(key)
+                return
+            for key, translated in zip(batch, translations):
+                indices = pending[key]
+                text = texts[indices[0]]
+                if translated is None:
+                    # Строку не удалось разобрать - переводим ее отдельно
+                    block_partial = None
+                    if on_partial:
+                        block_partial = lambda partial, indices=indices: [
+                            on_partial(i, partial) for i in indices]
+                    translated = self._translate_uncached(text, backend_name, block_partial)
+                self._store_translation(text, translated, backend_name)
+                self._remember_failure(text, translated, translator)
+                for index in indices:
+                    results[index] = translated
+                leaders.pop(key).set_result(translated)
+                self._release_flight(key)
+
+        try:
+            batches = list(self._split_into_batches(list(pending), texts, pending, backend))
+            if len(batches) == 1 or backend.max_concurrency == 1:
+                for batch in batches:
+                    run_batch(batch)
+            else:
+                # Независимые пакеты выполняются параллельно в пуле бэкенда
+                executor = self._executor_for(backend)
+                futures = [executor.submit(run_batch, batch) for batch in batches]
+                wait(futures)
+                for future in futures:
+                    future.result()
+        finally:
+            # При исключении не оставляем ожидающие потоки висеть
+            for key in list(leaders):
+                leaders.pop(key).set_result("[Ошибка перевода: пакет не выполнен]")
+                self._release_flight(key)
+
+        for index, future in followers:
+            translated = future.result()
+            if translated is _CANCELLED:
+                # Перевод отменил чужой кадр - если наш еще нужен, переводим сами
+                if cancelled is not None and cancelled():
+                    translated = ""
+                else:
+                    translated = self.translate_text(texts[index], translator)
+            results[index] = translated
+        return results
+
+    def _split_into_batches(self, keys, texts, pending, backend):
+        """Делит ключи на пакеты с ограничением по числу блоков и символов"""
+        batch, batch_chars = [], 0
+        for key in keys:
+            length = len(texts[pending[key][0]])
+            if batch and (len(batch) >= backend.max_batch_size
+                          or batch_chars + length > backend.max_request_chars):
+                yield batch
+                batch, batch_chars = [], 0
+            batch.append(key)
+            batch_chars += length
+        if batch:
+            yield batch
+
+    def _filter_ui_elements(self, text):
+        """Фильтрует элементы интерфейса из текста"""
+        return '\n'.join(self.text_filter.filter_lines(text))
     
     def clear_cache(self):
         """Очищает кэш переводов"""
         try:
-            cur = self.conn.cursor()
-            cur.execute("DELETE FROM translations")
-            self.conn.commit()
+            self.cache.clear()
+            self.memory.clear()
+            with self._retry_lock:
+                self._negative_cache.clear()
             print("[DEBUG] Кэш переводов очищен")
         except Exception as e:
             print(f"[Ошибка очистки кэша]: {e}")
     
     def close(self):
         """Закрывает соединение с базой данных"""
-        if self.conn:
-            self.conn.close()
+        self._stop.set()
+        self._retry_wakeup.set()
+        # Повтор не должен обратиться к кэшу после его закрытия
+        if self._retry_thread.is_alive():
+            self._retry_thread.join(self.close_timeout)
+        for executor in self._executors.values():
+            executor.shutdown(wait=False)
+        self.router.shutdown()
+        if self.cache.conn:
+            self.cache.close()
             print("[DEBUG] Соединение с БД закрыто")
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Память переводов с приближенным поиском.
+
+Для каждого ключа кэша хранится множество триграмм в той же SQLite базе.
+Новый текст сравнивается с кэшированными по коэффициенту Дайса на
+триграммах, так что длинная фраза с парой ошибок OCR находит перевод
+почти совпадающей фразы без обращения к сети. Числа, адреса и код в
+обеих фразах должны совпадать точно, а слова - отличаться только
+мелкими ошибками OCR: "not saved" и "saved", "Upload" и "Download"
+похожи по триграммам, но переводятся противоположно.
+"""
+
+import math
+
+from token_classifier import fixed_tokens
+
+
+def trigrams(key):
+    """Возвращает множество триграмм ключа"""
+    return {key[i:i + 3] for i in range(len(key) - 2)}
+
+
+def edit_distance(first, second, limit):
+    """Расстояние Левенштейна; limit + 1, если оно больше limit"""
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    previous = list(range(len(second) + 1))
+    for i, a in enumerate(first, 1):
+        current = [i]
+        for j, b in enumerate(second, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a != b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def is_ocr_variant(key, other, max_changed_words=2):
+    """Отличаются ли ключи только ошибками OCR внутри слов
+
+    Слова не добавляются и не пропадают; короткие слова совпадают точно
+    ("was" и "wasnt"), в длинных допустима одна ошибка (в очень длинных -
+    две) при разнице длины не больше символа.
+    """
+    words, other_words = key.split(), other.split()
+    if len(words) != len(other_words):
+        return False
+    changed = 0
+    for word, other_word in zip(words, other_words):
+        if word == other_word:
+            continue
+        changed += 1
+        length = min(len(word), len(other_word))
+        if changed > max_changed_words or length < 5 or abs(len(word) - len(other_word)) > 1:
+            return False
+        limit = 2 if length >= 10 else 1
+        if edit_distance(word, other_word, limit) > limit:
+            return False
+    return True
+
+
+def dice_similarity(grams_a, grams_b):
+    """Коэффициент Дайса для двух множеств триграмм"""
+    if not grams_a or not grams_b:
+        return 0.0
+    return 2 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b))
+
+
+class TranslationMemory:
+    """Триграммный индекс поверх кэша переводов"""
+
+    def __init__(self, cache, min_similarity=0.95, min_length=20, max_candidates=20):
+        self.cache = cache
+        # Порог похожести; None отключает приближенный поиск
+        self.min_similarity = min_similarity
+        # Короткие строки не ищем: "Open" и "Opens" - разные кнопки
+        self.min_length = min_length
+        self.max_candidates = max_candidates
+
+    def create_tables(self):
+        """Создает индекс триграмм и заполняет его по уже имеющемуся кэшу"""
+        with self.cache.lock:
+            cur = self.cache.conn.cursor()
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS translation_trigrams (
+                    gram TEXT NOT NULL,
+                    source_key TEXT NOT NULL,
+                    PRIMARY KEY (gram, source_key)
+                ) WITHOUT ROWID
+            """)
+            # Для удаления триграмм вытесненных ключей
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_trigrams_source_key
+                ON translation_trigrams (source_key)
+            """)
+            indexed = cur.execute("SELECT 1 FROM translation_trigrams LIMIT 1").fetchone()
+            if not indexed:
+                keys = [row[0] for row in cur.execute(
+                    "SELECT DISTINCT source_key FROM translations WHERE length(source_key) >= ?",
+                    (self.min_length,))]
+                for key in keys:
+                    self._index_key(cur, key)
+                if keys:
+                    print(f"[DEBUG] Память переводов: проиндексировано {len(keys)} ключей")
+            self.cache.conn.commit()
+
+    def _index_key(self, cur, key):
+        """Добавляет триграммы ключа в индекс"""
+        cur.executemany(
+            "INSERT OR IGNORE INTO translation_trigrams (gram, source_key) VALUES (?, ?)",
+            [(gram, key) for gram in trigrams(key)])
+
+    def add(self, key):
+        """Индексирует новый ключ кэша"""
+        if len(key) < self.min_length:
+            return
+        with self.cache.lock:
+            self._index_key(self.cache.conn.cursor(), key)
+            self.cache.conn.commit()
+
+    def find(self, key, source_lang, target_lang, backend, model="", fallback=False):
+        """Ищет перевод самого похожего кэшированного текста
+
+        Возвращает (translated_text, source_text, similarity) или None.
+        """
+        if self.min_similarity is None or len(key) < self.min_length:
+            return None
+
+        grams = trigrams(key)
+        fixed = fixed_tokens(key)
+        # Dice >= s возможен только при common >= s * |A| / (2 - s)
+        min_common = math.ceil(self.min_similarity * len(grams) / (2 - self.min_similarity))
+        placeholders = ','.join('?' * len(grams))
+
+        with self.cache.lock:
+            cur = self.cache.conn.cursor()
+            candidates = cur.execute(f"""
+                SELECT source_key, COUNT(*) AS common FROM translation_trigrams
+                WHERE gram IN ({placeholders})
+                GROUP BY source_key
+                HAVING common >= ?
+                ORDER BY common DESC
+                LIMIT ?
+            """, (*grams, min_common, self.max_candidates)).fetchall()
+
+            best = None
+            for candidate_key, _ in candidates:
+                similarity = dice_similarity(grams, trigrams(candidate_key))
+                if similarity < self.min_similarity or (best and similarity <= best[2]):
+                    continue
+                # "Загружено 45%" и "Загружено 46%" похожи, но перевод не подходит
+                if fixed_tokens(candidate_key) != fixed or not is_ocr_variant(key, candidate_key):
+                    continue
+                row = self.cache.lookup_key(candidate_key, source_lang, target_lang,
+                                            backend, model, fallback)
+                if row:
+                    best = (row[0], row[1], similarity)
+        return best
+
+    def prune(self, cur, keys):
+        """Удаляет триграммы ключей, для которых в кэше не осталось записей"""
+        cur.executemany("""
+            DELETE FROM translation_trigrams
+            WHERE source_key = ?
+              AND NOT EXISTS (SELECT 1 FROM translations WHERE source_key = ?)
+        """, [(key, key) for key in keys])
+
+    def clear(self):
+        """Очищает индекс триграмм"""
+        with self.cache.lock:
+            self.cache.conn.execute("DELETE FROM translation_trigrams")
+            self.cache.conn.commit()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Сеанс перевода одного окна.
+
+Приложение может переводить несколько окон одновременно. У каждого окна
+свой сеанс: отслеживание окна, адаптивный интервал захвата, overlay и
+последний переведенный кадр. Движки OCR и перевода, конвейер и кэши
+переводов общие для всех сеансов.
+"""
+
+from backend_router import is_error
+from ocr_engine import signature_change
+from overlay_manager import OverlayManager
+from scheduler import AdaptiveScheduler
+from window_tracker import WindowTracker
+
+
+class TranslationSession:
+    """Состояние перевода одного окна
+
+    on_window_event(session, what) получает события окна из потока трекера.
+    """
+
+    def __init__(self, window_id, on_window_event=None):
+        self.window_id = window_id
+        self.title = None
+        self.tracker = WindowTracker(
+            window_id, on_change=lambda tracker, what: on_window_event(self, what))
+        self.overlay_manager = OverlayManager()
+        self.scheduler = AdaptiveScheduler()
+        # Запланированный periodic_update этого окна (id источника GLib)
+        self.update_timer = None
+        # Уменьшенная копия последнего захваченного кадра
+        self.last_signature = None
+        # Блоки последнего переведенного кадра и его уменьшенная копия
+        self._translated_blocks = None
+        self._translated_signature = None
+
+    def start(self):
+        """Начинает отслеживать окно"""
+        self.tracker.start()
+        self.title = self.tracker.title or "Не удалось получить заголовок"
+        return self
+
+    def record_capture(self, signature):
+        """Запоминает захваченный кадр; возвращает его изменение относительно предыдущего"""
+        change = signature_change(signature, self.last_signature)
+        self.last_signature = signature
+        return change
+
+    def cached_blocks(self, signature, threshold=0.01):
+        """Переведенные блоки, если окно не изменилось с их кадра"""
+        if self._translated_blocks is None:
+            return None
+        if signature_change(signature, self._translated_signature) > threshold:
+            return None
+        return self._translated_blocks
+
+    def cache_blocks(self, translated_blocks, signature):
+        """Запоминает переведенный кадр, если все его блоки переведены
+
+        Отложенные (пустые) и ошибочные переводы не кэшируем: иначе они
+        показывались бы, пока окно не изменится, даже после удачного повтора.
+        Возвращает True, если кадр закэширован.
+        """
+        for block in translated_blocks:
+            translated = block.get('translated_text')
+            if not translated or is_error(translated):
+                return False
+        self._translated_blocks = translated_blocks
+        self._translated_signature = signature
+        return True
+
+    def clear_cache(self):
+        """Забывает последний кадр: следующий захват пройдет OCR заново"""
+        self.last_signature = None
+        self._translated_blocks = None
+        self._translated_signature = None
+
+    def close(self):
+        """Прекращает отслеживание и убирает overlay окна"""
+        self.tracker.stop()
+        self.overlay_manager.end_progressive_update()
+        self.overlay_manager.hide_all_overlays()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Фоновая служба распознавания и перевода с API на Unix-сокете.
+
+Скрипты, плагины редакторов и тесты отправляют изображения или id окон
+одному долгоживущему процессу, а не запускают каждый свои tesseract,
+модель и базу кэша. Движки OCR и перевода, кэш и прогретые бэкенды
+общие для всех клиентов.
+
+Протокол - JSON Lines в обе стороны. Запрос:
+
+    {"id": 1, "image": "<PNG/JPEG в base64>"}
+    {"id": 2, "image_path": "/tmp/shot.png", "translator": "Ollama", "partial": true}
+    {"id": 3, "window_id": "0x3a00007", "lang": "eng"}
+    {"id": 4, "op": "stats"}
+
+Запросы одного соединения выполняются параллельно, ответы приходят по
+мере готовности и помечены id запроса: событие "ocr" с распознанными
+блоками, "partial" с частичными переводами (если запрошены), затем
+"result" с переведенными блоками или "error". Если часть блоков осталась
+без перевода (ошибка бэкенда), в "result" есть поле "error".
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from PIL import Image
+
+from backend_router import AUTO_BACKEND, is_error
+from ocr_engine import OCREngine
+from translation_backends import available_backends
+from translation_engine import TranslationEngine
+from window_tracker import query_geometry
+
+DB_PATH = os.path.join(os.path.dirname(__file__), "cache", "overlay_translator_cache.sqlite")
+SOCKET_PATH = os.path.join(os.environ.get('XDG_RUNTIME_DIR') or '/tmp',
+                           f"overlay_translator-{os.getuid()}.sock")
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Одно соединение клиента: читает запросы, пока клиент не закроет запись"""
+
+    def handle(self):
+        write_lock = threading.Lock()
+
+        def send(message):
+            data = (json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8')
+            with write_lock:
+                try:
+                    self.wfile.write(data)
+                    self.wfile.flush()
+                except OSError:
+                    pass  # клиент отключился, результат остался в кэше
+
+        futures = []
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                send({'event': 'error', 'error': f"неверный JSON: {e}"})
+                continue
+            futures.append(self.server.translator_daemon.submit(request, send))
+        # Клиент закончил запросы, но ответы на них еще идут
+        wait(futures)
+
+
+class TranslatorDaemon:
+    """Общие движки OCR и перевода для запросов с Unix-сокета"""
+
+    def __init__(self, socket_path=SOCKET_PATH, db_path=DB_PATH, workers=4,
+                 translator="Google"):
+        self.socket_path = socket_path
+        self.translator = translator
+        self.ocr_engine = OCREngine()
+        self.translation_engine = TranslationEngine(db_path)
+        # Клиент ждет ответа: блоки ждут бюджета запросов, а не откладываются молча
+        self.translation_engine.router.max_admission_wait = None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="daemon")
+        # Захват окна без Composite идет через общий файл
+        self._capture_lock = threading.Lock()
+        self._server = None
+
+    def submit(self, request, send):
+        return self._executor.submit(self.handle_request, request, send)
+
+    def handle_request(self, request, send):
+        """Выполняет запрос, отправляя события через send(message)"""
+        request_id = request.get('id')
+
+        def reply(event, **fields):
+            send({'id': request_id, 'event': event, **fields})
+
+        try:
+            op = request.get('op', 'translate')
+            if op == 'ping':
+                reply('pong')
+                return
+            if op == 'stats':
+                reply('stats', cache=self.translation_engine.get_cache_stats())
+                return
+            if op != 'translate':
+                reply('error', error=f"неизвестная операция: {op}")
+                return
+
+            image, geometry = self._load_image(request)
+            if image is None:
+                reply('error', error="не удалось получить изображение")
+                return
+            blocks = self.ocr_engine.recognize_text_with_positions(
+                lang=request.get('lang', 'rus+eng'), image=image)
+            blocks = self.translation_engine.filter_text_blocks(blocks)
+            reply('ocr', blocks=blocks, geometry=geometry)
+            if not blocks or not request.get('translate', True):
+                reply('result', blocks=[])
+                return
+
+            on_partial = None
+            if request.get('partial'):
+                on_partial = lambda index, text: reply('partial', index=index, text=text)
+            translated_blocks = self.translation_engine.translate_text_blocks(
+                blocks, request.get('translator', self.translator), on_partial)
+            failed = sum(not block.get('translated_text') or is_error(block['translated_text'])
+                         for block in translated_blocks)
+            if failed:
+                reply('result', blocks=translated_blocks, error=f"не переведено блоков: {failed}")
+            else:
+                reply('result', blocks=translated_blocks)
+        except Exception as e:
+            print(f"[Ошибка запроса {request_id}]: {e}")
+            reply('error', error=str(e))
+
+    def _load_image(self, request):
+        """Изображение запроса и геометрия окна (только для window_id)"""
+        if 'image' in request:
+            data = base64.b64decode(request['image'])
+            with Image.open(io.BytesIO(data)) as image:
+                return image.copy(), None
+        if 'image_path' in request:
+            with Image.open(request['image_path']) as image:
+                return image.copy(), None
+        if 'window_id' in request:
+            window_id = str(request['window_id'])
+            with self._capture_lock:
+                image = self.ocr_engine.capture_image(window_id)
+            return image, query_geometry(window_id)
+        raise ValueError("нужно поле image, image_path или window_id")
+
+    def serve_forever(self):
+        """Принимает соединения, пока не будет вызван shutdown()"""
+        if os.path.exists(self.socket_path):
+            # Сокет остался от упавшего процесса или служба уже запущена
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+                raise RuntimeError(f"служба уже слушает {self.socket_path}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.remove(self.socket_path)
+            finally:
+                probe.close()
+
+        self._server = _Server(self.socket_path, _Handler)
+        self._server.translator_daemon = self
+        os.chmod(self.socket_path, 0o600)
+        self.translation_engine.set_auto_translation_active(True)
+        self.translation_engine.warm_up_backend(self.translator, force=True)
+        print(f"[DEBUG] Служба перевода слушает {self.socket_path}")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            os.remove(self.socket_path)
+            self._executor.shutdown(wait=False)
+            self.ocr_engine.close()
+            self.translation_engine.close()
+
+    def shutdown(self):
+        """Останавливает serve_forever (из другого потока или обработчика сигнала)"""
+        if self._server:
+            threading.Thread(target=self._server.shutdown, daemon=True).start()
+
+
+def send_requests(requests, socket_path=SOCKET_PATH):
+    """Клиент: отправляет запросы и возвращает события ответов по мере прихода"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        for request in requests:
+            client.sendall((json.dumps(request, ensure_ascii=False) + '\n').encode('utf-8'))
+        client.shutdown(socket.SHUT_WR)
+        with client.makefile('r', encoding='utf-8') as responses:
+            for line in responses:
+                yield json.loads(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Служба OCR и перевода на Unix-сокете")
+    parser.add_argument('--socket', default=SOCKET_PATH, help="путь к сокету")
+    parser.add_argument('--db', default=DB_PATH, help="файл кэша переводов")
+    parser.add_argument('-t', '--translator', default="Google",
+                        choices=available_backends() + [AUTO_BACKEND],
+                        help="переводчик по умолчанию")
+    parser.add_argument('-j', '--workers', type=int, default=4,
+                        help="запросов, выполняемых одновременно")
+    args = parser.parse_args(argv)
+
+    daemon = TranslatorDaemon(args.socket, args.db, args.workers, args.translator)
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.shutdown())
+    signal.signal(signal.SIGINT, lambda signum, frame: daemon.shutdown())
+    daemon.serve_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
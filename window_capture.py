@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Захват содержимого окна через расширение XComposite.
+
+Окно перенаправляется во внеэкранный буфер (RedirectAutomatic: X-сервер
+по-прежнему сам рисует его на экране), и изображение читается прямо из
+этого буфера. В кадр попадает только само окно: перекрывающие его окна
+и наши overlay в него не входят, даже если окно частично закрыто, а
+снимок всего экрана не нужен.
+
+Нужен пакет python-xlib и X-сервер с расширением Composite; иначе
+capture() возвращает None и используется захват через scrot/import.
+"""
+
+import threading
+
+from PIL import Image
+
+try:
+    from Xlib import X, display as xdisplay
+    from Xlib.ext import composite
+except ImportError:
+    composite = None
+
+
+class CompositeCapture:
+    """Внеэкранный захват одного окна"""
+
+    def __init__(self, window_id):
+        self.window_id = int(str(window_id), 0)
+        self._display = None
+        self._window = None
+        self._lock = threading.Lock()
+        # Расширения нет: повторять попытки бесполезно
+        self._unsupported = composite is None
+
+    def _connect(self):
+        try:
+            display = xdisplay.Display()
+        except Exception:
+            self._unsupported = True
+            raise
+        if not display.has_extension('Composite'):
+            display.close()
+            self._unsupported = True
+            raise RuntimeError("X-сервер не поддерживает Composite")
+        window = display.create_resource_object('window', self.window_id)
+        window.composite_redirect_window(composite.RedirectAutomatic)
+        display.sync()
+        self._display, self._window = display, window
+
+    def capture(self):
+        """Изображение окна (PIL, RGB) или None, если захват невозможен"""
+        if self._unsupported:
+            return None
+        with self._lock:
+            try:
+                if self._display is None:
+                    self._connect()
+                geometry = self._window.get_geometry()
+                if geometry.depth not in (24, 32):
+                    self._unsupported = True
+                    print(f"[DEBUG] Глубина цвета {geometry.depth} не поддерживается Composite-захватом")
+                    return None
+                # Буфер окна меняется при изменении размера, поэтому берем его заново
+                pixmap = self._window.composite_name_window_pixmap()
+                try:
+                    raw = pixmap.get_image(0, 0, geometry.width, geometry.height,
+                                           X.ZPixmap, 0xffffffff)
+                finally:
+                    pixmap.free()
+            except Exception as e:
+                print(f"[Ошибка Composite-захвата]: {e}")
+                self._close()
+                return None
+        size = (geometry.width, geometry.height)
+        print(f"[DEBUG] Окно {self.window_id:#x} захвачено через Composite: {size[0]}x{size[1]}")
+        return Image.frombytes('RGB', size, raw.data, 'raw', 'BGRX')
+
+    def _close(self):
+        if self._display is None:
+            return
+        try:
+            self._window.composite_unredirect_window(composite.RedirectAutomatic)
+            self._display.close()
+        except Exception:
+            pass  # окно или соединение уже закрыты
+        self._display = None
+        self._window = None
+
+    def close(self):
+        """Возвращает окну обычный вывод и закрывает соединение"""
+        with self._lock:
+            self._close()
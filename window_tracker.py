@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Отслеживание целевого окна по событиям X11.
+
+Трекер держит одно соединение с X-сервером, подписывается на события
+окна (уничтожение, перемещение и изменение размера, свойства, показ и
+скрытие, перекрытие) и хранит актуальные геометрию, заголовок и
+состояние окна. Проверка на каждом тике - чтение полей, без запуска
+xprop и xdotool. Свернутое, скрытое или полностью перекрытое окно
+не видно пользователю: is_visible() для него ложно.
+
+Нужен пакет python-xlib. Без него (или без DISPLAY) трекер опрашивает
+окно через xdotool и xprop при вызове refresh().
+"""
+
+import re
+import select
+import subprocess
+import threading
+
+try:
+    from Xlib import X, Xatom, display as xdisplay, error as xerror
+except ImportError:
+    X = None
+
+
+def query_geometry(window_id):
+    """Геометрия окна через xdotool: (x, y, w, h) или None, если окна нет"""
+    try:
+        result = subprocess.run(["xdotool", "getwindowgeometry", "--shell", str(window_id)],
+                                capture_output=True, text=True, check=True, timeout=2)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+        print(f"[Ошибка геометрии]: {e}")
+        return None
+    values = dict(re.findall(r'^(\w+)=(-?\d+)$', result.stdout, re.M))
+    try:
+        return (int(values['X']), int(values['Y']),
+                int(values['WIDTH']), int(values['HEIGHT']))
+    except KeyError:
+        return None
+
+
+def query_hidden(window_id):
+    """Свернуто ли окно (_NET_WM_STATE_HIDDEN) по данным xprop"""
+    try:
+        output = subprocess.check_output(["xprop", "-id", str(window_id), "_NET_WM_STATE"],
+                                         text=True, timeout=2)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError):
+        return False
+    return '_NET_WM_STATE_HIDDEN' in output
+
+
+def query_title(window_id):
+    """Заголовок окна через xprop; None, если окна нет"""
+    try:
+        output = subprocess.check_output(["xprop", "-id", str(window_id), "WM_NAME"],
+                                         text=True, timeout=2)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError):
+        return None
+    if '=' not in output:
+        return ""
+    return output.split('=', 1)[1].strip().strip('"')
+
+
+class WindowTracker:
+    """Живое состояние одного окна X11
+
+    on_change(tracker, what) вызывается из потока трекера, what - одно из
+    'geometry', 'title', 'visibility', 'destroyed'.
+    """
+
+    def __init__(self, window_id, on_change=None):
+        self.window_id = int(str(window_id), 0)
+        self.on_change = on_change
+        self.geometry = None
+        self.title = None
+        self.alive = True
+        self.mapped = True
+        # Свернуто (_NET_WM_STATE_HIDDEN) и полностью перекрыто другими окнами
+        self.hidden = False
+        self.obscured = False
+        self.uses_events = False
+        self._display = None
+        self._window = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Подключается к X-серверу; без python-xlib переходит на опрос"""
+        if X is not None:
+            try:
+                self._connect()
+                self.uses_events = True
+            except Exception as e:
+                print(f"[Ошибка подключения к X11]: {e}, используем xdotool")
+                self._display = None
+        if self.uses_events:
+            self._thread = threading.Thread(target=self._event_loop,
+                                            name="window-tracker", daemon=True)
+            self._thread.start()
+        else:
+            self.refresh()
+        print(f"[DEBUG] Отслеживаем окно {self.window_id:#x}: {self.geometry}, "
+              f"{'события X11' if self.uses_events else 'опрос xdotool'}")
+        return self
+
+    def _connect(self):
+        self._display = xdisplay.Display()
+        self._window = self._display.create_resource_object('window', self.window_id)
+        self._net_wm_name = self._display.intern_atom('_NET_WM_NAME')
+        self._utf8_string = self._display.intern_atom('UTF8_STRING')
+        self._net_wm_state = self._display.intern_atom('_NET_WM_STATE')
+        self._net_wm_state_hidden = self._display.intern_atom('_NET_WM_STATE_HIDDEN')
+        self._window.change_attributes(
+            event_mask=X.StructureNotifyMask | X.PropertyChangeMask | X.VisibilityChangeMask)
+        attributes = self._window.get_attributes()
+        self.mapped = attributes.map_state != X.IsUnmapped
+        self._update_geometry()
+        self._update_title()
+        self._update_state()
+        self._display.flush()
+
+    def refresh(self):
+        """Обновляет состояние опросом; с событиями X11 ничего не делает"""
+        if self.uses_events or not self.alive:
+            return
+        geometry = query_geometry(self.window_id)
+        if geometry is None:
+            self._set_destroyed()
+            return
+        if geometry != self.geometry:
+            self.geometry = geometry
+            self._notify('geometry')
+        if self.title is None:
+            self.title = query_title(self.window_id)
+        self._set_visibility(hidden=query_hidden(self.window_id))
+
+    def is_visible(self):
+        """Видно ли окно: существует, показано, не свернуто и не перекрыто целиком"""
+        return self.alive and self.mapped and not self.hidden and not self.obscured
+
+    def _event_loop(self):
+        """Поток трекера: разбирает события окна до stop() или уничтожения окна"""
+        try:
+            while not self._stopped.is_set() and self.alive:
+                readable, _, _ = select.select([self._display], [], [], 0.5)
+                while readable and self._display.pending_events():
+                    self._handle(self._display.next_event())
+        except xerror.ConnectionClosedError:
+            pass
+        except Exception as e:
+            print(f"[Ошибка отслеживания окна]: {e}")
+        finally:
+            self._display.close()
+
+    def _handle(self, event):
+        if getattr(event, 'window', None) != self._window:
+            return
+        if event.type == X.DestroyNotify:
+            self._set_destroyed()
+        elif event.type in (X.ConfigureNotify, X.ReparentNotify):
+            self._update_geometry()
+        elif event.type == X.MapNotify:
+            self._set_visibility(mapped=True)
+        elif event.type == X.UnmapNotify:
+            self._set_visibility(mapped=False)
+        elif event.type == X.VisibilityNotify:
+            self._set_visibility(obscured=event.state == X.VisibilityFullyObscured)
+        elif event.type == X.PropertyNotify:
+            if event.atom in (Xatom.WM_NAME, self._net_wm_name):
+                self._update_title()
+            elif event.atom == self._net_wm_state:
+                self._update_state()
+
+    def _update_geometry(self):
+        """Абсолютная геометрия окна (менеджер окон помещает его в свою рамку)"""
+        try:
+            size = self._window.get_geometry()
+            origin = size.root.translate_coords(self._window, 0, 0)
+        except (xerror.BadWindow, xerror.BadDrawable):
+            self._set_destroyed()
+            return
+        geometry = (origin.x, origin.y, size.width, size.height)
+        if geometry != self.geometry:
+            self.geometry = geometry
+            self._notify('geometry')
+
+    def _update_state(self):
+        """Свернуто ли окно по _NET_WM_STATE"""
+        try:
+            state = self._window.get_full_property(self._net_wm_state, Xatom.ATOM)
+        except xerror.BadWindow:
+            self._set_destroyed()
+            return
+        atoms = state.value if state is not None else ()
+        self._set_visibility(hidden=self._net_wm_state_hidden in atoms)
+
+    def _set_visibility(self, mapped=None, hidden=None, obscured=None):
+        """Меняет состояние видимости и сообщает, если окно скрылось или появилось"""
+        was_visible = self.is_visible()
+        if mapped is not None:
+            self.mapped = mapped
+        if hidden is not None:
+            self.hidden = hidden
+        if obscured is not None:
+            self.obscured = obscured
+        if self.is_visible() != was_visible:
+            print(f"[DEBUG] Окно {self.window_id:#x} {'видно' if not was_visible else 'скрыто'}")
+            self._notify('visibility')
+
+    def _update_title(self):
+        try:
+            name = self._window.get_full_property(self._net_wm_name, self._utf8_string)
+            if name is not None:
+                title = name.value.decode('utf-8', 'replace')
+            else:
+                title = self._window.get_wm_name() or ""
+        except xerror.BadWindow:
+            self._set_destroyed()
+            return
+        if isinstance(title, bytes):
+            title = title.decode('latin-1')
+        if title != self.title:
+            self.title = title
+            self._notify('title')
+
+    def _set_destroyed(self):
+        if not self.alive:
+            return
+        self.alive = False
+        self.mapped = False
+        print(f"[DEBUG] Окно {self.window_id:#x} закрыто")
+        self._notify('destroyed')
+
+    def _notify(self, what):
+        if self.on_change:
+            try:
+                self.on_change(self, what)
+            except Exception as e:
+                print(f"[Ошибка обработчика окна]: {e}")
+
+    def stop(self):
+        """Отключается от X-сервера"""
+        self._stopped.set()
+        self.on_change = None